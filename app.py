@@ -1,16 +1,28 @@
 """Flask application entry point"""
-from flask import Flask
-from flask_cors import CORS
-from .routes import transaction_routes, marketplace_routes
 import os
-from dotenv import load_dotenv
 
-# Load environment variables
-load_dotenv()
+# Load environment variables from .env in local development; deployments
+# (Vercel sets VERCEL) provide them directly, so skip the file search.
+# Loaded before the imports below, as modules read settings when imported.
+if not os.getenv('VERCEL'):
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from flask import Flask
+from flask_cors import CORS
+from .routes import transaction_routes, marketplace_routes, health_routes, export_routes
+from .json_provider import ORJSONProvider
+from .async_runtime import init_async
+from .middleware.compression import init_compression
+from .middleware.profiling import init_profiling
+from .middleware.metrics import init_metrics
+from .cli import listings_cli, stats_cli, history_cli, db_cli, export_cli, images_cli, ledger_cli
 
 def create_app(config_name=None):
     """Create and configure the Flask application."""
     app = Flask(__name__)
+    app.json = ORJSONProvider(app)
+    init_async(app)
     CORS(app)
 
     # Get MongoDB URI and database name
@@ -31,16 +43,40 @@ def create_app(config_name=None):
             'XRPL_NODE_URL': os.getenv('XRPL_NODE_URL')
         })
 
+    # Response compression for large JSON bodies
+    app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+    init_compression(app)
+
+    # Server-Timing breakdown and slow request logging
+    slow_request_ms = os.getenv('PROFILE_SLOW_REQUEST_MS')
+    app.config['PROFILE_SLOW_REQUEST_MS'] = float(slow_request_ms) if slow_request_ms else None
+    init_profiling(app)
+
+    # Prometheus metrics on /metrics
+    init_metrics(app)
+
     # Register blueprints
     app.register_blueprint(transaction_routes.bp)
     app.register_blueprint(marketplace_routes.bp)
+    app.register_blueprint(health_routes.bp)
+    app.register_blueprint(export_routes.bp)
+
+    # Register CLI commands
+    app.cli.add_command(listings_cli)
+    app.cli.add_command(stats_cli)
+    app.cli.add_command(history_cli)
+    app.cli.add_command(db_cli)
+    app.cli.add_command(export_cli)
+    app.cli.add_command(images_cli)
+    app.cli.add_command(ledger_cli)
 
     return app
 
 if __name__ == '__main__':
+    # Development server only; production runs gunicorn -c gunicorn.conf.py
     app = create_app()
     app.run(
         host=os.getenv('HOST', '0.0.0.0'),
         port=int(os.getenv('PORT', 5000)),
-        debug=True
+        debug=os.getenv('FLASK_DEBUG', '1') == '1'
     ) 
\ No newline at end of file
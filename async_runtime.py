@@ -0,0 +1,84 @@
+"""Shared event loop for async views"""
+from typing import Any, Awaitable, Callable, Coroutine, Optional
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from flask import Flask
+
+
+class EventLoopThread:
+    """A single asyncio event loop running in a daemon thread.
+
+    Flask runs each async view in a new event loop by default, so async
+    database and XRPL clients could not be reused across requests. Running
+    every async view on one long-lived loop lets the async clients keep
+    their connection pools.
+
+    This does not raise the number of requests a worker serves at once:
+    under WSGI the worker thread running a view waits for its result, so a
+    gthread worker still holds at most ``threads`` requests in flight
+    (see benchmarks/bench_async.py).
+
+    The loop is started lazily so it is created after a pre-fork server
+    forks its workers.
+    """
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    self._loop = asyncio.new_event_loop()
+                    self._pid = os.getpid()
+                    threading.Thread(
+                        target=self._loop.run_forever,
+                        name="async-views",
+                        daemon=True
+                    ).start()
+        return self._loop
+
+    def run(self, coro: Awaitable[Any], timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and wait for its result.
+
+        The caller's context variables (Flask's request context, the request
+        profile) are copied into the task so they remain available.
+        """
+        loop = self.loop
+        context = contextvars.copy_context()
+        future = asyncio.run_coroutine_threadsafe(_in_context(context, coro), loop)
+        return future.result(timeout)
+
+    def async_to_sync(self, func: Callable[..., Coroutine[Any, Any, Any]]) -> Callable[..., Any]:
+        """Flask hook converting an async view into a sync callable."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.run(func(*args, **kwargs))
+        return wrapper
+
+    def stop(self) -> None:
+        """Stop the loop, e.g. on worker shutdown."""
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                self._loop.call_soon_threadsafe(self._loop.stop)
+            self._loop = None
+
+
+async def _in_context(context: contextvars.Context, coro: Awaitable[Any]) -> Any:
+    # Tasks copy the context current at creation, so create it inside ours
+    task = context.run(asyncio.ensure_future, coro)
+    return await task
+
+
+event_loop = EventLoopThread()
+
+
+def init_async(app: Flask) -> None:
+    """Run the application's async views on the shared event loop."""
+    app.async_to_sync = event_loop.async_to_sync
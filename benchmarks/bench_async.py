@@ -0,0 +1,139 @@
+"""Benchmark concurrent HTTP requests to one gunicorn worker against a slow fake node.
+
+Starts a fake rippled with a fixed response latency and a single gthread
+worker, then sends --requests requests, --concurrency at a time, to:
+
+* /api/marketplace/list/template, an async view awaiting the ownership
+  check on the shared event loop
+* the same view written as a sync view calling verify_nft_ownership(), as
+  the route was before it became async
+
+Each request makes one call to the node, so a worker serving K requests at
+once completes about K / latency requests per second; the report shows the
+K each route reached. Under WSGI a worker thread waits for the view it
+runs, async or not, so both are bounded by --threads: async views reuse
+pooled connections and can overlap the awaits of one request, but do not
+let a worker hold more requests in flight.
+
+Usage:
+    python -m backend.benchmarks.bench_async [--requests 100] [--concurrency 32] \\
+        [--latency-ms 200] [--threads 4]
+"""
+import argparse
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict
+
+from backend.benchmarks.fake_rippled import FakeLedger, FakeRippled
+from backend.benchmarks.load_test import Driver, percentile
+
+ACCOUNT = "rPEPPER7kfTD9w2To4CQk6UCfuHM9c6GDY"
+NFT_ID = "000800006203F49C21D5D6E022CB16DE3538F248662FC73C29ABA6A90000001A"
+
+ROUTES = {
+    "async view": "/api/marketplace/list/template",
+    "sync view": "/bench/sync/list/template",
+}
+
+
+def create_bench_app():
+    """The application plus a sync copy of the list template route."""
+    from flask import jsonify, request
+    from backend.app import create_app
+    from backend.services.xrpl_service import create_nft_sell_offer_template, verify_nft_ownership
+
+    app = create_app()
+
+    @app.route(ROUTES["sync view"], methods=["POST"])
+    def sync_list_template():
+        data = request.get_json()
+        if not verify_nft_ownership(data["seller_address"], data["nft_id"]):
+            return jsonify({"error": "Seller does not own this NFT"}), 403
+        amount_drops = int(float(data["price_xrp"]) * 1_000_000)
+        return jsonify({"offer_template": create_nft_sell_offer_template(
+            account=data["seller_address"], nft_id=data["nft_id"], amount=str(amount_drops)
+        )}), 200
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_worker(port: int, threads: int, rippled_url: str) -> subprocess.Popen:
+    """Serve the bench app from one gthread worker and wait until it answers."""
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    env = dict(os.environ, XRPL_NODE_URL=rippled_url, CHANGE_STREAMS="0", PYTHONPATH=root)
+    worker = subprocess.Popen([
+        sys.executable, "-m", "gunicorn",
+        "--workers", "1", "--worker-class", "gthread", "--threads", str(threads),
+        "--bind", f"127.0.0.1:{port}", "--log-level", "warning",
+        "backend.benchmarks.bench_async:create_bench_app()"
+    ], cwd=root, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health/live", timeout=1)
+            return worker
+        except OSError:
+            time.sleep(0.1)
+    worker.terminate()
+    raise RuntimeError("The benchmark worker did not start")
+
+
+def drive(driver: Driver, path: str, requests: int, concurrency: int, latency_ms: float) -> Dict[str, Any]:
+    body = {"nft_id": NFT_ID, "seller_address": ACCOUNT, "price_xrp": 10}
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: driver.send(("POST", path, body)), range(requests)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in results)
+    return {
+        "errors": sum(1 for _, status in results if status != 200),
+        "throughput_rps": requests / elapsed,
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        # Requests the worker had in flight on average
+        "in_flight": requests / elapsed * latency_ms / 1000,
+    }
+
+
+def run(requests: int, concurrency: int, latency_ms: float, threads: int):
+    ledger = FakeLedger()
+    ledger.give(ACCOUNT, [NFT_ID])
+
+    with FakeRippled(ledger, latency_ms=latency_ms) as rippled:
+        port = free_port()
+        worker = start_worker(port, threads, rippled.url)
+        try:
+            driver = Driver(f"http://127.0.0.1:{port}")
+            print(f"{requests} requests, {concurrency} concurrent, 1 worker with {threads} threads, "
+                  f"node latency {latency_ms:.0f} ms")
+            for label, path in ROUTES.items():
+                # Warm up connections and the event loop
+                drive(driver, path, threads, threads, latency_ms)
+                report = drive(driver, path, requests, concurrency, latency_ms)
+                print(f"  {label:10s}: {report['throughput_rps']:7.1f} req/s  p50 {report['p50']:8.1f} ms  "
+                      f"p95 {report['p95']:8.1f} ms  in flight {report['in_flight']:5.1f}  "
+                      f"errors {report['errors']}")
+        finally:
+            worker.terminate()
+            worker.wait(30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+    run(args.requests, args.concurrency, args.latency_ms, args.threads)
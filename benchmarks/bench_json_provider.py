@@ -0,0 +1,74 @@
+"""Benchmark JSON serialization of large listing payloads.
+
+Compares the previous path (stringify ``_id`` on every document, then
+encode with Flask's stdlib provider) against the orjson provider.
+
+Usage:
+    python -m backend.benchmarks.bench_json_provider [--listings 10000]
+"""
+import argparse
+from datetime import datetime, timedelta
+import timeit
+import uuid
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from backend.json_provider import ORJSONProvider
+
+
+def make_listings(count: int):
+    """Build listing documents shaped like get_active_listings() results."""
+    now = datetime.utcnow()
+    listings = []
+    for i in range(count):
+        listings.append({
+            "_id": ObjectId(),
+            "listing_id": str(uuid.uuid4()),
+            "nft_id": f"{i:064X}",
+            "seller_address": "rPEPPER7kfTD9w2To4CQk6UCfuHM9c6GDY",
+            "price_drops": 1_000_000 + i,
+            "metadata_hash": f"{i:016x}",
+            "status": "active",
+            "created_at": now - timedelta(minutes=i),
+            "updated_at": now,
+            "metadata": {
+                "title": f"Property #{i}",
+                "asset_type": "Real Estate",
+                "description": "Three bedroom apartment with a view " * 4,
+                "location": "Paris, France",
+                "documentation_id": f"DOC-{i}",
+            },
+        })
+    return listings
+
+
+def run(count: int, repeat: int):
+    app = Flask(__name__)
+    stdlib = DefaultJSONProvider(app)
+    fast = ORJSONProvider(app)
+    listings = make_listings(count)
+
+    def before():
+        docs = [dict(listing, _id=str(listing["_id"])) for listing in listings]
+        stdlib.dumps({"listings": docs, "count": len(docs)})
+
+    def after():
+        fast.dumps_bytes({"listings": listings, "count": len(listings)})
+
+    before_s = min(timeit.repeat(before, number=1, repeat=repeat))
+    after_s = min(timeit.repeat(after, number=1, repeat=repeat))
+
+    print(f"listings: {count}, best of {repeat}")
+    print(f"  stdlib + _id loop : {before_s * 1000:8.2f} ms")
+    print(f"  orjson provider   : {after_s * 1000:8.2f} ms")
+    print(f"  speedup           : {before_s / after_s:8.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--listings", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    run(args.listings, args.repeat)
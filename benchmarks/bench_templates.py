@@ -0,0 +1,99 @@
+"""Microbenchmarks for metadata hashing, validation and transaction templates.
+
+All run on every mint and buy request. Template generation is measured
+through the xrpl-py models and through the fast builders used once inputs
+are validated.
+
+Usage:
+    pytest benchmarks/bench_templates.py --benchmark-group-by=group
+"""
+import pytest
+
+pytest.importorskip("pytest_benchmark")
+
+from backend.services.mongodb_service import (
+    compute_metadata_hash,
+    encode_metadata_document,
+    verify_metadata,
+    verify_metadata_document
+)
+from backend.services.metadata_schema_service import validate_metadata
+from backend.services.xrpl_service import (
+    generate_nft_mint_template,
+    create_payment_template,
+    create_nft_offer_template
+)
+
+SELLER = "rPEPPER7kfTD9w2To4CQk6UCfuHM9c6GDY"
+BUYER = "rN7n7otQDd6FczFgLdSqtcsAUxDkw6fzRH"
+NFT_ID = "000800006203F49C21D5D6E022CB16DE3538F248662FC73C29ABA6A90000001A"
+URI = "RWA-XRPL_REAL_WORLD-Real Estate-0123456789abcdef"
+
+
+def make_metadata(description_words: int, documents: int):
+    """Metadata shaped like the mint form output."""
+    return {
+        "title": "Three bedroom apartment",
+        "asset_type": "Real Estate",
+        "location": "Paris, France",
+        "description": " ".join(["spacious renovated apartment with a view"] * (description_words // 6)),
+        "documentation_id": "DOC-2025-0001",
+        "image_id": "5f0c6a52-8f3c-4f43-a8b4-3f2d0b6c1a7e",
+        "documents": [
+            {"name": f"deed-{i}.pdf", "sha256": f"{i:064x}", "pages": i % 40}
+            for i in range(documents)
+        ],
+    }
+
+
+# Roughly 0.5 KB, 5 KB and 60 KB once serialized
+METADATA_SIZES = {
+    "small": make_metadata(30, 0),
+    "medium": make_metadata(300, 20),
+    "large": make_metadata(3000, 300),
+}
+
+
+@pytest.mark.benchmark(group="metadata_hash")
+@pytest.mark.parametrize("size", list(METADATA_SIZES))
+def test_compute_metadata_hash(benchmark, size):
+    benchmark(compute_metadata_hash, METADATA_SIZES[size])
+
+
+@pytest.mark.benchmark(group="metadata_verify")
+@pytest.mark.parametrize("size", list(METADATA_SIZES))
+@pytest.mark.parametrize("stored", ["decoded", "canonical"])
+def test_verify_metadata(benchmark, size, stored):
+    metadata = METADATA_SIZES[size]
+    document = encode_metadata_document(metadata)
+    if stored == "decoded":
+        benchmark(verify_metadata, document["metadata_hash"], metadata)
+    else:
+        benchmark(verify_metadata_document, document)
+
+
+@pytest.mark.benchmark(group="metadata_validate")
+@pytest.mark.parametrize("size", list(METADATA_SIZES))
+def test_validate_metadata(benchmark, size):
+    benchmark(validate_metadata, METADATA_SIZES[size])
+
+
+@pytest.mark.benchmark(group="mint_template")
+@pytest.mark.parametrize("validated", [False, True], ids=["model", "fast"])
+def test_mint_template(benchmark, validated):
+    benchmark(
+        generate_nft_mint_template, SELLER, URI,
+        flags=8, transfer_fee=5000, taxon=0, validated=validated
+    )
+
+
+@pytest.mark.benchmark(group="payment_template")
+@pytest.mark.parametrize("validated", [False, True], ids=["model", "fast"])
+def test_payment_template(benchmark, validated):
+    benchmark(create_payment_template, BUYER, SELLER, 25_000_000, validated=validated)
+
+
+@pytest.mark.benchmark(group="offer_template")
+@pytest.mark.parametrize("validated", [False, True], ids=["model", "fast"])
+def test_offer_template(benchmark, validated):
+    benchmark(create_nft_offer_template, SELLER, BUYER, NFT_ID, validated=validated)
@@ -0,0 +1,170 @@
+"""Local stand-in for a rippled JSON-RPC node with configurable latency.
+
+Answers the requests the backend makes (``account_nfts``, ``tx`` and
+``server_info``) from an in-memory ledger so load tests do not depend on
+testnet availability or speed.
+
+Usage:
+    python -m backend.benchmarks.fake_rippled [--port 51234] [--latency-ms 20]
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, List, Optional
+
+
+class FakeLedger:
+    """NFT ownership and transactions known to the fake node."""
+
+    def __init__(self):
+        self._owned: Dict[str, List[str]] = {}
+        self._transactions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def give(self, account: str, nft_ids: Iterable[str]) -> None:
+        """Add NFTs to an account."""
+        with self._lock:
+            self._owned.setdefault(account, []).extend(nft_ids)
+
+    def add_transaction(self, transaction_hash: str, transaction: Dict[str, Any]) -> None:
+        """Register a validated transaction returned by ``tx``."""
+        with self._lock:
+            self._transactions[transaction_hash] = transaction
+
+    def account_nfts(self, account: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            nft_ids = list(self._owned.get(account, ()))
+        return [
+            {"NFTokenID": nft_id, "Flags": 8, "NFTokenTaxon": 0, "TransferFee": 0, "nft_serial": serial}
+            for serial, nft_id in enumerate(nft_ids)
+        ]
+
+    def tx(self, transaction_hash: str) -> Dict[str, Any]:
+        with self._lock:
+            transaction = self._transactions.get(transaction_hash)
+        if transaction is not None:
+            return transaction
+        # Unknown hashes are treated as successful sell offers
+        return {
+            "TransactionType": "NFTokenCreateOffer",
+            "NFTokenOfferID": hashlib.sha256(transaction_hash.encode()).hexdigest().upper(),
+            "meta": {"TransactionResult": "tesSUCCESS"},
+        }
+
+
+class _Server(ThreadingHTTPServer):
+    # Accept bursts of concurrent connections from async clients
+    request_queue_size = 1024
+
+
+class FakeRippled:
+    """Threaded HTTP server speaking enough of the rippled JSON-RPC API.
+
+    Args:
+        ledger: Ledger state to answer from
+        host: Interface to bind
+        port: Port to bind, 0 for any free port
+        latency_ms: Delay added to every response
+        jitter_ms: Maximum random delay added on top of latency_ms
+    """
+
+    def __init__(
+        self,
+        ledger: Optional[FakeLedger] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 0.0,
+        jitter_ms: float = 0.0
+    ):
+        self.ledger = ledger or FakeLedger()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.requests = 0
+        self._count_lock = threading.Lock()
+        self._server = _Server((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def _handler(self):
+        rippled = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                payload = json.dumps({"result": rippled.answer(json.loads(body))}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def answer(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """Build the result for a JSON-RPC request."""
+        with self._count_lock:
+            self.requests += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if delay:
+            time.sleep(delay / 1000)
+
+        method = request.get("method")
+        params = (request.get("params") or [{}])[0]
+        if method == "account_nfts":
+            result = {
+                "account": params.get("account"),
+                "account_nfts": self.ledger.account_nfts(params.get("account")),
+                "validated": True,
+            }
+        elif method == "tx":
+            result = {**self.ledger.tx(params.get("transaction")), "hash": params.get("transaction"), "validated": True}
+        elif method == "server_info":
+            result = {"info": {"server_state": "full", "build_version": "fake"}}
+        else:
+            return {"status": "error", "error": "unknownCmd", "request": request}
+        result["status"] = "success"
+        return result
+
+    def start(self) -> "FakeRippled":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeRippled":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=51234)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    args = parser.parse_args()
+    server = FakeRippled(host=args.host, port=args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms)
+    print(f"fake rippled listening on {server.url}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
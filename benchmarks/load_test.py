@@ -0,0 +1,392 @@
+"""End-to-end load benchmark of every transaction and marketplace route.
+
+Seeds a local mongod, starts a fake rippled with configurable latency,
+serves the app on a local port and drives each route in turn at the
+target concurrency. Latency percentiles, throughput and MongoDB command
+counts per route are written to a JSON file that can be diffed between
+commits. The unimplemented /buy/submit route is not driven.
+
+Usage:
+    MONGODB_URI=mongodb://localhost:27017/ \\
+    python -m backend.benchmarks.load_test --concurrency 16 --requests 500 \\
+        --rippled-latency-ms 20 --output bench.json
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+from urllib.parse import urlsplit
+
+from bson import ObjectId
+from pymongo import monitoring
+
+from backend.benchmarks.fake_rippled import FakeLedger, FakeRippled
+from backend.benchmarks.seed import Dataset, SeedConfig, make_image, seed
+
+# (method, path, body) for one request, or None when a route's data is used up;
+# the body is sent as JSON, or raw when given as (content type, bytes)
+RequestSpec = Optional[Tuple[str, str, Optional[Union[Dict[str, Any], Tuple[str, bytes]]]]]
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count MongoDB commands issued by the in-process app, by command name."""
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        with self._lock:
+            self.counts[event.command_name] += 1
+
+    def succeeded(self, event) -> None:
+        pass
+
+    def failed(self, event) -> None:
+        pass
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.counts)
+
+
+@dataclass
+class Scenario:
+    name: str
+    build: Callable[[int], RequestSpec]
+
+
+def percentile(ordered: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not ordered:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def pooled(items: List[Any]) -> Callable[[int], Any]:
+    """Hand out each item once, for routes that consume their data."""
+    return lambda i: items[i] if i < len(items) else None
+
+
+def build_scenarios(dataset: Dataset) -> List[Scenario]:
+    """One scenario per route, with data drawn from the seeded dataset."""
+    from backend.services.mongodb_service import encode_change_token
+
+    half = len(dataset.listings) // 2
+    browse = dataset.listings[:half] or dataset.listings
+    to_validate = pooled(dataset.listings[half::2])
+    to_cancel = pooled(dataset.listings[half + 1::2])
+    to_list = pooled(dataset.unlisted)
+    accounts = dataset.accounts
+    buyer = dataset.buyers[0]
+    metadata = {
+        "title": "Benchmark Loft",
+        "asset_type": "Real Estate",
+        "location": "Paris, France",
+        "description": "Benchmark listing",
+    }
+    # Incremental syncs from before the run see the writes of the scenarios
+    # that modify listings and NFTs, which run ahead of them
+    since = encode_change_token(datetime.utcnow(), ObjectId())
+
+    def pick(items, i):
+        return items[i % len(items)]
+
+    def validate(i):
+        listing = to_validate(i)
+        return listing and ("POST", f"/api/marketplace/listing/{listing['listing_id']}/validate-purchase", {
+            "buyer_address": buyer, "transaction_hash": uuid.uuid4().hex.upper()
+        })
+
+    def cancel(i):
+        listing = to_cancel(i)
+        return listing and ("POST", f"/api/marketplace/listing/{listing['listing_id']}/cancel", {
+            "seller_address": listing["seller_address"]
+        })
+
+    def create(i):
+        nft = to_list(i)
+        return nft and ("POST", "/api/marketplace/list", {
+            "nft_id": nft["nft_id"],
+            "seller_address": nft["seller_address"],
+            "price_xrp": 25,
+            "metadata_hash": nft["metadata_hash"]
+        })
+
+    return [
+        # transaction_routes
+        Scenario("mint_template", lambda i: ("POST", "/api/transaction/nft/mint/template", {
+            "account": pick(accounts, i), "metadata": {**metadata, "documentation_id": f"BENCH-{i}"}
+        })),
+        Scenario("metadata_by_hash", lambda i: (
+            "GET", f"/api/transaction/metadata/hash/{pick(dataset.metadata_hashes, i)}", None
+        )),
+        Scenario("metadata_by_id", lambda i: (
+            "GET", f"/api/transaction/metadata/id/{pick(dataset.metadata_ids, i)}", None
+        )),
+        Scenario("submit_mint", lambda i: ("POST", "/api/transaction/submit", {
+            "response": {"txid": uuid.uuid4().hex.upper(), "account": pick(accounts, i)},
+            "uri": "RWA-XRPL_REAL_WORLD-Real Estate-benchmark",
+            "metadata": {**metadata, "documentation_id": f"BENCH-SUBMIT-{i}"}
+        })),
+        Scenario("account_nfts", lambda i: ("GET", f"/api/transaction/nfts/{pick(accounts, i)}", None)),
+        Scenario("account_nfts_sparse", lambda i: (
+            "GET", f"/api/transaction/nfts/{pick(accounts, i)}?fields=nft_id,status", None
+        )),
+        Scenario("image_upload", lambda i: (
+            "POST", "/api/transaction/image/upload", ("image/png", make_image(random.Random(i), 256))
+        )),
+        Scenario("image", lambda i: dataset.upload_ids and (
+            "GET", f"/api/transaction/image/{pick(dataset.upload_ids, i)}", None
+        )),
+        Scenario("image_small", lambda i: dataset.upload_ids and (
+            "GET", f"/api/transaction/image/{pick(dataset.upload_ids, i)}?size=small", None
+        )),
+        Scenario("image_legacy", lambda i: dataset.image_ids and (
+            "GET", f"/api/transaction/image/{pick(dataset.image_ids, i)}", None
+        )),
+        # marketplace_routes
+        Scenario("listings", lambda i: ("GET", "/api/marketplace/listings", None)),
+        Scenario("listings_filtered", lambda i: (
+            "GET", "/api/marketplace/listings?asset_type=Art&sort=price&fields=listing_id,price_drops,summary", None
+        )),
+        Scenario("search", lambda i: ("GET", "/api/marketplace/search?q=waterfront+garden", None)),
+        Scenario("stats", lambda i: ("GET", "/api/marketplace/stats", None)),
+        Scenario("ohlc", lambda i: ("GET", "/api/marketplace/history/ohlc?interval=1h", None)),
+        Scenario("listing", lambda i: ("GET", f"/api/marketplace/listing/{pick(browse, i)['listing_id']}", None)),
+        Scenario("prepare_buy", lambda i: (
+            "GET", f"/api/marketplace/listing/{pick(browse, i)['listing_id']}/prepare-buy", None
+        )),
+        Scenario("buy_template", lambda i: (
+            "POST", f"/api/marketplace/buy/template/{pick(browse, i)['listing_id']}", {"buyer_address": buyer}
+        )),
+        Scenario("list_template", lambda i: ("POST", "/api/marketplace/list/template", {
+            "nft_id": pick(browse, i)["nft_id"], "seller_address": pick(browse, i)["seller_address"], "price_xrp": 10
+        })),
+        Scenario("list_submit", lambda i: ("POST", "/api/marketplace/list/submit", {
+            "response": {"txid": uuid.uuid4().hex.upper(), "account": pick(browse, i)["seller_address"]},
+            "nft_id": pick(browse, i)["nft_id"],
+            "amount": 10_000_000
+        })),
+        Scenario("create_listing", create),
+        Scenario("validate_purchase", validate),
+        Scenario("cancel_listing", cancel),
+        # sync endpoints, after the scenarios whose writes they return
+        Scenario("listing_changes", lambda i: ("GET", "/api/marketplace/listings/changes", None)),
+        Scenario("listing_changes_since", lambda i: (
+            "GET", f"/api/marketplace/listings/changes?since={since}", None
+        )),
+        Scenario("account_nft_changes", lambda i: (
+            "GET", f"/api/transaction/nfts/{pick(accounts, i)}/changes", None
+        )),
+        Scenario("account_nft_changes_since", lambda i: (
+            "GET", f"/api/transaction/nfts/{pick(accounts, i)}/changes?since={since}", None
+        )),
+    ]
+
+
+class Driver:
+    """Issue requests over keep-alive connections, one per worker thread."""
+
+    def __init__(self, base_url: str):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if getattr(self._local, "connection", None) is None:
+            self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        return self._local.connection
+
+    def send(self, spec: RequestSpec) -> Tuple[float, int]:
+        method, path, body = spec
+        headers = {"Accept-Encoding": "gzip"}
+        payload = None
+        if isinstance(body, tuple):
+            headers["Content-Type"], payload = body
+        elif body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+
+        start = time.perf_counter()
+        try:
+            connection = self._connection()
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            self._local.connection = None
+            status = 0
+        return (time.perf_counter() - start) * 1000, status
+
+
+def server_opcounters(db) -> Optional[Dict[str, int]]:
+    """mongod operation counters, when serverStatus is permitted."""
+    try:
+        return dict(db.command("serverStatus")["opcounters"])
+    except Exception:
+        return None
+
+
+def run_scenario(
+    scenario: Scenario,
+    driver: Driver,
+    requests: int,
+    concurrency: int,
+    counter: Optional[CommandCounter],
+    db
+) -> Dict[str, Any]:
+    specs = [spec for spec in map(scenario.build, range(requests)) if spec]
+    commands_before = counter.snapshot() if counter else None
+    ops_before = server_opcounters(db)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(driver.send, specs))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(latency for latency, _ in results)
+    statuses = Counter(str(status) for _, status in results)
+    report: Dict[str, Any] = {
+        "requests": len(results),
+        "skipped": requests - len(specs),
+        "statuses": dict(sorted(statuses.items())),
+        "errors": sum(count for status, count in statuses.items() if not status.startswith(("2", "3"))),
+        "throughput_rps": round(len(results) / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "max": round(latencies[-1], 3) if latencies else 0.0,
+        },
+    }
+    if counter:
+        commands = counter.snapshot() - commands_before
+        report["db_commands"] = {
+            "total": sum(commands.values()),
+            "per_request": round(sum(commands.values()) / len(results), 2) if results else 0.0,
+            "by_name": dict(sorted(commands.items())),
+        }
+    ops_after = server_opcounters(db)
+    if ops_before and ops_after:
+        report["db_opcounters"] = {key: ops_after[key] - ops_before.get(key, 0) for key in ops_after}
+    return report
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def serve_app():
+    """Serve the app on a free local port from a background thread."""
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    from backend.app import create_app
+
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    server = make_server("127.0.0.1", 0, create_app(), threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for name, default in vars(SeedConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    parser.add_argument("--db", default="rwa_bench", help="Benchmark database, dropped on seeding")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=200, help="Requests per route")
+    parser.add_argument("--rippled-latency-ms", type=float, default=20.0)
+    parser.add_argument("--rippled-jitter-ms", type=float, default=5.0)
+    parser.add_argument("--routes", help="Comma separated scenario names to run")
+    parser.add_argument("--output", default="benchmark-results.json")
+    args = parser.parse_args(argv)
+
+    # Configure the app before it is imported
+    os.environ["MONGODB_DB"] = args.db
+
+    seed_config = SeedConfig(**{name: getattr(args, name) for name in vars(SeedConfig())})
+    dataset = seed(seed_config)
+
+    ledger = FakeLedger()
+    for account, nft_ids in dataset.owned.items():
+        ledger.give(account, nft_ids)
+    # The buyer holds the NFTs of the listings it validates purchases for
+    ledger.give(dataset.buyers[0], [listing["nft_id"] for listing in dataset.listings])
+
+    from backend.services.database import add_event_listener, get_db
+    counter = CommandCounter()
+    add_event_listener(counter)
+
+    with FakeRippled(ledger, latency_ms=args.rippled_latency_ms, jitter_ms=args.rippled_jitter_ms) as rippled:
+        os.environ["XRPL_NODE_URL"] = rippled.url
+        server, base_url = serve_app()
+        driver = Driver(base_url)
+        selected = set(args.routes.split(",")) if args.routes else None
+
+        routes = {}
+        try:
+            for scenario in build_scenarios(dataset):
+                if selected and scenario.name not in selected:
+                    continue
+                routes[scenario.name] = run_scenario(
+                    scenario, driver, args.requests, args.concurrency, counter, get_db()
+                )
+                latency = routes[scenario.name]["latency_ms"]
+                print(
+                    f"{scenario.name:20s} p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  "
+                    f"p99 {latency['p99']:8.2f} ms  {routes[scenario.name]['throughput_rps']:8.1f} req/s",
+                    file=sys.stderr
+                )
+        finally:
+            server.shutdown()
+        rippled_requests = rippled.requests
+
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "python": platform.python_version(),
+            "rippled_requests": rippled_requests,
+        },
+        "config": {
+            **asdict(seed_config),
+            "concurrency": args.concurrency,
+            "requests_per_route": args.requests,
+            "rippled_latency_ms": args.rippled_latency_ms,
+            "rippled_jitter_ms": args.rippled_jitter_ms,
+        },
+        "routes": routes,
+    }
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"results written to {args.output}", file=sys.stderr)
+    return results
+
+
+if __name__ == "__main__":
+    main()
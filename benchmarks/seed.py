@@ -0,0 +1,216 @@
+"""Seed a benchmark database with synthetic accounts, NFTs and listings.
+
+Documents are shaped exactly like the ones the services write, but are
+inserted in bulk. The target database is dropped first, so MONGODB_DB
+must point at a dedicated benchmark database.
+
+Usage:
+    MONGODB_DB=rwa_bench python -m backend.benchmarks.seed [--nfts 2000]
+"""
+import argparse
+import base64
+import io
+import os
+import random
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+ASSET_TYPES = ["Real Estate", "Art", "Commodity", "Vehicle", "Collectible"]
+CITIES = ["Paris, France", "Lisbon, Portugal", "Austin, USA", "Osaka, Japan", "Berlin, Germany"]
+WORDS = "bright spacious renovated historic modern quiet central waterfront garden loft".split()
+
+
+@dataclass
+class SeedConfig:
+    accounts: int = 100
+    nfts: int = 2_000
+    listings: int = 1_000
+    images: int = 200
+    image_kb: int = 32
+    uploads: int = 20
+    upload_px: int = 256
+    sales: int = 5_000
+    seed: int = 42
+
+
+@dataclass
+class Dataset:
+    """Identifiers of the seeded documents, used to build requests."""
+    accounts: List[str] = field(default_factory=list)
+    buyers: List[str] = field(default_factory=list)
+    owned: Dict[str, List[str]] = field(default_factory=dict)
+    metadata_hashes: List[str] = field(default_factory=list)
+    metadata_ids: List[str] = field(default_factory=list)
+    image_ids: List[str] = field(default_factory=list)
+    upload_ids: List[str] = field(default_factory=list)
+    listings: List[Dict[str, str]] = field(default_factory=list)
+    unlisted: List[Dict[str, str]] = field(default_factory=list)
+
+
+def make_account(rng: random.Random) -> str:
+    alphabet = "rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz"
+    return "r" + "".join(rng.choice(alphabet) for _ in range(33))
+
+
+def make_image(rng: random.Random, px: int) -> bytes:
+    """A PNG of random pixels, so every image is distinct and compresses poorly."""
+    from PIL import Image
+
+    output = io.BytesIO()
+    Image.frombytes("RGB", (px, px), rng.randbytes(px * px * 3)).save(output, "PNG")
+    return output.getvalue()
+
+
+def make_metadata(rng: random.Random, index: int, image_id: str = None) -> Dict[str, str]:
+    asset_type = rng.choice(ASSET_TYPES)
+    metadata = {
+        "title": f"{rng.choice(WORDS).title()} {asset_type} #{index}",
+        "asset_type": asset_type,
+        "location": rng.choice(CITIES),
+        "description": " ".join(rng.choice(WORDS) for _ in range(40)),
+        "documentation_id": f"DOC-{index}",
+    }
+    if image_id:
+        metadata["image_id"] = image_id
+    return metadata
+
+
+def seed(config: SeedConfig) -> Dataset:
+    """Drop the configured database and fill it with synthetic data."""
+    from backend.services.database import get_client, get_db
+    from backend.services.mongodb_service import (
+        LISTING_SUMMARY_FIELDS,
+        encode_metadata_document,
+        ensure_indexes,
+        load_metadata
+    )
+    from backend.services import image_service, stats_service, price_history_service
+
+    rng = random.Random(config.seed)
+    db_name = os.getenv("MONGODB_DB", "rwa")
+    get_client().drop_database(db_name)
+    db = get_db()
+    ensure_indexes()
+    price_history_service.ensure_price_history_collection(db)
+
+    now = datetime.utcnow()
+    dataset = Dataset()
+    dataset.accounts = [make_account(rng) for _ in range(config.accounts)]
+    dataset.buyers = [make_account(rng) for _ in range(max(config.accounts // 10, 1))]
+
+    images = []
+    for _ in range(config.images):
+        images.append({
+            "image_id": str(uuid.uuid4()),
+            "data": base64.b64encode(rng.randbytes(config.image_kb * 1024)).decode(),
+            "created_at": now
+        })
+    if images:
+        db.nft_images.insert_many(images)
+    dataset.image_ids = [image["image_id"] for image in images]
+
+    # Streamed uploads with their thumbnails already generated
+    for _ in range(config.uploads):
+        image = make_image(rng, config.upload_px)
+        image_id = image_service.store_image_stream([image])["image_id"]
+        image_service.store_derivatives(image_id, image_service.render_derivatives(image))
+        dataset.upload_ids.append(image_id)
+
+    metadata_docs, nfts = [], []
+    for i in range(config.nfts):
+        image_id = images[i]["image_id"] if i < len(images) else None
+        metadata = make_metadata(rng, i, image_id)
+        encoded = encode_metadata_document(metadata)
+        metadata_hash = encoded["metadata_hash"]
+        metadata_id = str(uuid.uuid4())
+        account = dataset.accounts[i % len(dataset.accounts)]
+        nft_id = f"{i:064X}"
+        created_at = now - timedelta(minutes=config.nfts - i)
+
+        metadata_docs.append({
+            "metadata_id": metadata_id,
+            **encoded,
+            "created_at": created_at
+        })
+        nfts.append({
+            "nft_id": nft_id,
+            "account": account,
+            "uri": f"RWA-XRPL_REAL_WORLD-{metadata['asset_type']}-{metadata_hash}",
+            "transaction_hash": uuid.uuid4().hex.upper(),
+            "metadata": {
+                "platform_minted": True,
+                "nft_id": nft_id,
+                "metadata_id": metadata_id,
+                "metadata_hash": metadata_hash
+            },
+            "created_at": created_at,
+            "status": "minted"
+        })
+        dataset.owned.setdefault(account, []).append(nft_id)
+        dataset.metadata_hashes.append(metadata_hash)
+        dataset.metadata_ids.append(metadata_id)
+    if nfts:
+        db.nft_metadata.insert_many(metadata_docs)
+        db.nfts.insert_many(nfts)
+
+    listings = []
+    for i, (nft, metadata_doc) in enumerate(zip(nfts, metadata_docs)):
+        ids = {
+            "nft_id": nft["nft_id"],
+            "seller_address": nft["account"],
+            "metadata_hash": metadata_doc["metadata_hash"]
+        }
+        if i >= config.listings:
+            dataset.unlisted.append(ids)
+            continue
+        metadata = load_metadata(metadata_doc)
+        summary = {name: metadata.get(name) for name in LISTING_SUMMARY_FIELDS}
+        listing = {
+            "listing_id": str(uuid.uuid4()),
+            **ids,
+            "price_drops": rng.randrange(1, 10_000) * 1_000_000,
+            "asset_type": summary["asset_type"],
+            "summary": summary,
+            "search_text": metadata["description"],
+            "status": "active",
+            "created_at": nft["created_at"],
+            "updated_at": nft["created_at"]
+        }
+        listings.append(listing)
+        dataset.listings.append({"listing_id": listing["listing_id"], **ids})
+    if listings:
+        db.marketplace_listings.insert_many(listings)
+
+    sales = []
+    for _ in range(config.sales):
+        nft = rng.choice(nfts)
+        sales.append({
+            "transaction_id": str(uuid.uuid4()),
+            "nft_id": nft["nft_id"],
+            "buyer_address": rng.choice(dataset.buyers),
+            "price_drops": rng.randrange(1, 10_000) * 1_000_000,
+            "transaction_hash": uuid.uuid4().hex.upper(),
+            "transaction_type": "purchase",
+            "asset_type": rng.choice(ASSET_TYPES),
+            "created_at": now - timedelta(minutes=rng.randrange(0, 60 * 24 * 7))
+        })
+    if sales:
+        db.nft_transactions.insert_many(sales)
+
+    stats_service.rebuild_stats()
+    price_history_service.backfill_price_history()
+    return dataset
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    for name, default in vars(SeedConfig()).items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=int, default=default)
+    args = parser.parse_args()
+    dataset = seed(SeedConfig(**vars(args)))
+    print(
+        f"seeded {len(dataset.accounts)} accounts, {sum(map(len, dataset.owned.values()))} NFTs, "
+        f"{len(dataset.listings)} listings into {os.getenv('MONGODB_DB', 'rwa')}"
+    )
@@ -0,0 +1,110 @@
+"""Command line maintenance tasks registered on the Flask CLI"""
+import sys
+import click
+from flask.cli import AppGroup
+from .services.mongodb_service import (
+    backfill_listing_summaries,
+    backfill_nft_updated_at,
+    compress_metadata_documents,
+    ensure_indexes
+)
+from .services.stats_service import rebuild_stats
+from .services.price_history_service import backfill_price_history
+from .services.export_service import export_ndjson, EXPORTS, EXPORT_BATCH_SIZE
+from .services.image_service import backfill_derivatives
+from .services.write_behind import write_behind
+from .services.reconcile_service import reconcile_ledger, RECONCILE_PAGE_SIZE, RECONCILE_WORKERS
+
+listings_cli = AppGroup('listings', help='Marketplace listing maintenance.')
+stats_cli = AppGroup('stats', help='Marketplace statistics maintenance.')
+history_cli = AppGroup('history', help='Price history maintenance.')
+db_cli = AppGroup('db', help='Database maintenance.')
+export_cli = AppGroup('export', help='Bulk data exports.')
+images_cli = AppGroup('images', help='NFT image maintenance.')
+ledger_cli = AppGroup('ledger', help='Ledger synchronization.')
+
+@db_cli.command('indexes')
+def ensure_indexes_command():
+    """Create the indexes and collections the application relies on."""
+    ensure_indexes()
+    click.echo("Indexes are up to date")
+
+@db_cli.command('backfill-updated-at')
+def backfill_nft_updated_at_command():
+    """Set updated_at on NFTs minted before it was tracked."""
+    updated = backfill_nft_updated_at()
+    click.echo(f"Updated {updated} NFTs")
+
+@db_cli.command('compress-metadata')
+def compress_metadata_command():
+    """Convert metadata stored before canonical bytes were."""
+    result = compress_metadata_documents()
+    click.echo(f"Updated {result['updated']} metadata documents ({result['mismatched']} hash mismatches left as is)")
+
+@db_cli.command('replay-spool')
+def replay_spool_command():
+    """Write the history inserts spooled while the database was unavailable."""
+    written = write_behind.replay_spool()
+    click.echo(f"Wrote {written} spooled documents")
+
+@listings_cli.command('backfill')
+def backfill_listings_command():
+    """Store metadata summaries on listings created without one."""
+    updated = backfill_listing_summaries()
+    click.echo(f"Updated {updated} listings")
+
+@images_cli.command('derivatives')
+def backfill_derivatives_command():
+    """Generate thumbnails for images uploaded before they existed."""
+    processed = backfill_derivatives()
+    click.echo(f"Generated thumbnails for {processed} images")
+
+@stats_cli.command('rebuild')
+def rebuild_stats_command():
+    """Recompute marketplace statistics from scratch."""
+    result = rebuild_stats()
+    click.echo(f"Rebuilt stats for {result['asset_types']} asset types ({result['buckets']} hourly buckets)")
+
+@history_cli.command('backfill')
+def backfill_history_command():
+    """Copy past purchases into the price history time series."""
+    copied = backfill_price_history()
+    click.echo(f"Copied {copied} sales into the price history")
+
+@export_cli.command('dump')
+@click.argument('name', type=click.Choice(sorted(EXPORTS)))
+@click.option('--output', '-o', type=click.Path(dir_okay=False), help='File to write, standard output by default.')
+@click.option('--gzip', 'compress', is_flag=True, help='Compress the output with gzip.')
+@click.option('--after', help='Resume after this document _id.')
+@click.option('--batch-size', type=click.IntRange(1, 10_000), default=EXPORT_BATCH_SIZE, show_default=True,
+              help='Documents fetched per database round trip.')
+def export_dump_command(name, output, compress, after, batch_size):
+    """Write a collection as newline delimited JSON."""
+    chunks = export_ndjson(name, after=after, compress=compress, batch_size=batch_size)
+    if output is None:
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+    with open(output, 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+    click.echo(f"Exported {name} to {output}", err=True)
+
+@ledger_cli.command('reconcile')
+@click.option('--account', 'accounts', multiple=True, help='Only reconcile this account; repeatable.')
+@click.option('--workers', type=click.IntRange(1, 64), default=RECONCILE_WORKERS, show_default=True,
+              help='Accounts reconciled at once.')
+@click.option('--page-size', type=click.IntRange(1, 400), default=RECONCILE_PAGE_SIZE, show_default=True,
+              help='Transactions per account_tx page.')
+def reconcile_command(accounts, workers, page_size):
+    """Apply ledger transfers, burns and offers missed since the last run."""
+    result = reconcile_ledger(list(accounts) or None, workers=workers, page_size=page_size)
+    click.echo(
+        f"Reconciled {result.get('accounts', 0)} accounts ({result.get('failed', 0)} failed): "
+        f"{result.get('transactions', 0)} transactions read, "
+        f"{result.get('nfts', 0)} NFTs, {result.get('marketplace_listings', 0)} listings "
+        f"and {result.get('nft_offers', 0)} offers updated"
+    )
+    if result.get('failed'):
+        sys.exit(1)
@@ -0,0 +1,111 @@
+"""Gunicorn configuration for production
+
+Run from the directory containing the backend package:
+    gunicorn -c backend/gunicorn.conf.py
+
+The application is loaded once in the master and forked into the workers.
+The master creates the MongoDB indexes once at startup (ENSURE_INDEXES=0
+skips this when they are managed with ``flask db indexes``).
+Database and HTTP clients are never carried across fork: the master closes
+any it opened while loading, and each worker opens its own and warms them
+up before it accepts traffic, then starts its change stream watcher
+(CHANGE_STREAMS=0 disables it). On SIGTERM a worker first fails its readiness
+probe, optionally keeps serving for DRAIN_SECONDS so load balancers can
+notice, then stops accepting connections and finishes in-flight requests
+within graceful_timeout.
+"""
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+
+wsgi_app = "backend.wsgi:app"
+bind = os.getenv("GUNICORN_BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+
+# Threads let a worker overlap requests blocked on MongoDB or the XRPL node
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", 4))
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+
+# Recycle workers periodically to bound memory growth
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", 0))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", 0))
+
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Seconds a worker keeps serving after SIGTERM while failing readiness;
+# must stay below graceful_timeout
+DRAIN_SECONDS = float(os.getenv("DRAIN_SECONDS", 0))
+
+
+def on_starting(server):
+    logging.basicConfig(level=loglevel.upper(), format="%(asctime)s %(process)d %(levelname)s %(name)s: %(message)s")
+    # One line per XRPL request otherwise
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+
+def when_ready(server):
+    if os.getenv("ENSURE_INDEXES", "1") == "1":
+        from backend.services.mongodb_service import ensure_indexes
+        try:
+            ensure_indexes()
+        except ValueError as e:
+            server.log.warning("%s", e)
+
+
+def pre_fork(server, worker):
+    # The master connected to create indexes; sockets and pool threads
+    # must not be shared with the workers
+    from backend.services.database import close_client
+    from backend.services.xrpl_service import close_http_clients
+    close_client()
+    close_http_clients()
+
+
+def post_worker_init(worker):
+    from backend.async_runtime import event_loop
+    from backend.services.change_watcher import change_watcher
+    from backend.services.health_service import mark_draining, warm_up
+
+    # Start the shared loop for async views and open pooled connections
+    event_loop.loop
+    warm_up()
+    if os.getenv("CHANGE_STREAMS", "1") == "1":
+        change_watcher.start()
+
+    handle_exit = worker.handle_exit
+
+    def drain(sig, frame):
+        mark_draining()
+        if DRAIN_SECONDS > 0:
+            worker.log.info("Worker %d draining for %.0f s", worker.pid, DRAIN_SECONDS)
+            threading.Timer(DRAIN_SECONDS, handle_exit, (sig, frame)).start()
+        else:
+            handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, drain)
+    signal.siginterrupt(signal.SIGTERM, False)
+
+
+def worker_exit(server, worker):
+    from backend.async_runtime import event_loop
+    from backend.services.change_watcher import change_watcher
+    from backend.services.database import close_client
+    from backend.services.image_service import close_image_pool
+    from backend.services.write_behind import write_behind
+    from backend.services.xrpl_service import close_http_clients
+    change_watcher.stop()
+    # Store the thumbnails still being generated and the buffered history
+    # inserts before disconnecting
+    close_image_pool()
+    write_behind.close()
+    close_client()
+    close_http_clients()
+    event_loop.stop()
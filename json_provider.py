@@ -0,0 +1,91 @@
+"""Fast JSON provider for Flask responses"""
+from typing import Any, Union
+import base64
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import uuid
+
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements
+    orjson = None
+
+
+def default_encoder(obj: Any) -> Any:
+    """Encode the MongoDB and binary types our documents carry.
+
+    Used as the ``default`` hook for both orjson and the stdlib fallback,
+    so services can hand raw MongoDB documents straight to ``jsonify``.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    # Only reached on the stdlib fallback, orjson encodes these natively
+    if isinstance(obj, datetime):
+        if obj.tzinfo is None:
+            return obj.isoformat() + "+00:00"
+        return obj.isoformat()
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson.
+
+    ObjectId, datetime and bytes values are encoded natively, which removes
+    the need to stringify ``_id`` on every document before returning it.
+    Naive datetimes are treated as UTC since that is how they are stored.
+    """
+
+    #: Sort keys of serialized objects. Off by default as it costs CPU on
+    #: large listing payloads and clients don't depend on key order.
+    sort_keys = False
+
+    mimetype = "application/json"
+
+    def _options(self) -> int:
+        options = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        return options
+
+    def dumps_bytes(self, obj: Any) -> bytes:
+        """Serialize data as JSON encoded bytes."""
+        if orjson is None:
+            return self.dumps(obj).encode("utf-8")
+        return orjson.dumps(obj, default=default_encoder, option=self._options())
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        """Serialize data as JSON."""
+        if orjson is None or kwargs:
+            kwargs.setdefault("default", default_encoder)
+            kwargs.setdefault("sort_keys", self.sort_keys)
+            return json.dumps(obj, **kwargs)
+        return self.dumps_bytes(obj).decode("utf-8")
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        """Deserialize data as JSON."""
+        if orjson is None or kwargs:
+            return json.loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args: Any, **kwargs: Any):
+        """Serialize the given arguments as JSON and return a response.
+
+        The encoded bytes are handed to the response object directly to
+        avoid a decode/encode round trip on large payloads.
+        """
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.dumps_bytes(obj), mimetype=self.mimetype)
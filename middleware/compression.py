@@ -0,0 +1,70 @@
+"""Response compression with gzip/brotli negotiation"""
+from typing import Optional
+import gzip
+from flask import Flask, Response, current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+COMPRESSIBLE_MIMETYPES = {
+    "application/json",
+    "application/x-ndjson",
+    "text/plain",
+    "text/html",
+}
+
+
+def choose_encoding() -> Optional[str]:
+    """Pick the preferred encoding accepted by the client, if any."""
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        return "br"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+
+def compress_response(response: Response) -> Response:
+    """Compress the response body when it is large enough to be worth it.
+
+    Streamed responses are left untouched, as are responses that already
+    carry a Content-Encoding or are not a successful full body.
+    """
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add("Accept-Encoding")
+
+    if (
+        response.status_code != 200
+        or response.direct_passthrough
+        or response.is_streamed
+        or "Content-Encoding" in response.headers
+    ):
+        return response
+
+    encoding = choose_encoding()
+    if encoding is None:
+        return response
+
+    data = response.get_data()
+    if len(data) < current_app.config["COMPRESS_MIN_SIZE"]:
+        return response
+
+    if encoding == "br":
+        compressed = brotli.compress(data, quality=current_app.config["COMPRESS_BR_QUALITY"])
+    else:
+        compressed = gzip.compress(data, compresslevel=current_app.config["COMPRESS_GZIP_LEVEL"])
+
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    """Register response compression on the application."""
+    app.config.setdefault("COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("COMPRESS_GZIP_LEVEL", 6)
+    app.config.setdefault("COMPRESS_BR_QUALITY", 5)
+    app.after_request(compress_response)
@@ -0,0 +1,238 @@
+"""Prometheus metrics for routes, MongoDB, XRPL and caches"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import bisect
+import hmac
+import os
+import threading
+import time
+from flask import Flask, Response, g, request
+from pymongo import monitoring
+from ..services import xrpl_service
+from ..services.cache import CACHES
+from ..services.database import add_event_listener
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], **extra: str) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra.items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic counter with labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative histogram with labels."""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # Per label set: [per-bucket counts..., +Inf count], sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(labels, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for labels, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, le=le)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total[0]}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+REQUEST_COUNT = Counter(
+    "http_requests_total", "HTTP responses by route and status", ("method", "route", "status")
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "mongodb_pool_checkout_wait_seconds", "Time spent waiting for a pooled MongoDB connection",
+    ("address",), POOL_WAIT_BUCKETS
+)
+POOL_CHECKOUT_FAILED = Counter(
+    "mongodb_pool_checkout_failed_total", "Failed MongoDB connection checkouts", ("address", "reason")
+)
+XRPL_LATENCY = Histogram(
+    "xrpl_request_duration_seconds", "XRPL JSON-RPC latency by method and node", ("method", "node")
+)
+
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+
+class PoolCheckoutListener(monitoring.ConnectionPoolListener):
+    """Record how long requests wait for a pooled connection."""
+
+    def __init__(self):
+        # Fallback timing for pymongo versions whose events carry no duration
+        self._started = threading.local()
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        self._started.at = time.perf_counter()
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        duration = getattr(event, "duration", None)
+        if duration is None:
+            duration = time.perf_counter() - getattr(self._started, "at", time.perf_counter())
+        POOL_CHECKOUT_WAIT.observe(duration, _address(event))
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        POOL_CHECKOUT_FAILED.inc(_address(event), str(event.reason))
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        pass
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        pass
+
+    def connection_checked_in(self, event) -> None:
+        pass
+
+
+def record_xrpl_request(method: str, node_url: str, duration_ms: float) -> None:
+    """XRPL request listener feeding the latency histogram."""
+    XRPL_LATENCY.observe(duration_ms / 1000, method, node_url)
+
+
+def render_caches() -> List[str]:
+    """Hit and miss counters of every in-process cache."""
+    lines = [
+        "# HELP cache_requests_total Cache lookups by result",
+        "# TYPE cache_requests_total counter"
+    ]
+    for name, cache in sorted(CACHES.items()):
+        lines.append(f'cache_requests_total{{cache="{name}",result="hit"}} {cache.hits}')
+        lines.append(f'cache_requests_total{{cache="{name}",result="miss"}} {cache.misses}')
+    lines += ["# HELP cache_entries Entries held by each cache", "# TYPE cache_entries gauge"]
+    for name, cache in sorted(CACHES.items()):
+        lines.append(f'cache_entries{{cache="{name}"}} {len(cache)}')
+    return lines
+
+
+def render_metrics() -> str:
+    """Render every metric in the Prometheus text exposition format."""
+    lines: List[str] = []
+    for metric in (REQUEST_LATENCY, REQUEST_COUNT, POOL_CHECKOUT_WAIT, POOL_CHECKOUT_FAILED, XRPL_LATENCY):
+        lines += metric.render()
+    lines += render_caches()
+    return "\n".join(lines) + "\n"
+
+
+def _route() -> str:
+    # The URL rule rather than the path keeps label cardinality bounded
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def start_timer() -> None:
+    g.metrics_started = time.perf_counter()
+
+
+def observe_request(response: Response) -> Response:
+    started: Optional[float] = g.pop("metrics_started", None)
+    if started is not None:
+        route = _route()
+        REQUEST_LATENCY.observe(time.perf_counter() - started, request.method, route)
+        REQUEST_COUNT.inc(request.method, route, str(response.status_code))
+    return response
+
+
+def metrics() -> Response:
+    """Prometheus scrape endpoint, for requests with the METRICS_API_TOKEN bearer token"""
+    # Read per request, so a token from .env is seen whenever it was loaded
+    token = os.getenv("METRICS_API_TOKEN")
+    if not token:
+        return Response("Not Found\n", status=404, content_type="text/plain")
+    header = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+        return Response("Unauthorized\n", status=401, content_type="text/plain", headers={"WWW-Authenticate": "Bearer"})
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+_pool_listener: Optional[PoolCheckoutListener] = None
+
+
+def init_metrics(app: Flask) -> None:
+    """Collect metrics for the application and expose them on /metrics.
+
+    Scrapes must send the METRICS_API_TOKEN bearer token, so connection
+    pool and latency internals are not public.
+
+    Metrics are kept per process; with several workers each one is scraped
+    separately.
+    """
+    global _pool_listener
+    if _pool_listener is None:
+        _pool_listener = PoolCheckoutListener()
+        add_event_listener(_pool_listener)
+        xrpl_service.add_request_listener(record_xrpl_request)
+
+    app.before_request(start_timer)
+    app.after_request(observe_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
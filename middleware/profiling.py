@@ -0,0 +1,144 @@
+"""Per-request profiling of MongoDB, XRPL and serialization time"""
+from typing import Dict, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import time
+from flask import Flask, Response, current_app, request
+from pymongo import monitoring
+from ..services import xrpl_service
+from ..services.database import add_event_listener
+
+logger = logging.getLogger(__name__)
+
+# Order of the Server-Timing metrics
+CATEGORIES = ("mongo", "xrpl", "serialize")
+
+
+class RequestProfile:
+    """Counts and durations of the work done while handling one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.counts: Dict[str, int] = {}
+        self.durations: Dict[str, float] = {}
+
+    def add(self, category: str, duration_ms: float) -> None:
+        self.counts[category] = self.counts.get(category, 0) + 1
+        self.durations[category] = self.durations.get(category, 0.0) + duration_ms
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def breakdown(self) -> Dict[str, Dict[str, float]]:
+        return {
+            category: {"count": self.counts[category], "ms": round(self.durations[category], 3)}
+            for category in self.counts
+        }
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def record(category: str, duration_ms: float) -> None:
+    """Add a timed operation to the profile of the current request, if any."""
+    profile = _current.get()
+    if profile is not None:
+        profile.add(category, duration_ms)
+
+
+@contextmanager
+def timed(category: str):
+    """Time the enclosed block under the given category."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(category, (time.perf_counter() - start) * 1000)
+
+
+class MongoCommandProfiler(monitoring.CommandListener):
+    """Attribute every MongoDB command to the request that issued it.
+
+    Sync pymongo publishes command events on the calling thread, so the
+    context variable still points at the right request.
+    """
+
+    def started(self, event: monitoring.CommandStartedEvent) -> None:
+        pass
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent) -> None:
+        record("mongo", event.duration_micros / 1000)
+
+    def failed(self, event: monitoring.CommandFailedEvent) -> None:
+        record("mongo", event.duration_micros / 1000)
+
+
+def record_xrpl_request(method: str, node_url: str, duration_ms: float) -> None:
+    """XRPL request listener feeding the request profile."""
+    record("xrpl", duration_ms)
+
+
+def server_timing(profile: RequestProfile) -> str:
+    """Format a profile as a Server-Timing header value."""
+    metrics: List[str] = []
+    for category in CATEGORIES:
+        if category in profile.counts:
+            metrics.append(
+                f'{category};dur={profile.durations[category]:.2f};desc="{profile.counts[category]} calls"'
+            )
+    metrics.append(f"total;dur={profile.total_ms():.2f}")
+    return ", ".join(metrics)
+
+
+def start_profile() -> None:
+    _current.set(RequestProfile())
+
+
+def finish_profile(response: Response) -> Response:
+    profile = _current.get()
+    if profile is None:
+        return response
+
+    response.headers["Server-Timing"] = server_timing(profile)
+
+    threshold = current_app.config.get("PROFILE_SLOW_REQUEST_MS")
+    total = profile.total_ms()
+    if threshold is not None and total >= threshold:
+        logger.warning(
+            "Slow request %s %s -> %s in %.1f ms: %s",
+            request.method, request.path, response.status_code, total, profile.breakdown()
+        )
+    return response
+
+
+def clear_profile(exc: Optional[BaseException] = None) -> None:
+    _current.set(None)
+
+
+_mongo_listener: Optional[MongoCommandProfiler] = None
+
+
+def init_profiling(app: Flask) -> None:
+    """Register request profiling on the application.
+
+    The MongoDB and XRPL listeners are process-wide and only installed once.
+    """
+    global _mongo_listener
+    if _mongo_listener is None:
+        _mongo_listener = MongoCommandProfiler()
+        add_event_listener(_mongo_listener)
+        xrpl_service.add_request_listener(record_xrpl_request)
+
+    # Time JSON serialization of responses
+    serialize = app.json.response
+
+    def profiled_response(*args, **kwargs):
+        with timed("serialize"):
+            return serialize(*args, **kwargs)
+
+    app.json.response = profiled_response
+
+    app.before_request(start_profile)
+    app.after_request(finish_profile)
+    app.teardown_request(clear_profile)
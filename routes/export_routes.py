@@ -0,0 +1,60 @@
+"""Bulk export routes for accounting and analytics jobs"""
+from typing import Tuple
+import hmac
+import os
+from flask import Blueprint, jsonify, request, Response
+from backend.services.export_service import export_ndjson, EXPORT_BATCH_SIZE
+
+bp = Blueprint('export', __name__, url_prefix='/api/export')
+
+def authorized(token: str) -> bool:
+    """Check the bearer token of the request."""
+    header = request.headers.get('Authorization', '')
+    return hmac.compare_digest(header.encode(), f"Bearer {token}".encode())
+
+@bp.route('/<name>', methods=['GET'])
+def export_collection(name: str) -> Tuple[Response, int]:
+    """Stream a collection as newline delimited JSON
+
+    Path parameters:
+        name: One of nfts, listings, offers, transactions
+
+    Query parameters:
+        after: Resume after this document _id
+        batch_size: Documents fetched per database round trip
+
+    The body is gzip compressed when the client accepts it. Documents are
+    written in _id order as they are read, so memory use does not grow with
+    the size of the collection.
+
+    Requires the EXPORT_API_TOKEN bearer token; exports are disabled when
+    it is not set.
+    """
+    # Read per request, so a token from .env is seen whenever it was loaded
+    token = os.getenv('EXPORT_API_TOKEN')
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if not authorized(token):
+        return jsonify({'error': 'Unauthorized'}), 401
+    try:
+        batch_size = int(request.args.get('batch_size', EXPORT_BATCH_SIZE))
+        if not 0 < batch_size <= 10_000:
+            raise ValueError("batch_size must be between 1 and 10000")
+        compress = bool(request.accept_encodings['gzip'])
+        chunks = export_ndjson(
+            name,
+            after=request.args.get('after'),
+            compress=compress,
+            batch_size=batch_size
+        )
+        response = Response(chunks, mimetype='application/x-ndjson')
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        response.headers['Content-Disposition'] = f'attachment; filename="{name}.ndjson"'
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
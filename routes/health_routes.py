@@ -0,0 +1,29 @@
+"""Liveness and readiness probes"""
+from typing import Tuple
+from flask import Blueprint, jsonify, Response
+from backend.services.health_service import check_readiness
+
+bp = Blueprint('health', __name__, url_prefix='/health')
+
+@bp.route('/live', methods=['GET'])
+def liveness() -> Tuple[Response, int]:
+    """Report that the worker process is running.
+    
+    Does not touch any dependency, so a slow database never gets a healthy
+    worker restarted.
+    """
+    return jsonify({'status': 'alive'}), 200
+
+@bp.route('/ready', methods=['GET'])
+def readiness() -> Tuple[Response, int]:
+    """Report whether the worker can serve traffic.
+    
+    Checks MongoDB and the XRPL node, each within a latency budget, and
+    fails while the worker is draining after SIGTERM.
+    """
+    try:
+        result = check_readiness()
+        result['status'] = 'ready' if result['ready'] else 'unavailable'
+        return jsonify(result), 200 if result['ready'] else 503
+    except Exception as e:
+        return jsonify({'status': 'unavailable', 'error': str(e)}), 503
@@ -0,0 +1,104 @@
+"""Shared helpers for route handlers"""
+from typing import Any, Dict, Iterator, List, Optional
+import hashlib
+from flask import Response, request
+from werkzeug.sansio.multipart import Data, Epilogue, Field, File, MultipartDecoder, NeedData
+
+# Bytes read from the request body at a time when streaming uploads
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+
+def weak_etag(version: Dict[str, Any]) -> str:
+    """Derive an ETag value from a query version (count, latest update)."""
+    parts = [f"{key}={version[key]}" for key in sorted(version)]
+    # Representations differ per query string (filters, fields), so they
+    # must not share a validator
+    parts.append(request.query_string.decode("utf-8", "replace"))
+    return hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+
+def not_modified(etag: str) -> Optional[Response]:
+    """Return a 304 response if the client already has this version."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag, weak=True)
+    return response
+
+
+def parse_fields() -> Optional[List[str]]:
+    """Parse the ``fields`` query parameter into a list of field names.
+    
+    Returns None when no sparse fieldset was requested.
+    """
+    raw = request.args.get('fields')
+    if not raw:
+        return None
+    # Operators are never valid field names
+    fields = [field.strip() for field in raw.split(',')]
+    return [field for field in fields if field and not field.startswith('$')]
+
+
+def parse_include(name: str) -> bool:
+    """Check whether the ``include`` query parameter requests an expansion."""
+    raw = request.args.get('include', '')
+    return name in [item.strip() for item in raw.split(',')]
+
+
+def parse_limit(default: int) -> int:
+    """Parse the ``limit`` query parameter.
+    
+    Raises:
+        ValueError: If the limit is not an integer
+    """
+    raw = request.args.get('limit')
+    if not raw:
+        return default
+    try:
+        return int(raw)
+    except ValueError:
+        raise ValueError("limit must be an integer")
+
+
+def iter_request_body(chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read the raw request body in chunks, as it arrives."""
+    stream = request.stream
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+
+def iter_multipart_file(field: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Read one file of a multipart/form-data body in chunks, as it arrives.
+    
+    Unlike ``request.files`` nothing is spooled to memory or disk first;
+    other parts of the body are skipped.
+    
+    Raises:
+        ValueError: If the body has no boundary or no such file
+    """
+    boundary = request.mimetype_params.get('boundary')
+    if not boundary:
+        raise ValueError("multipart body without boundary")
+    decoder = MultipartDecoder(boundary.encode('latin-1'))
+    stream = request.stream
+    in_file = False
+    while True:
+        chunk = stream.read(chunk_size)
+        decoder.receive_data(chunk or None)
+        event = decoder.next_event()
+        while not isinstance(event, NeedData):
+            if isinstance(event, Epilogue):
+                raise ValueError(f"No {field} file in the request")
+            if isinstance(event, (Field, File)):
+                in_file = isinstance(event, File) and event.name == field
+            elif isinstance(event, Data) and in_file:
+                if event.data:
+                    yield event.data
+                if not event.more_data:
+                    return
+            event = decoder.next_event()
+        if not chunk:
+            raise ValueError(f"No {field} file in the request")
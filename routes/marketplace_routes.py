@@ -1,10 +1,15 @@
 """Marketplace routes for NFT trading"""
-from typing import Tuple
+from typing import Any, Dict, Tuple
 from flask import Blueprint, jsonify, request, Response
 from backend.services.mongodb_service import (
     create_listing,
     get_active_listings,
     get_listing,
+    get_listing_async,
+    get_listing_changes,
+    get_listings_version,
+    search_listings,
+    complete_listing_sale,
     update_listing_status,
     get_metadata_by_hash,
     track_nft_offer
@@ -12,16 +17,48 @@ from backend.services.mongodb_service import (
 from backend.services.xrpl_service import (
     create_payment_template,
     create_nft_offer_template,
-    verify_nft_ownership,
+    verify_nft_ownership_async,
     create_nft_sell_offer_template,
-    verify_xrpl_transaction
+    verify_xrpl_transaction_async
 )
+from backend.services.stats_service import get_marketplace_stats
+from backend.services.price_history_service import get_ohlc
+from backend.services.change_watcher import change_watcher
+from backend.services.event_stream import broker, iter_frames
+from backend.routes.helpers import weak_etag, not_modified, parse_fields, parse_include, parse_limit
 from datetime import datetime
+import asyncio
+import os
 
 bp = Blueprint('marketplace', __name__, url_prefix='/api/marketplace')
 
+def parse_listing_filters() -> Dict[str, Any]:
+    """Parse listing filters from the query string.
+    
+    Raises:
+        ValueError: If a price or date filter is malformed
+    """
+    args = request.args
+    filters = {
+        'asset_type': args.get('asset_type'),
+        'seller_address': args.get('seller_address')
+    }
+    for name in ('min_price_drops', 'max_price_drops'):
+        if args.get(name):
+            try:
+                filters[name] = int(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an integer amount of drops")
+    for name in ('created_after', 'created_before'):
+        if args.get(name):
+            try:
+                filters[name] = datetime.fromisoformat(args[name])
+            except ValueError:
+                raise ValueError(f"{name} must be an ISO 8601 date")
+    return filters
+
 @bp.route('/list', methods=['POST'])
-def list_nft() -> Tuple[Response, int]:
+async def list_nft() -> Tuple[Response, int]:
     """Create a new NFT listing"""
     try:
         data = request.get_json()
@@ -37,11 +74,12 @@ def list_nft() -> Tuple[Response, int]:
             return jsonify({'error': 'metadata_hash is required'}), 400
             
         # Verify NFT ownership
-        if not verify_nft_ownership(data['seller_address'], data['nft_id']):
+        if not await verify_nft_ownership_async(data['seller_address'], data['nft_id']):
             return jsonify({'error': 'Seller does not own this NFT'}), 403
 
         # Create the listing
-        listing = create_listing(
+        listing = await asyncio.to_thread(
+            create_listing,
             nft_id=data['nft_id'],
             seller_address=data['seller_address'],
             price_xrp=float(data['price_xrp']),
@@ -59,12 +97,175 @@ def list_nft() -> Tuple[Response, int]:
 
 @bp.route('/listings', methods=['GET'])
 def get_listings() -> Tuple[Response, int]:
-    """Get all active NFT listings"""
+    """Get all active NFT listings
+    
+    Query parameters:
+        fields: Optional comma separated list of fields to return
+        include: "metadata" to resolve the full metadata of each listing
+        asset_type: Only listings of this asset type
+        seller_address: Only listings from this seller
+        min_price_drops, max_price_drops: Price range in drops
+        created_after, created_before: Creation date range (ISO 8601)
+        sort: One of price, -price, newest, oldest
+    """
     try:
-        listings = get_active_listings()
-        return jsonify({
+        # Answer revalidations before loading or serializing anything
+        etag = weak_etag(get_listings_version())
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged, 304
+            
+        listings = get_active_listings(
+            fields=parse_fields(),
+            filters=parse_listing_filters(),
+            sort=request.args.get('sort'),
+            include_metadata=parse_include('metadata')
+        )
+        response = jsonify({
             'listings': listings,
             'count': len(listings)
+        })
+        response.set_etag(etag, weak=True)
+        return response, 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/listings/changes', methods=['GET'])
+def get_listings_changes() -> Tuple[Response, int]:
+    """Get the listings changed since a sync token
+    
+    Query parameters:
+        since: Token from the previous response; omit for a full sync
+        limit: Maximum number of changes per page (default 500)
+    
+    Listings that left the active feed are returned as tombstones with
+    "removed" set. Keep calling with the returned "next" token while
+    "has_more" is true.
+    """
+    try:
+        return jsonify(get_listing_changes(
+            since=request.args.get('since'),
+            limit=parse_limit(500)
+        )), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/stream', methods=['GET'])
+def stream_events() -> Tuple[Response, int]:
+    """Stream listing and ownership changes as Server-Sent Events
+    
+    Events: listing.created, listing.updated, listing.cancelled,
+    listing.sold, listing.invalidated, listing.removed, nft.minted,
+    nft.transferred, and reset when the client must reload its state.
+    
+    Headers:
+        Last-Event-ID: Resume after this event (sent by EventSource on
+            reconnect; also accepted as the last_event_id query parameter)
+    """
+    if os.getenv('CHANGE_STREAMS', '1') == '1':
+        change_watcher.start()
+    try:
+        subscription = broker.subscribe(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 503
+
+    def generate():
+        try:
+            yield from iter_frames(subscription)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Disable response buffering in nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response, 200
+
+@bp.route('/search', methods=['GET'])
+def search() -> Tuple[Response, int]:
+    """Search listings by title, location and description
+    
+    Query parameters:
+        q: Search terms (required)
+        status: Listing status to search in, defaults to active
+        page: 1-based page number, defaults to 1
+        per_page: Results per page, defaults to 20 (max 100)
+        asset_type, seller_address, min_price_drops, max_price_drops,
+        created_after, created_before: Same filters as /listings
+    """
+    try:
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({'error': 'q is required'}), 400
+            
+        try:
+            page = max(int(request.args.get('page', 1)), 1)
+            per_page = min(max(int(request.args.get('per_page', 20)), 1), 100)
+        except ValueError:
+            return jsonify({'error': 'page and per_page must be integers'}), 400
+            
+        results = search_listings(
+            text,
+            status=request.args.get('status', 'active'),
+            filters=parse_listing_filters(),
+            page=page,
+            per_page=per_page
+        )
+        return jsonify(results), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/stats', methods=['GET'])
+def get_stats() -> Tuple[Response, int]:
+    """Get marketplace statistics per asset type
+    
+    Query parameters:
+        asset_type: Optional asset type to restrict the statistics to
+    """
+    try:
+        stats = get_marketplace_stats(request.args.get('asset_type'))
+        return jsonify({'stats': stats}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/history/ohlc', methods=['GET'])
+def get_price_history() -> Tuple[Response, int]:
+    """Get OHLC and volume candles of sale prices
+    
+    Query parameters:
+        interval: Candle width such as 15m, 1h, 1d or 1w (default 1d)
+        asset_type: Optional asset type to restrict to
+        nft_id: Optional NFT to restrict to
+        start, end: Optional ISO 8601 range, defaults to the last 100 candles
+    """
+    try:
+        args = request.args
+        try:
+            start = datetime.fromisoformat(args['start']) if args.get('start') else None
+            end = datetime.fromisoformat(args['end']) if args.get('end') else None
+        except ValueError:
+            return jsonify({'error': 'start and end must be ISO 8601 dates'}), 400
+            
+        candles = get_ohlc(
+            interval=args.get('interval', '1d'),
+            asset_type=args.get('asset_type'),
+            nft_id=args.get('nft_id'),
+            start=start,
+            end=end
+        )
+        return jsonify({
+            'candles': candles,
+            'interval': args.get('interval', '1d')
         }), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
@@ -73,9 +274,18 @@ def get_listings() -> Tuple[Response, int]:
 
 @bp.route('/listing/<listing_id>', methods=['GET'])
 def get_listing_by_id(listing_id: str) -> Tuple[Response, int]:
-    """Get a specific NFT listing"""
+    """Get a specific NFT listing
+    
+    Query parameters:
+        fields: Optional comma separated list of fields to return
+        include: "metadata" to resolve the full metadata
+    """
     try:
-        listing = get_listing(listing_id)
+        listing = get_listing(
+            listing_id,
+            fields=parse_fields(),
+            include_metadata=parse_include('metadata')
+        )
         return jsonify(listing), 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 404
@@ -83,7 +293,7 @@ def get_listing_by_id(listing_id: str) -> Tuple[Response, int]:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/buy/template/<listing_id>', methods=['POST'])
-def get_buy_template(listing_id: str) -> Tuple[Response, int]:
+async def get_buy_template(listing_id: str) -> Tuple[Response, int]:
     """Get transaction template for buying an NFT"""
     try:
         data = request.get_json()
@@ -93,28 +303,35 @@ def get_buy_template(listing_id: str) -> Tuple[Response, int]:
             return jsonify({'error': 'buyer_address is required'}), 400
             
         # Get the listing
-        listing = get_listing(listing_id)
+        listing = await get_listing_async(listing_id)
         if listing['status'] != 'active':
             return jsonify({'error': 'Listing is not active'}), 400
             
         # Verify seller still owns the NFT
-        if not verify_nft_ownership(listing['seller_address'], listing['nft_id']):
+        if not await verify_nft_ownership_async(listing['seller_address'], listing['nft_id']):
             # Update listing status to indicate NFT was transferred
-            update_listing_status(listing_id, "invalid", reason="NFT no longer owned by seller")
+            await asyncio.to_thread(
+                update_listing_status, listing_id, "invalid", {"reason": "NFT no longer owned by seller"}
+            )
             return jsonify({'error': 'NFT is no longer owned by the seller'}), 400
             
+        if data['buyer_address'] == listing['seller_address']:
+            return jsonify({'error': 'Sellers cannot buy their own listing'}), 400
+            
         # Create payment template
         payment_template = create_payment_template(
             account=data['buyer_address'],
             destination=listing['seller_address'],
-            amount_drops=listing['price_drops']
+            amount_drops=listing['price_drops'],
+            validated=True
         )
         
         # Create NFT offer template
         nft_offer_template = create_nft_offer_template(
             account=listing['seller_address'],
             destination=data['buyer_address'],
-            nft_id=listing['nft_id']
+            nft_id=listing['nft_id'],
+            validated=True
         )
         
         return jsonify({
@@ -137,7 +354,9 @@ def submit_buy_transaction(listing_id: str) -> Tuple[Response, int]:
 def prepare_buy_info(listing_id: str) -> Tuple[Response, int]:
     """Get necessary information to create an NFT offer in the wallet"""
     try:
-        listing = get_listing(listing_id)
+        listing = get_listing(listing_id, fields=[
+            'nft_id', 'seller_address', 'price_drops', 'metadata_hash'
+        ])
         
         # Prepare the response with all necessary information for the wallet
         buy_info = {
@@ -159,7 +378,7 @@ def prepare_buy_info(listing_id: str) -> Tuple[Response, int]:
         return jsonify({'error': f'Failed to prepare buy info: {str(e)}'}), 500
 
 @bp.route('/listing/<listing_id>/validate-purchase', methods=['POST'])
-def validate_purchase(listing_id: str) -> Tuple[Response, int]:
+async def validate_purchase(listing_id: str) -> Tuple[Response, int]:
     """Validate a completed NFT purchase and update listing status"""
     try:
         data = request.get_json()
@@ -168,21 +387,28 @@ def validate_purchase(listing_id: str) -> Tuple[Response, int]:
         if not all(field in data for field in required_fields):
             return jsonify({'error': 'Missing required fields'}), 400
             
-        listing = get_listing(listing_id)
+        listing = await get_listing_async(listing_id, fields=[
+            'nft_id', 'seller_address', 'price_drops', 'asset_type'
+        ])
         
         # Verify the new owner
-        if not verify_nft_ownership(data['buyer_address'], listing['nft_id']):
+        if not await verify_nft_ownership_async(data['buyer_address'], listing['nft_id']):
             return jsonify({
                 'status': 'pending',
                 'message': 'Waiting for transaction confirmation'
             }), 202
             
-        # Update listing status to sold
-        update_listing_status(listing_id, 'sold', {
-            'buyer_address': data['buyer_address'],
-            'transaction_hash': data['transaction_hash'],
-            'sold_at': datetime.utcnow().isoformat()
-        })
+        # Only the request that moves the listing out of active records the
+        # sale, so validating twice does not count it twice. Both writes run
+        # in order in one thread: the sale depends on the status update.
+        completed = await asyncio.to_thread(
+            complete_listing_sale,
+            {**listing, 'listing_id': listing_id},
+            data['buyer_address'],
+            data['transaction_hash']
+        )
+        if not completed:
+            return jsonify({'error': 'Listing is not active or the transaction was already recorded'}), 409
         
         return jsonify({
             'status': 'success',
@@ -202,7 +428,7 @@ def cancel_listing(listing_id: str) -> Tuple[Response, int]:
         if 'seller_address' not in data:
             return jsonify({'error': 'Seller address is required'}), 400
             
-        listing = get_listing(listing_id)
+        listing = get_listing(listing_id, fields=['seller_address'])
         
         # Verify the seller owns the listing
         if listing['seller_address'] != data['seller_address']:
@@ -224,7 +450,7 @@ def cancel_listing(listing_id: str) -> Tuple[Response, int]:
         return jsonify({'error': f'Failed to cancel listing: {str(e)}'}), 500 
 
 @bp.route('/list/template', methods=['POST'])
-def create_sell_offer_template() -> Tuple[Response, int]:
+async def create_sell_offer_template() -> Tuple[Response, int]:
     """Create an NFTokenCreateOffer template for selling an NFT"""
     try:
         data = request.get_json()
@@ -238,7 +464,7 @@ def create_sell_offer_template() -> Tuple[Response, int]:
             return jsonify({'error': 'seller_address is required'}), 400
             
         # Verify NFT ownership
-        if not verify_nft_ownership(data['seller_address'], data['nft_id']):
+        if not await verify_nft_ownership_async(data['seller_address'], data['nft_id']):
             return jsonify({'error': 'Seller does not own this NFT'}), 403
 
         # Create the NFTokenCreateOffer template
@@ -260,7 +486,7 @@ def create_sell_offer_template() -> Tuple[Response, int]:
         return jsonify({'error': str(e)}), 500
 
 @bp.route('/list/submit', methods=['POST'])
-def submit_sell_offer() -> Tuple[Response, int]:
+async def submit_sell_offer() -> Tuple[Response, int]:
     """Submit a signed NFTokenCreateOffer transaction"""
     try:
         data = request.get_json()
@@ -278,7 +504,7 @@ def submit_sell_offer() -> Tuple[Response, int]:
             return jsonify({'error': 'Transaction ID not found in XUMM response'}), 400
             
         # Verify the transaction on XRPL
-        tx_result = verify_xrpl_transaction(
+        tx_result = await verify_xrpl_transaction_async(
             transaction_hash=xumm_response['txid'],
             expected_type="NFTokenCreateOffer"
         )
@@ -299,7 +525,7 @@ def submit_sell_offer() -> Tuple[Response, int]:
             'offer_id': tx_result['transaction'].get('NFTokenOfferID', '')  # Store the offer ID from XRPL
         }
         
-        tracked_offer = track_nft_offer(offer_data)
+        tracked_offer = await asyncio.to_thread(track_nft_offer, offer_data)
         
         return jsonify({
             'status': 'success',
@@ -4,16 +4,42 @@ from flask import Blueprint, jsonify, request, Response
 from backend.services.xrpl_service import (
     generate_nft_mint_template,
     verify_xrpl_transaction,
+    MAX_TRANSFER_FEE,
+    MAX_URI_LENGTH
 )
 from backend.services.mongodb_service import (
     get_account_nfts,
-    get_metadata_by_hash,
+    get_account_nfts_version,
+    get_account_nft_changes,
+    get_metadata_json_by_hash,
     get_metadata_by_id,
     compute_metadata_hash,
     track_nft_mint,
     get_metadata_with_image,
+    get_nft_image,
+    image_exists,
     store_metadata
 ) 
+from backend.services.image_service import (
+    DERIVATIVE_SIZES,
+    ORIGINAL_SIZE,
+    IMAGE_UPLOAD_MAX_BYTES,
+    ImageTooLarge,
+    UnsupportedImageType,
+    get_image_derivative,
+    open_uploaded_image,
+    store_image_stream
+)
+from backend.services.metadata_schema_service import validate_metadata
+from backend.routes.helpers import (
+    weak_etag,
+    not_modified,
+    parse_fields,
+    parse_limit,
+    iter_request_body,
+    iter_multipart_file
+)
+import base64
 import os
 import json 
 
@@ -29,8 +55,9 @@ def get_nft_mint_template() -> Tuple[Response, int]:
     Expected request body:
     {
         "account": str,          # XRPL account address
-        "metadata": dict,        # NFT metadata
+        "metadata": dict,        # NFT metadata, checked against its asset_type schema
         "image": str,           # Optional base64 encoded image
+        "image_id": str,        # Optional ID from /image/upload, instead of image
         "transfer_fee": float,   # Optional transfer fee percentage
         "flags": int,           # Optional flags
         "taxon": int            # Optional taxon
@@ -48,17 +75,31 @@ def get_nft_mint_template() -> Tuple[Response, int]:
         # Extract image if present
         image_data = data.get('image')
         metadata = data.get('metadata', {})
-        
-        # Store metadata and get hash
-        metadata_hash, _ = store_metadata(metadata, image_data)
-        
-        # Create URI with metadata hash
-        uri = f"RWA-XRPL_REAL_WORLD-{metadata.get('asset_type', 'UNKNOWN')}-{metadata_hash}"
+        if data.get('image_id'):
+            if image_data:
+                return jsonify({'error': 'image and image_id are mutually exclusive'}), 400
+            if not image_exists(data['image_id']):
+                return jsonify({'error': 'image_id not found'}), 400
+            metadata['image_id'] = data['image_id']
+        validate_metadata(metadata)
         
         # Handle transfer fee
         transfer_fee = data.get('transfer_fee', 0)
         if transfer_fee > 0:
             transfer_fee = int(round(transfer_fee * 1000))
+        if not 0 <= transfer_fee <= MAX_TRANSFER_FEE:
+            return jsonify({'error': 'transfer_fee must be between 0 and 50 percent'}), 400
+            
+        # The URI ends with the 16 character metadata hash
+        uri_prefix = f"RWA-XRPL_REAL_WORLD-{metadata.get('asset_type', 'UNKNOWN')}-"
+        if len(uri_prefix.encode()) + 16 > MAX_URI_LENGTH:
+            return jsonify({'error': 'asset_type is too long'}), 400
+            
+        # Store metadata and get hash
+        metadata_hash, _ = store_metadata(metadata, image_data)
+        
+        # Create URI with metadata hash
+        uri = f"{uri_prefix}{metadata_hash}"
             
         # Generate template
         template = generate_nft_mint_template(
@@ -67,7 +108,8 @@ def get_nft_mint_template() -> Tuple[Response, int]:
             flags=data.get('flags', 8),
             transfer_fee=transfer_fee,
             taxon=data.get('taxon', 0),
-            metadata=metadata
+            metadata=metadata,
+            validated=True
         )
         
         return jsonify({
@@ -83,10 +125,15 @@ def get_nft_mint_template() -> Tuple[Response, int]:
 
 @bp.route('/metadata/hash/<metadata_hash>', methods=['GET'])
 def get_metadata_by_hash_route(metadata_hash: str) -> Tuple[Response, int]:
-    """Get NFT metadata by hash"""
+    """Get NFT metadata by hash
+    
+    The stored canonical JSON is returned as is. Metadata is content
+    addressed, so responses may be cached forever.
+    """
     try:
-        metadata_result = get_metadata_by_hash(metadata_hash)
-        return jsonify(metadata_result), 200
+        response = Response(get_metadata_json_by_hash(metadata_hash), mimetype='application/json')
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response, 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
@@ -142,35 +189,175 @@ def submit_transaction() -> Tuple[Response, int]:
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@bp.route('/image/upload', methods=['POST'])
+def upload_image() -> Tuple[Response, int]:
+    """Upload an NFT image before minting
+    
+    The body is either the raw image (Content-Type image/png, image/jpeg,
+    image/gif or image/webp) or multipart/form-data with the image in a
+    "file" field. It is written to storage as it arrives; pass the returned
+    image_id to /nft/mint/template instead of a base64 image.
+    
+    Returns 413 above IMAGE_UPLOAD_MAX_BYTES and 415 for other formats.
+    """
+    try:
+        if request.content_length is not None and request.content_length > IMAGE_UPLOAD_MAX_BYTES:
+            return jsonify({'error': f'Image exceeds {IMAGE_UPLOAD_MAX_BYTES} bytes'}), 413
+        if request.mimetype == 'multipart/form-data':
+            chunks = iter_multipart_file('file')
+        elif request.mimetype.startswith('image/'):
+            chunks = iter_request_body()
+        else:
+            return jsonify({'error': 'Send the image as image/* or multipart/form-data'}), 415
+        return jsonify(store_image_stream(chunks)), 201
+    except ImageTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    except UnsupportedImageType as e:
+        return jsonify({'error': str(e)}), 415
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def parse_image_size() -> str:
+    """Parse the ``size`` query parameter of image responses.
+    
+    Raises:
+        ValueError: If the size is not a known derivative size
+    """
+    size = request.args.get('size', ORIGINAL_SIZE)
+    if size != ORIGINAL_SIZE and size not in DERIVATIVE_SIZES:
+        raise ValueError(f"size must be one of {', '.join([ORIGINAL_SIZE, *DERIVATIVE_SIZES])}")
+    return size
+
+@bp.route('/image/<image_id>', methods=['GET'])
+def get_image(image_id: str) -> Tuple[Response, int]:
+    """Get an NFT image as binary data
+    
+    Query parameters:
+        size: Optional derivative ("small", "medium"); the original is
+            returned while a derivative is not generated yet
+    
+    Images never change once stored, so responses may be cached forever.
+    """
+    try:
+        size = parse_image_size()
+        cache_control = 'public, max-age=31536000, immutable'
+        derivative = get_image_derivative(image_id, size) if size != ORIGINAL_SIZE else None
+        if derivative is not None:
+            response = Response(derivative['data'], mimetype=derivative['content_type'])
+        else:
+            if size != ORIGINAL_SIZE:
+                # The derivative may still be generated
+                cache_control = 'public, max-age=60'
+            upload = open_uploaded_image(image_id)
+            if upload is not None:
+                # Streamed one GridFS chunk at a time; iterating a GridOut
+                # would split the image on newline bytes instead
+                response = Response(iter(upload.readchunk, b''), mimetype=upload.metadata['content_type'])
+                response.content_length = upload.length
+                response.call_on_close(upload.close)
+            else:
+                image_data = get_nft_image(image_id)
+                if image_data is None:
+                    return jsonify({'error': 'Image not found'}), 404
+                response = Response(base64.b64decode(image_data), mimetype='application/octet-stream')
+        response.headers['Cache-Control'] = cache_control
+        return response, 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @bp.route('/nfts/<address>', methods=['GET'])
 def get_address_nfts(address: str) -> Tuple[Response, int]:
-    """Get all NFTs for an address with their full metadata"""
+    """Get all NFTs for an address with their full metadata
+    
+    Query parameters:
+        fields: Optional comma separated list of fields to return. Metadata
+            is only resolved when "metadata" or "metadata_verified" is
+            requested.
+        size: Optional image derivative to embed ("small", "medium"),
+            the full resolution image by default
+    
+    While a derivative is not generated yet the original image is embedded
+    instead; such responses get no ETag, so clients pick up the derivative
+    once it is ready rather than revalidating the fallback.
+    """
     try:
+        # Answer revalidations before loading or serializing anything
+        etag = weak_etag(get_account_nfts_version(address))
+        unchanged = not_modified(etag)
+        if unchanged:
+            return unchanged, 304
+            
+        fields = parse_fields()
+        image_size = parse_image_size()
+        include_metadata = fields is None or 'metadata' in fields
+        db_fields = fields
+        if fields is not None and 'metadata_verified' in fields and not include_metadata:
+            db_fields = fields + ['metadata']
+            
         # Get NFTs with metadata already included from MongoDB
-        nfts = get_account_nfts(address)
+        nfts = get_account_nfts(address, fields=db_fields)
         # Format the response
+        fallback = False
         formatted_nfts = []
         for nft in nfts:
-            # Get metadata with image if available
-            metadata = get_metadata_with_image(nft['metadata']["metadata_hash"]) if "metadata_hash" in nft['metadata'] else {}
             formatted_nft = {
-                "nft_id": nft["nft_id"],
-                "account": nft["account"],
-                "transaction_hash": nft["transaction_hash"],
-                "created_at": nft["created_at"],
-                "status": nft["status"],
-                "uri": nft["uri"],
-                "metadata": metadata,
+                "nft_id": nft.get("nft_id"),
+                "account": nft.get("account"),
+                "transaction_hash": nft.get("transaction_hash"),
+                "created_at": nft.get("created_at"),
+                "status": nft.get("status"),
+                "uri": nft.get("uri"),
                 "metadata_verified": nft.get("metadata_verified", False)
             }
+            if include_metadata:
+                # Get metadata with image if available
+                nft_metadata = nft.get('metadata', {})
+                formatted_nft["metadata"] = get_metadata_with_image(nft_metadata["metadata_hash"], image_size) if "metadata_hash" in nft_metadata else {}
+                embedded_size = formatted_nft["metadata"].get("image_size", image_size)
+                fallback = fallback or embedded_size != image_size
+            if fields is not None:
+                formatted_nft = {key: formatted_nft[key] for key in fields if key in formatted_nft}
             formatted_nfts.append(formatted_nft)
         
-        return jsonify({
+        response = jsonify({
             'nfts': formatted_nfts,
             'count': len(formatted_nfts),
             'address': address
-        }), 200
+        })
+        if fallback:
+            # Same as /image/<image_id>: the derivative may still be generated
+            response.headers['Cache-Control'] = 'max-age=60'
+        else:
+            response.set_etag(etag, weak=True)
+        return response, 200
     except ValueError as e:
         return jsonify({'error': str(e)}), 400
     except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500 
+
+@bp.route('/nfts/<address>/changes', methods=['GET'])
+def get_address_nft_changes(address: str) -> Tuple[Response, int]:
+    """Get the NFTs of an address changed since a sync token
+    
+    Query parameters:
+        since: Token from the previous response; omit for a full sync
+        limit: Maximum number of changes per page (default 500)
+    
+    NFTs transferred away are returned as tombstones with "removed" set.
+    Metadata is not resolved; fetch it by metadata_hash when it is new.
+    """
+    try:
+        changes = get_account_nft_changes(
+            address,
+            since=request.args.get('since'),
+            limit=parse_limit(500)
+        )
+        return jsonify({**changes, 'address': address}), 200
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
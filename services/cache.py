@@ -0,0 +1,61 @@
+"""In-process caches with hit/miss accounting"""
+from typing import Any, Dict, Hashable, Optional
+from collections import OrderedDict
+import threading
+
+# Every cache created in this process, by name
+CACHES: Dict[str, "LRUCache"] = {}
+
+
+class LRUCache:
+    """Thread-safe least recently used cache.
+
+    Values that never change for a given key, such as documents addressed
+    by their content hash, can be cached as they are. Values that do change,
+    such as listings, are only correct in a cache registered with
+    change_watcher.watch_cache() and read through ChangeWatcher.cached(),
+    which drops them when they change and bypasses the cache while the
+    change stream is down.
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024):
+        self.name = name
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        CACHES[name] = self
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Get a cached value, or None on a miss."""
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Cache a value, evicting the least recently used entry when full."""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop a single entry."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
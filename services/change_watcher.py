@@ -0,0 +1,263 @@
+"""Cache invalidation driven by MongoDB change streams
+
+Every worker process runs one watcher thread on the change stream of the
+collections below, so a listing cancelled or sold through one worker is
+dropped from the caches of all the others. Caches registered with
+watch_cache() are only used while the stream is open: when it fails they
+are cleared, and reads go to the database until it is reopened.
+
+Change streams need a replica set (a single node one is enough). On a
+standalone server the watcher logs a warning and keeps retrying, and the
+watched caches stay disabled.
+"""
+from typing import Any, Callable, Dict, List, Optional
+from datetime import datetime
+import logging
+import os
+import threading
+from pymongo.errors import OperationFailure, PyMongoError
+from .cache import LRUCache
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+WATCHED_COLLECTIONS = ("marketplace_listings", "nfts", "nft_offers")
+
+# Fields of the changed document passed to listeners; the rest of the
+# post-image is dropped by the server
+FULL_DOCUMENT_FIELDS = (
+    "listing_id",
+    "nft_id",
+    "account",
+    "seller_address",
+    "status",
+    "price_xrp",
+    "price_drops",
+    "offer_id",
+    "updated_at"
+)
+
+# Stored resume tokens, one document per watcher name
+TOKEN_COLLECTION = "change_stream_tokens"
+
+# Errors meaning the resume token can no longer be used
+# (ChangeStreamHistoryLost, ChangeStreamFatalError, InvalidResumeToken)
+STALE_TOKEN_CODES = {260, 280, 286}
+
+# Called with each change event of a collection
+_listeners: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+
+# Called when changes may have been missed, e.g. the stream failed
+_reset_listeners: List[Callable[[], None]] = []
+
+# Caches that are only valid while the stream is open
+_watched_caches: List[LRUCache] = []
+
+def add_change_listener(collection: str, listener: Callable[[Dict[str, Any]], None]) -> None:
+    """Register a callback for every change to a watched collection."""
+    listeners = _listeners.setdefault(collection, [])
+    if listener not in listeners:
+        listeners.append(listener)
+
+def add_reset_listener(listener: Callable[[], None]) -> None:
+    """Register a callback for when changes may have been missed."""
+    if listener not in _reset_listeners:
+        _reset_listeners.append(listener)
+
+def watch_cache(cache: LRUCache) -> LRUCache:
+    """Register a cache that is cleared whenever changes may have been missed."""
+    if cache not in _watched_caches:
+        _watched_caches.append(cache)
+    return cache
+
+def clear_watched_caches() -> None:
+    """Drop every entry of the watched caches."""
+    for cache in _watched_caches:
+        cache.clear()
+
+def build_pipeline(collections=WATCHED_COLLECTIONS) -> List[Dict[str, Any]]:
+    """Change stream pipeline keeping only what listeners use."""
+    projection = {
+        "operationType": 1,
+        "ns": 1,
+        "documentKey": 1,
+        "clusterTime": 1,
+        "updateDescription.updatedFields.account": 1,
+        "updateDescription.updatedFields.status": 1
+    }
+    projection.update({f"fullDocument.{field}": 1 for field in FULL_DOCUMENT_FIELDS})
+    return [
+        {"$match": {
+            "ns.coll": {"$in": list(collections)},
+            "operationType": {"$in": ["insert", "update", "replace", "delete"]}
+        }},
+        {"$project": projection}
+    ]
+
+
+class ChangeWatcher:
+    """Background thread following the change stream of the watched collections.
+
+    Args:
+        name: Key of the stored resume token
+        collections: Collections to follow
+        token_save_interval: Minimum seconds between resume token writes
+        retry_interval: Seconds to wait before reopening a failed stream
+    """
+
+    def __init__(
+        self,
+        name: str = "cache-invalidation",
+        collections=WATCHED_COLLECTIONS,
+        token_save_interval: float = 1.0,
+        retry_interval: float = 5.0
+    ):
+        self.name = name
+        self.collections = tuple(collections)
+        self.token_save_interval = token_save_interval
+        self.retry_interval = retry_interval
+        # Incremented on every change and reset, see cached()
+        self.generation = 0
+        self._running = False
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._token_saved_at: Optional[datetime] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        """Whether the stream is open, i.e. watched caches are up to date"""
+        return self._running and self._pid == os.getpid()
+
+    def start(self) -> None:
+        """Start the watcher thread in this process, if not already running."""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._running = False
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name=f"change-watcher-{self.name}", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the watcher and save the last resume token."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout)
+        self._thread = None
+
+    def cached(self, cache: LRUCache, key: Any, load: Callable[[], Any]) -> Any:
+        """Read through a watched cache.
+
+        The value is only cached if no change arrived while it was loaded,
+        so a load racing with an invalidation never stores stale data.
+        """
+        if not self.running:
+            return load()
+        value = cache.get(key)
+        if value is not None:
+            return value
+        generation = self.generation
+        value = load()
+        if value is not None and self.running and self.generation == generation:
+            cache.set(key, value)
+        return value
+
+    def load_resume_token(self) -> Optional[Dict[str, Any]]:
+        """Get the resume token stored by a previous run."""
+        document = get_db()[TOKEN_COLLECTION].find_one({"_id": self.name})
+        return document["resume_token"] if document else None
+
+    def save_resume_token(self, force: bool = False) -> None:
+        """Store the current resume token, at most once per token_save_interval."""
+        if self._resume_token is None:
+            return
+        now = datetime.utcnow()
+        if not force and self._token_saved_at is not None and \
+                (now - self._token_saved_at).total_seconds() < self.token_save_interval:
+            return
+        get_db()[TOKEN_COLLECTION].update_one(
+            {"_id": self.name},
+            {"$set": {"resume_token": self._resume_token, "updated_at": now}},
+            upsert=True
+        )
+        self._token_saved_at = now
+
+    def dispatch(self, change: Dict[str, Any]) -> None:
+        """Pass a change event to the listeners of its collection."""
+        self.generation += 1
+        for listener in _listeners.get(change["ns"]["coll"], ()):
+            try:
+                listener(change)
+            except Exception:
+                logger.exception("Change listener failed for %s", change["ns"]["coll"])
+
+    def reset(self) -> None:
+        """Forget cached state after changes may have been missed."""
+        was_running = self._running
+        self._running = False
+        self.generation += 1
+        clear_watched_caches()
+        if was_running:
+            for listener in _reset_listeners:
+                try:
+                    listener()
+                except Exception:
+                    logger.exception("Reset listener failed")
+
+    def _watch(self) -> None:
+        if self._resume_token is None:
+            self._resume_token = self.load_resume_token()
+        with get_db().watch(
+            build_pipeline(self.collections),
+            full_document="updateLookup",
+            resume_after=self._resume_token,
+            max_await_time_ms=1000
+        ) as stream:
+            # Everything cached before the stream opened may be stale
+            clear_watched_caches()
+            self._running = True
+            logger.info("Watching changes to %s", ", ".join(self.collections))
+            while not self._stop.is_set() and stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    self.dispatch(change)
+                self._resume_token = stream.resume_token
+                self.save_resume_token()
+
+    def _forget_resume_token(self) -> None:
+        self._resume_token = None
+        try:
+            get_db()[TOKEN_COLLECTION].delete_one({"_id": self.name})
+        except PyMongoError as e:
+            logger.warning("Failed to delete resume token: %s", e)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            retry_interval = self.retry_interval
+            try:
+                self._watch()
+            except OperationFailure as e:
+                if e.code in STALE_TOKEN_CODES:
+                    logger.warning("Resume token for %s is no longer valid, watching from now", self.name)
+                    self._forget_resume_token()
+                    retry_interval = 0
+                else:
+                    logger.warning("Change stream unavailable: %s", e)
+            except PyMongoError as e:
+                logger.warning("Change stream interrupted: %s", e)
+            finally:
+                self.reset()
+            self._stop.wait(retry_interval)
+        try:
+            self.save_resume_token(force=True)
+        except PyMongoError as e:
+            logger.warning("Failed to save resume token: %s", e)
+
+
+# Watcher shared by the caches of this process
+change_watcher = ChangeWatcher()
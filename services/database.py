@@ -0,0 +1,93 @@
+"""MongoDB connection handling"""
+from typing import Any, List, Optional
+import asyncio
+import logging
+import os
+import threading
+import weakref
+from pymongo import MongoClient
+
+try:
+    from pymongo import AsyncMongoClient
+except ImportError:  # pragma: no cover - pymongo < 4.9
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient as AsyncMongoClient
+    except ImportError:
+        AsyncMongoClient = None
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+_event_listeners: List[Any] = []
+
+# Async clients are bound to the event loop they were first used on
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Any]" = weakref.WeakKeyDictionary()
+
+def add_event_listener(listener: Any) -> None:
+    """Attach a pymongo event listener to the shared client.
+
+    Listeners can only be given to a client at construction, so the current
+    client is closed and recreated on the next get_client() call.
+    """
+    global _client
+    with _client_lock:
+        if listener in _event_listeners:
+            return
+        _event_listeners.append(listener)
+        if _client is not None:
+            _client.close()
+            _client = None
+        _async_clients.clear()
+
+def get_client() -> MongoClient:
+    """Get the process-wide MongoDB client and its connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+                logger.debug("Connecting to MongoDB")
+                _client = MongoClient(
+                    mongo_uri,
+                    minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", 0)),
+                    event_listeners=list(_event_listeners)
+                )
+    return _client
+
+def close_client() -> None:
+    """Close the shared client; a new one is created on next use"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+        _async_clients.clear()
+
+def get_async_client():
+    """Get the async MongoDB client for the running event loop
+
+    Uses pymongo's native AsyncMongoClient, or Motor on older pymongo.
+
+    Raises:
+        RuntimeError: If neither is installed or no event loop is running
+    """
+    if AsyncMongoClient is None:
+        raise RuntimeError("Async MongoDB access requires pymongo>=4.9 or motor")
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
+        client = AsyncMongoClient(mongo_uri, event_listeners=list(_event_listeners))
+        _async_clients[loop] = client
+    return client
+
+def get_async_db():
+    """Get async MongoDB database connection"""
+    db_name = os.getenv("MONGODB_DB", "rwa")
+    return get_async_client()[db_name]
+
+def get_db():
+    """Get MongoDB database connection"""
+    db_name = os.getenv("MONGODB_DB", "rwa")
+    return get_client()[db_name]
@@ -0,0 +1,247 @@
+"""Listing and ownership events for Server-Sent Events clients
+
+The change watcher is the single upstream source in each process: its
+listeners turn change events into stream events, which are encoded once
+and fanned out to every connected client by the broker. Event ids are the
+change stream resume tokens, identical in every worker, so a client can
+reconnect to any worker with Last-Event-ID and receive what it missed
+while it is still in that worker's replay buffer.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from datetime import datetime
+import json
+import os
+import queue
+import threading
+import time
+from .change_watcher import add_change_listener, add_reset_listener
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements
+    orjson = None
+
+# Sent when a client must reload its state, e.g. it fell behind or its
+# Last-Event-ID is no longer in the replay buffer
+RESET_EVENT = "reset"
+
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_INTERVAL = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+
+# Streams are closed after this many seconds and the client reconnects
+# with Last-Event-ID, so connections get rebalanced across workers
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", 300))
+
+# Worker threads kept for regular requests: each open stream holds a
+# gunicorn thread until it is closed
+STREAM_RESERVED_THREADS = int(os.getenv("STREAM_RESERVED_THREADS", 2))
+
+# Reconnection delay suggested to clients, in milliseconds
+RETRY_MS = 3000
+
+LISTING_STATUS_EVENTS = {
+    "active": "listing.created",
+    "cancelled": "listing.cancelled",
+    "sold": "listing.sold",
+    "invalid": "listing.invalidated"
+}
+
+LISTING_EVENT_FIELDS = ("listing_id", "nft_id", "seller_address", "status", "price_xrp", "price_drops", "updated_at")
+NFT_EVENT_FIELDS = ("nft_id", "account", "status", "updated_at")
+
+def _default(obj: Any) -> Any:
+    # Naive datetimes are stored in UTC
+    if isinstance(obj, datetime):
+        return obj.isoformat() + ("+00:00" if obj.tzinfo is None else "")
+    return str(obj)
+
+def encode_event(event_type: str, data: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+    """Encode an event in the text/event-stream format."""
+    if orjson is not None:
+        payload = orjson.dumps(data, default=_default, option=orjson.OPT_NAIVE_UTC).decode("utf-8")
+    else:
+        payload = json.dumps(data, default=_default)
+    lines = [f"id: {event_id}"] if event_id is not None else []
+    lines.append(f"event: {event_type}")
+    lines.append(f"data: {payload}")
+    return ("\n".join(lines) + "\n\n").encode("utf-8")
+
+
+class Subscription:
+    """A client's bounded queue of encoded events.
+
+    A client that falls more than maxsize events behind is dropped from
+    the broker and sent a reset event, rather than buffering without bound.
+    """
+
+    def __init__(self, maxsize: int):
+        self.queue: "queue.Queue[bytes]" = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, frame: bytes) -> bool:
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except queue.Full:
+            self.overflowed = True
+            return False
+
+    def get(self, timeout: float) -> Optional[bytes]:
+        """Wait for the next event, or None after timeout."""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class EventBroker:
+    """Fans events out to the subscribed clients of this process.
+
+    Args:
+        buffer_size: Number of recent events kept for Last-Event-ID replay
+        client_buffer: Maximum events queued per client
+        max_clients: Maximum concurrent subscriptions
+    """
+
+    def __init__(self, buffer_size: int = 1000, client_buffer: int = 100, max_clients: int = 100):
+        self.client_buffer = client_buffer
+        self.max_clients = max_clients
+        self._buffer: "deque[Tuple[str, bytes]]" = deque(maxlen=buffer_size)
+        self._subscriptions: List[Subscription] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._subscriptions)
+
+    def publish(self, event_type: str, data: Dict[str, Any], event_id: Optional[str] = None) -> None:
+        """Encode an event once and queue it for every client."""
+        frame = encode_event(event_type, data, event_id)
+        with self._lock:
+            if event_id is not None:
+                self._buffer.append((event_id, frame))
+            for subscription in list(self._subscriptions):
+                if not subscription.put(frame):
+                    self._subscriptions.remove(subscription)
+
+    def reset(self) -> None:
+        """Tell every client to reload, after changes may have been missed."""
+        with self._lock:
+            self._buffer.clear()
+        self.publish(RESET_EVENT, {"reason": "changes may have been missed"})
+
+    def subscribe(self, last_event_id: Optional[str] = None) -> Subscription:
+        """Subscribe a client, replaying what it missed since last_event_id.
+
+        Raises:
+            ValueError: If the broker already has max_clients subscriptions
+        """
+        subscription = Subscription(self.client_buffer)
+        with self._lock:
+            if len(self._subscriptions) >= self.max_clients:
+                raise ValueError("Too many event stream clients")
+            if last_event_id:
+                ids = [event_id for event_id, _ in self._buffer]
+                if last_event_id in ids:
+                    missed = list(self._buffer)[ids.index(last_event_id) + 1:]
+                else:
+                    missed = None
+                if missed is None or len(missed) > self.client_buffer:
+                    subscription.put(encode_event(RESET_EVENT, {"reason": "Last-Event-ID is too old"}))
+                else:
+                    for _, frame in missed:
+                        subscription.put(frame)
+            self._subscriptions.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
+
+
+def stream_capacity(threads: int, reserved: int = STREAM_RESERVED_THREADS, limit: Optional[int] = None) -> int:
+    """Number of streams a worker may hold open.
+
+    Args:
+        threads: Request threads of the worker
+        reserved: Threads left for regular requests
+        limit: Upper bound, e.g. STREAM_MAX_CLIENTS
+    """
+    capacity = max(threads - reserved, 0)
+    return capacity if limit is None else min(capacity, limit)
+
+
+def iter_frames(
+    subscription: Subscription,
+    heartbeat: float = HEARTBEAT_INTERVAL,
+    max_seconds: float = STREAM_MAX_SECONDS
+):
+    """Yield the encoded events of a subscription as a text/event-stream body.
+
+    Sends a comment every heartbeat seconds while idle so proxies keep the
+    connection open, and ends with a reset event if the client fell behind.
+    """
+    yield f"retry: {RETRY_MS}\n\n".encode("utf-8")
+    deadline = time.monotonic() + max_seconds
+    while time.monotonic() < deadline:
+        if subscription.overflowed:
+            yield encode_event(RESET_EVENT, {"reason": "client fell behind"})
+            return
+        frame = subscription.get(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+        yield frame if frame is not None else b": keep-alive\n\n"
+
+
+def _event_id(change: Dict[str, Any]) -> Optional[str]:
+    token = change.get("_id")
+    return token.get("_data") if isinstance(token, dict) else None
+
+def _pick(document: Dict[str, Any], fields) -> Dict[str, Any]:
+    return {field: document[field] for field in fields if field in document}
+
+def listing_event(change: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+    """Map a listing change to an (event type, data) pair."""
+    document = change.get("fullDocument") or {}
+    data = _pick(document, LISTING_EVENT_FIELDS)
+    operation = change["operationType"]
+    if operation == "delete" or not document:
+        return "listing.removed", {"id": str(change.get("documentKey", {}).get("_id"))}
+    updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if operation == "insert" or "status" in updated or operation == "replace":
+        event_type = LISTING_STATUS_EVENTS.get(document.get("status"))
+        if event_type is not None:
+            return event_type, data
+    return "listing.updated", data
+
+def nft_event(change: Dict[str, Any]) -> Optional[Tuple[str, Dict[str, Any]]]:
+    """Map an NFT change to an (event type, data) pair, or None to skip it."""
+    document = change.get("fullDocument") or {}
+    updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if change["operationType"] == "insert":
+        return "nft.minted", _pick(document, NFT_EVENT_FIELDS)
+    if "account" in updated:
+        return "nft.transferred", _pick(document, NFT_EVENT_FIELDS)
+    return None
+
+
+# Broker shared by the stream clients of this process
+broker = EventBroker(
+    buffer_size=int(os.getenv("STREAM_REPLAY_EVENTS", 1000)),
+    client_buffer=int(os.getenv("STREAM_CLIENT_BUFFER", 100)),
+    max_clients=stream_capacity(
+        int(os.getenv("GUNICORN_THREADS", 4)),
+        limit=int(os.getenv("STREAM_MAX_CLIENTS", 100))
+    )
+)
+
+def _publish_listing_change(change: Dict[str, Any]) -> None:
+    broker.publish(*listing_event(change), event_id=_event_id(change))
+
+def _publish_nft_change(change: Dict[str, Any]) -> None:
+    event = nft_event(change)
+    if event is not None:
+        broker.publish(*event, event_id=_event_id(change))
+
+add_change_listener("marketplace_listings", _publish_listing_change)
+add_change_listener("nfts", _publish_nft_change)
+add_reset_listener(broker.reset)
@@ -0,0 +1,129 @@
+"""Streaming NDJSON exports of the marketplace collections
+
+Documents are read through a server-side cursor, encoded one per line and
+yielded in chunks, so an export holds at most one cursor batch and one
+output chunk in memory whatever the size of the collection.
+"""
+from typing import Any, Dict, Iterable, Iterator, Optional
+import base64
+from datetime import datetime
+from decimal import Decimal
+import json
+import os
+import zlib
+from bson import ObjectId
+from pymongo import ReadPreference
+from .database import get_db
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements
+    orjson = None
+
+# Exported names and their collection and projection
+EXPORTS: Dict[str, Dict[str, Any]] = {
+    "nfts": {"collection": "nfts", "projection": None},
+    "listings": {"collection": "marketplace_listings", "projection": {"search_text": 0}},
+    "offers": {"collection": "nft_offers", "projection": None},
+    "transactions": {"collection": "nft_transactions", "projection": None}
+}
+
+# Documents fetched per cursor round trip
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+# Encoded lines are buffered up to this size before being yielded
+CHUNK_SIZE = 64 * 1024
+
+GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", 6))
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return base64.b64encode(bytes(obj)).decode("ascii")
+    if isinstance(obj, Decimal):
+        return str(obj)
+    # Only reached without orjson; naive datetimes are stored in UTC
+    if isinstance(obj, datetime):
+        return obj.isoformat() + ("+00:00" if obj.tzinfo is None else "")
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def encode_line(document: Dict[str, Any]) -> bytes:
+    """Encode a document as one NDJSON line."""
+    if orjson is not None:
+        return orjson.dumps(document, default=_default, option=orjson.OPT_NAIVE_UTC | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(document, default=_default) + "\n").encode("utf-8")
+
+def iter_documents(
+    name: str,
+    after: Optional[str] = None,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[Dict[str, Any]]:
+    """Iterate over an exported collection in _id order.
+
+    Reads prefer a secondary, so large exports do not compete with the
+    application for the primary.
+
+    Args:
+        name: One of EXPORTS
+        after: Only documents with a greater _id, to resume an export
+        batch_size: Documents fetched per cursor round trip
+
+    Raises:
+        ValueError: If the export or the after id is unknown
+    """
+    export = EXPORTS.get(name)
+    if export is None:
+        raise ValueError(f"Unknown export: {name}")
+    query: Dict[str, Any] = {}
+    if after:
+        try:
+            query["_id"] = {"$gt": ObjectId(after)}
+        except Exception:
+            raise ValueError("after must be a document _id")
+    collection = get_db()[export["collection"]].with_options(
+        read_preference=ReadPreference.SECONDARY_PREFERRED
+    )
+    with collection.find(query, export["projection"], sort=[("_id", 1)], batch_size=batch_size) as cursor:
+        yield from cursor
+
+def iter_ndjson(documents: Iterable[Dict[str, Any]], chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Encode documents as NDJSON, yielded in chunks of about chunk_size bytes."""
+    buffer = bytearray()
+    for document in documents:
+        buffer += encode_line(document)
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
+
+def iter_gzip(chunks: Iterable[bytes], level: int = GZIP_LEVEL) -> Iterator[bytes]:
+    """Compress a stream of chunks into a single gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_ndjson(
+    name: str,
+    after: Optional[str] = None,
+    compress: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE
+) -> Iterator[bytes]:
+    """Stream a collection as NDJSON, optionally gzip compressed.
+
+    The export and after id are checked before the first chunk is
+    requested, so errors can still be reported with a status code.
+
+    Raises:
+        ValueError: If the export or the after id is unknown
+    """
+    if name not in EXPORTS:
+        raise ValueError(f"Unknown export: {name}")
+    if after and not ObjectId.is_valid(after):
+        raise ValueError("after must be a document _id")
+    chunks = iter_ndjson(iter_documents(name, after=after, batch_size=batch_size))
+    return iter_gzip(chunks) if compress else chunks
@@ -0,0 +1,125 @@
+"""Health checks and warm-up for worker processes"""
+from typing import Dict, Any, List
+import logging
+import os
+import threading
+import time
+from .database import get_db
+from .mongodb_service import metadata_cache, load_metadata, verify_metadata_document
+from .xrpl_service import get_client
+
+logger = logging.getLogger(__name__)
+
+# Set once the worker has been asked to shut down
+_draining = threading.Event()
+
+def mark_draining() -> None:
+    """Report the worker as not ready so load balancers stop routing to it"""
+    _draining.set()
+
+def is_draining() -> bool:
+    """Whether the worker is shutting down"""
+    return _draining.is_set()
+
+def _timed_check(name: str, check, max_latency_ms: float) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        check()
+    except Exception as e:
+        return {"ok": False, "error": f"{name} check failed: {str(e)}"}
+    latency_ms = (time.perf_counter() - start) * 1000
+    return {
+        "ok": latency_ms <= max_latency_ms,
+        "latency_ms": round(latency_ms, 2)
+    }
+
+def check_mongodb() -> Dict[str, Any]:
+    """Ping MongoDB and report the round trip latency"""
+    max_latency_ms = float(os.getenv("READY_MONGODB_MAX_MS", 500))
+    return _timed_check("MongoDB", lambda: get_db().command("ping"), max_latency_ms)
+
+def check_xrpl() -> Dict[str, Any]:
+    """Query the XRPL node's server_info and report the round trip latency"""
+    max_latency_ms = float(os.getenv("READY_XRPL_MAX_MS", 2000))
+
+    def server_info():
+        from xrpl.models.requests import ServerInfo
+        response = get_client().request(ServerInfo())
+        if not response.is_successful():
+            raise ValueError(response.result.get("error_message") or response.result.get("error"))
+
+    return _timed_check("XRPL", server_info, max_latency_ms)
+
+def check_readiness() -> Dict[str, Any]:
+    """Check every dependency needed to serve requests
+
+    Returns:
+        Dict with the overall "ready" flag and the result of each check
+    """
+    checks = {
+        "mongodb": check_mongodb(),
+        "xrpl": check_xrpl()
+    }
+    return {
+        "ready": not is_draining() and all(check["ok"] for check in checks.values()),
+        "draining": is_draining(),
+        "checks": checks
+    }
+
+def warm_metadata_cache(limit: int) -> int:
+    """Load the metadata of the most recent active listings into the cache
+    
+    Args:
+        limit: Maximum number of listings to warm
+        
+    Returns:
+        Number of metadata documents cached
+    """
+    try:
+        db = get_db()
+        hashes: List[str] = [
+            listing["metadata_hash"]
+            for listing in db.marketplace_listings.find(
+                {"status": "active"}, {"_id": 0, "metadata_hash": 1}
+            ).sort("created_at", -1).limit(limit)
+            if listing.get("metadata_hash")
+        ]
+        if not hashes:
+            return 0
+        cached = 0
+        for result in db.nft_metadata.find({"metadata_hash": {"$in": hashes}}):
+            metadata_hash = result["metadata_hash"]
+            if not verify_metadata_document(result):
+                continue
+            metadata_cache.set(metadata_hash, {
+                "metadata": load_metadata(result),
+                "metadata_hash": metadata_hash,
+                "verified": True
+            })
+            cached += 1
+        return cached
+    except Exception as e:
+        raise ValueError(f"Failed to warm metadata cache: {str(e)}")
+
+def warm_up() -> Dict[str, Any]:
+    """Open connections and fill caches before the worker accepts traffic
+
+    Failures are logged and reported rather than raised, so a dependency
+    that is briefly unavailable does not stop the worker from starting;
+    the readiness check keeps reporting it until it recovers.
+    """
+    start = time.perf_counter()
+    report = check_readiness()["checks"]
+    try:
+        report["metadata_cache"] = warm_metadata_cache(int(os.getenv("WARM_METADATA_LISTINGS", 200)))
+    except ValueError as e:
+        logger.warning("%s", e)
+        report["metadata_cache"] = 0
+    for name in ("mongodb", "xrpl"):
+        if not report[name]["ok"]:
+            logger.warning("Warm-up: %s not ready: %s", name, report[name])
+    logger.info(
+        "Worker %d warmed up in %.0f ms, %d metadata documents cached",
+        os.getpid(), (time.perf_counter() - start) * 1000, report["metadata_cache"]
+    )
+    return report
@@ -0,0 +1,338 @@
+"""Uploaded NFT images and their thumbnails
+
+Uploads are streamed into GridFS chunks as they arrive, with their size,
+type and content hash checked on the way, so a large image is never held
+several times in a worker's memory.
+
+Listing cards and portfolios only need small images, so every uploaded
+image gets a few derivatives, keyed by size name, next to the original.
+They are generated in a process pool once the upload has been stored, so
+the decode and resize work neither blocks the request nor holds the GIL of
+the worker serving it; pool processes read the original from MongoDB
+themselves, only the image ID is sent to them. Until they are ready,
+readers fall back to the original image.
+"""
+from typing import Any, Dict, Iterable, Optional
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import base64
+import hashlib
+import io
+import logging
+import multiprocessing
+import os
+import threading
+import uuid
+from gridfs import GridFSBucket, GridOut
+from gridfs.errors import NoFile
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+DERIVATIVE_COLLECTION = "nft_image_derivatives"
+
+# GridFS bucket of streamed uploads (nft_image_files.files and .chunks)
+UPLOAD_BUCKET = "nft_image_files"
+
+IMAGE_UPLOAD_MAX_BYTES = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", 10 * 1024 * 1024))
+
+# Leading bytes of the accepted formats; WebP is RIFF....WEBP
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif")
+)
+
+# Bytes needed to recognize every accepted format
+SIGNATURE_LENGTH = 12
+
+# Size name -> longest edge in pixels, largest first
+DERIVATIVE_SIZES = {
+    "medium": 768,
+    "small": 256
+}
+
+# Size name returned for the full resolution upload
+ORIGINAL_SIZE = "original"
+
+DERIVATIVE_QUALITY = int(os.getenv("IMAGE_DERIVATIVE_QUALITY", 80))
+
+# Processes generating derivatives in each worker; 0 disables them
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", 2))
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+class ImageTooLarge(ValueError):
+    """The upload exceeds IMAGE_UPLOAD_MAX_BYTES"""
+
+
+class UnsupportedImageType(ValueError):
+    """The upload is not one of the accepted image formats"""
+
+
+def sniff_content_type(head: bytes) -> Optional[str]:
+    """Identify an accepted image format from its first bytes."""
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    for signature, content_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    return None
+
+def _bucket() -> GridFSBucket:
+    return GridFSBucket(get_db(), bucket_name=UPLOAD_BUCKET)
+
+def store_image_stream(chunks: Iterable[bytes], max_bytes: int = IMAGE_UPLOAD_MAX_BYTES) -> Dict[str, Any]:
+    """Store an image from a stream of chunks as they arrive.
+
+    The format is checked on the first bytes and the size on every chunk,
+    so a rejected upload stops being read right away and its stored chunks
+    are deleted. An image identical to a previous upload is not stored
+    twice: the ID of the earlier copy is returned.
+
+    Returns:
+        Dict with image_id, content_type, size and sha256
+
+    Raises:
+        ImageTooLarge: If the image exceeds max_bytes
+        UnsupportedImageType: If the image is not PNG, JPEG, GIF or WebP
+    """
+    bucket = _bucket()
+    image_id = str(uuid.uuid4())
+    digest = hashlib.sha256()
+    head = b""
+    content_type = None
+    upload = None
+    size = 0
+    try:
+        for chunk in chunks:
+            if size + len(head) + len(chunk) > max_bytes:
+                raise ImageTooLarge(f"Image exceeds {max_bytes} bytes")
+            if upload is None:
+                head += chunk
+                if len(head) < SIGNATURE_LENGTH:
+                    continue
+                content_type = sniff_content_type(head)
+                if content_type is None:
+                    raise UnsupportedImageType("Image must be PNG, JPEG, GIF or WebP")
+                upload = bucket.open_upload_stream(
+                    image_id,
+                    metadata={"image_id": image_id, "content_type": content_type}
+                )
+                chunk, head = head, b""
+            digest.update(chunk)
+            upload.write(chunk)
+            size += len(chunk)
+        if upload is None:
+            raise UnsupportedImageType("Image is empty or truncated")
+        sha256 = digest.hexdigest()
+        existing = get_db()[f"{UPLOAD_BUCKET}.files"].find_one({"sha256": sha256}, {"filename": 1})
+        if existing is not None:
+            # The file document is only written on close, drop the chunks
+            upload.abort()
+            image_id = existing["filename"]
+        else:
+            upload.sha256 = sha256
+            upload.close()
+            schedule_derivatives(image_id)
+    except BaseException:
+        if upload is not None and not upload.closed:
+            upload.abort()
+        raise
+    return {"image_id": image_id, "content_type": content_type, "size": size, "sha256": sha256}
+
+def open_uploaded_image(image_id: str) -> Optional[GridOut]:
+    """Open a streamed upload for reading, or None if there is none."""
+    try:
+        return _bucket().open_download_stream_by_name(image_id)
+    except NoFile:
+        return None
+
+def render_derivatives(image_bytes: bytes, quality: int = DERIVATIVE_QUALITY) -> Dict[str, Dict[str, Any]]:
+    """Decode an image once and encode it at every derivative size.
+
+    Runs in the pool processes. WebP is used when Pillow supports it, JPEG
+    otherwise; each size is scaled down from the previous one, and JPEG
+    uploads are decoded at a reduced scale straight away.
+
+    Returns:
+        Dict of size name to {"content_type", "width", "height", "data"}
+    """
+    from PIL import Image, ImageOps, features
+
+    webp = features.check("webp")
+    image = Image.open(io.BytesIO(image_bytes))
+    largest = max(DERIVATIVE_SIZES.values())
+    image.draft("RGB", (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ("RGB", "RGBA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("LA", "PA") else "RGB")
+
+    derivatives = {}
+    for size, edge in sorted(DERIVATIVE_SIZES.items(), key=lambda item: -item[1]):
+        image = image.copy()
+        image.thumbnail((edge, edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        if webp:
+            image.save(output, "WEBP", quality=quality, method=4)
+            content_type = "image/webp"
+        else:
+            image.convert("RGB").save(output, "JPEG", quality=quality, optimize=True, progressive=True)
+            content_type = "image/jpeg"
+        derivatives[size] = {
+            "content_type": content_type,
+            "width": image.width,
+            "height": image.height,
+            "data": output.getvalue()
+        }
+    return derivatives
+
+def render_stored_derivatives(image_id: str, quality: int = DERIVATIVE_QUALITY) -> Dict[str, Dict[str, Any]]:
+    """Read an original from the database and render its derivatives.
+
+    Runs in the pool processes, which connect to MongoDB on their own.
+
+    Raises:
+        ValueError: If no image has this ID
+    """
+    upload = open_uploaded_image(image_id)
+    if upload is not None:
+        with upload:
+            image_bytes = upload.read()
+    else:
+        image = get_db().nft_images.find_one({"image_id": image_id}, {"_id": 0, "data": 1})
+        if image is None:
+            raise ValueError(f"Image not found: {image_id}")
+        image_bytes = base64.b64decode(image["data"])
+    return render_derivatives(image_bytes, quality)
+
+def _get_pool() -> Optional[ProcessPoolExecutor]:
+    """Pool of the current process, created on first use."""
+    global _pool, _pool_pid
+    if IMAGE_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            # Forking a threaded server is unsafe, start clean interpreters
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pool_pid = os.getpid()
+        return _pool
+
+def close_image_pool(wait: bool = True) -> None:
+    """Shut down the pool of this process, waiting for pending images."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        pool, _pool = _pool, None
+        owned = _pool_pid == os.getpid()
+        _pool_pid = None
+    if pool is not None and owned:
+        pool.shutdown(wait=wait)
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is pool:
+            _pool, _pool_pid = None, None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+def store_derivatives(image_id: str, derivatives: Dict[str, Dict[str, Any]]) -> None:
+    """Store the derivatives of an image, replacing older ones."""
+    collection = get_db()[DERIVATIVE_COLLECTION]
+    now = datetime.utcnow()
+    for size, derivative in derivatives.items():
+        collection.replace_one(
+            {"image_id": image_id, "size": size},
+            {"image_id": image_id, "size": size, **derivative, "created_at": now},
+            upsert=True
+        )
+
+def schedule_derivatives(image_id: str) -> Optional[Future]:
+    """Generate and store the derivatives of an image in the background.
+
+    Args:
+        image_id: ID of the stored original, inline or streamed
+
+    Returns:
+        The pending job, or None when derivatives are disabled
+    """
+    pool = _get_pool()
+    if pool is None:
+        return None
+    try:
+        future = pool.submit(render_stored_derivatives, image_id)
+    except BrokenProcessPool:
+        # A pool process died, e.g. killed for memory; start a new pool
+        _discard_pool(pool)
+        try:
+            future = _get_pool().submit(render_stored_derivatives, image_id)
+        except Exception:
+            logger.exception("Failed to schedule derivatives of image %s", image_id)
+            return None
+
+    def done(future: Future) -> None:
+        try:
+            store_derivatives(image_id, future.result())
+        except Exception:
+            logger.exception("Failed to generate derivatives of image %s", image_id)
+
+    future.add_done_callback(done)
+    return future
+
+def backfill_derivatives(window: int = 8) -> int:
+    """Generate the derivatives of images uploaded before they existed.
+
+    At most window images are decoded at once, so memory stays bounded.
+
+    Returns:
+        int: Number of images processed
+    """
+    pool = _get_pool()
+    if pool is None:
+        raise ValueError("Image derivatives are disabled (IMAGE_WORKERS=0)")
+    db = get_db()
+    done = set(db[DERIVATIVE_COLLECTION].distinct("image_id", {"size": min(DERIVATIVE_SIZES, key=DERIVATIVE_SIZES.get)}))
+    pending = []
+    processed = 0
+    for image in db.nft_images.find({}, {"_id": 0, "image_id": 1}):
+        if image["image_id"] in done:
+            continue
+        pending.append((image["image_id"], pool.submit(render_stored_derivatives, image["image_id"])))
+        if len(pending) >= window:
+            processed += _store_pending(pending)
+    return processed + _store_pending(pending)
+
+def _store_pending(pending) -> int:
+    stored = 0
+    for image_id, future in pending:
+        try:
+            store_derivatives(image_id, future.result())
+            stored += 1
+        except Exception:
+            logger.exception("Failed to generate derivatives of image %s", image_id)
+    pending.clear()
+    return stored
+
+def get_image_derivative(image_id: str, size: str) -> Optional[Dict[str, Any]]:
+    """Get a derivative of an image, or None if it was not generated (yet).
+
+    Raises:
+        ValueError: If size is not a derivative size
+    """
+    if size not in DERIVATIVE_SIZES:
+        raise ValueError(f"Invalid image size: {size}")
+    return get_db()[DERIVATIVE_COLLECTION].find_one({"image_id": image_id, "size": size}, {"_id": 0})
+
+def ensure_image_indexes(db) -> None:
+    """Create the indexes used to look uploads and derivatives up."""
+    db[f"{UPLOAD_BUCKET}.files"].create_index([("filename", 1), ("uploadDate", 1)])
+    db[f"{UPLOAD_BUCKET}.files"].create_index("sha256")
+    db[f"{UPLOAD_BUCKET}.chunks"].create_index([("files_id", 1), ("n", 1)], unique=True)
+    db[DERIVATIVE_COLLECTION].create_index([("image_id", 1), ("size", 1)], unique=True)
@@ -0,0 +1,106 @@
+"""JSON schemas of NFT metadata, per asset type
+
+Metadata is stored as sent and rendered by clients, so it is checked when a
+mint template is requested. Each asset type has a schema extending the
+fields shared by all NFTs; unknown asset types are checked against the
+shared fields only.
+
+Schemas are compiled into Python functions when this module is imported,
+so checking a document costs a few microseconds on the request path.
+"""
+from typing import Any, Callable, Dict
+import copy
+import fastjsonschema
+
+# Fields every NFT may have, none required; other fields are allowed
+BASE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "minLength": 1, "maxLength": 200},
+        "asset_type": {"type": "string", "minLength": 1},
+        "description": {"type": "string"},
+        "location": {"type": "string", "maxLength": 500},
+        "documentation_id": {"type": "string", "maxLength": 200},
+        "image_id": {"type": "string", "maxLength": 64},
+        "documents": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["name"],
+                "properties": {
+                    "name": {"type": "string", "minLength": 1},
+                    "sha256": {"type": "string", "pattern": "^[0-9a-f]{64}$"}
+                }
+            }
+        }
+    }
+}
+
+# Asset type -> required and additional properties, see README Asset Types
+ASSET_TYPE_FIELDS: Dict[str, Dict[str, Any]] = {
+    "Real Estate": {
+        "required": ["location"],
+        "properties": {
+            "location": {"type": "string", "minLength": 1, "maxLength": 500},
+            "square_footage": {"type": "number", "exclusiveMinimum": 0},
+            "amenities": {"type": "array", "items": {"type": "string"}}
+        }
+    },
+    "Fine Art": {
+        "required": ["artist"],
+        "properties": {
+            "artist": {"type": "string", "minLength": 1, "maxLength": 200},
+            "provenance": {"type": "string"},
+            "authentication": {"type": "string"}
+        }
+    },
+    "Vehicles": {
+        "required": ["vin"],
+        "properties": {
+            # 17 characters, I, O and Q excluded
+            "vin": {"type": "string", "pattern": "^[A-HJ-NPR-Z0-9]{17}$"},
+            "specifications": {"type": "object"},
+            "features": {"type": "array", "items": {"type": "string"}}
+        }
+    }
+}
+
+
+class InvalidMetadata(ValueError):
+    """Metadata does not match the schema of its asset type"""
+
+
+def build_schema(asset_type: str) -> Dict[str, Any]:
+    """Merge the fields of an asset type into the base schema."""
+    schema = copy.deepcopy(BASE_SCHEMA)
+    fields = ASSET_TYPE_FIELDS[asset_type]
+    schema["required"] = ["asset_type"] + fields["required"]
+    schema["properties"].update(fields["properties"])
+    schema["properties"]["asset_type"] = {"const": asset_type}
+    return schema
+
+
+# Compiled once per process
+_base_validator: Callable[[Any], Any] = fastjsonschema.compile(BASE_SCHEMA)
+_validators: Dict[str, Callable[[Any], Any]] = {
+    asset_type: fastjsonschema.compile(build_schema(asset_type))
+    for asset_type in ASSET_TYPE_FIELDS
+}
+
+
+def validate_metadata(metadata: Any) -> None:
+    """Check metadata against the schema of its asset type.
+
+    Args:
+        metadata: Metadata sent by the client
+
+    Raises:
+        InvalidMetadata: With the first invalid field, e.g.
+            "data.location must be string"
+    """
+    asset_type = metadata.get("asset_type") if isinstance(metadata, dict) else None
+    validator = _validators.get(asset_type, _base_validator) if isinstance(asset_type, str) else _base_validator
+    try:
+        validator(metadata)
+    except fastjsonschema.JsonSchemaValueException as e:
+        raise InvalidMetadata(f"Invalid metadata: {e.message}")
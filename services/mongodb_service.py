@@ -1,32 +1,154 @@
 """MongoDB service for NFT tracking"""
 from typing import Dict, Any, List, Tuple, Optional
-from pymongo import MongoClient
-import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import uuid
+import base64
 import json
 import hashlib
+import os
+import zlib
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+from .database import get_db, get_async_db
+from .cache import LRUCache
+from .change_watcher import change_watcher, watch_cache, add_change_listener
+from . import stats_service, price_history_service, image_service, reconcile_service
+from .write_behind import write_behind
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is listed in requirements
+    orjson = None
+
+# Metadata is content addressed, so a verified document never changes
+metadata_cache = LRUCache("metadata_by_hash", maxsize=int(os.getenv("METADATA_CACHE_SIZE", 4096)))
+
+# Mutable documents are only cached while the change watcher keeps them
+# up to date, see change_watcher
+listing_cache = watch_cache(LRUCache("listing_by_id", maxsize=int(os.getenv("LISTING_CACHE_SIZE", 4096))))
+version_cache = watch_cache(LRUCache("query_versions", maxsize=int(os.getenv("VERSION_CACHE_SIZE", 4096))))
+
+def _invalidate_listing(change: Dict[str, Any]) -> None:
+    """Drop cached state affected by a listing change."""
+    version_cache.invalidate("listings")
+    listing_id = (change.get("fullDocument") or {}).get("listing_id")
+    if listing_id is None:
+        # Deleted, the listing_id is no longer known
+        listing_cache.clear()
+    else:
+        listing_cache.invalidate(listing_id)
+
+def _invalidate_nft(change: Dict[str, Any]) -> None:
+    """Drop cached state affected by an NFT change."""
+    account = (change.get("fullDocument") or {}).get("account")
+    updated = (change.get("updateDescription") or {}).get("updatedFields") or {}
+    if account is None or "account" in updated:
+        # Deleted or transferred, the previous owner is not known
+        version_cache.clear()
+    else:
+        version_cache.invalidate(("account", account))
+
+add_change_listener("marketplace_listings", _invalidate_listing)
+add_change_listener("nfts", _invalidate_nft)
 
-def get_db():
-    """Get MongoDB database connection"""
-    mongo_uri = os.getenv("MONGODB_URI", "mongodb://localhost:27017/")
-    print(mongo_uri)
-    client = MongoClient(mongo_uri)
-    db_name = os.getenv("MONGODB_DB", "rwa")
-    print(db_name)
-    return client[db_name]
+# Canonical metadata larger than this is stored zlib compressed
+METADATA_COMPRESS_MIN_BYTES = int(os.getenv("METADATA_COMPRESS_MIN_BYTES", 1024))
+
+# Fields also stored decoded next to the canonical bytes, so listing
+# snapshots and queries can read them without decompressing
+METADATA_DECODED_FIELDS = ("title", "asset_type", "location", "image_id", "description")
+
+def canonical_metadata(metadata: Dict[str, Any]) -> bytes:
+    """Serialize metadata to the canonical bytes its hash is computed over."""
+    # Sort keys for consistent hashing
+    return json.dumps(metadata, sort_keys=True).encode()
+
+def hash_canonical_metadata(canonical: bytes) -> str:
+    """Hash canonical metadata bytes."""
+    return hashlib.sha256(canonical).hexdigest()[:16]
 
 def compute_metadata_hash(metadata: Dict[str, Any]) -> str:
     """Compute a deterministic hash of metadata."""
-    # Sort keys for consistent hashing
-    metadata_str = json.dumps(metadata, sort_keys=True)
-    return hashlib.sha256(metadata_str.encode()).hexdigest()[:16]
+    return hash_canonical_metadata(canonical_metadata(metadata))
 
 def verify_metadata(metadata_hash: str, metadata: Dict[str, Any]) -> bool:
     """Verify metadata integrity against its hash."""
     computed_hash = compute_metadata_hash(metadata)
     return computed_hash == metadata_hash
 
+def encode_metadata_document(metadata: Dict[str, Any]) -> Dict[str, Any]:
+    """Build the stored form of metadata.
+    
+    The canonical bytes are stored compressed above
+    METADATA_COMPRESS_MIN_BYTES and decoded when a reader needs the whole
+    document; the METADATA_DECODED_FIELDS are also stored as they are.
+    
+    Returns:
+        Dict[str, Any]: metadata_hash, metadata, canonical, encoding and size
+    """
+    canonical = canonical_metadata(metadata)
+    document = {
+        "metadata_hash": hash_canonical_metadata(canonical),
+        "metadata": {field: metadata[field] for field in METADATA_DECODED_FIELDS if field in metadata},
+        "size": len(canonical)
+    }
+    if len(canonical) >= METADATA_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(canonical, 6)
+        if len(compressed) < len(canonical):
+            document.update(canonical=compressed, encoding="zlib")
+            return document
+    document.update(canonical=canonical, encoding="identity")
+    return document
+
+def get_canonical_metadata(metadata_doc: Dict[str, Any]) -> bytes:
+    """Get the canonical bytes of a stored metadata document."""
+    canonical = metadata_doc.get("canonical")
+    if canonical is None:
+        # Stored before canonical bytes were, see compress_metadata_documents()
+        return canonical_metadata(metadata_doc["metadata"])
+    if metadata_doc.get("encoding") == "zlib":
+        return zlib.decompress(canonical)
+    return bytes(canonical)
+
+def load_metadata(metadata_doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Get the decoded metadata of a stored metadata document."""
+    if "canonical" not in metadata_doc:
+        return metadata_doc.get("metadata", {})
+    canonical = get_canonical_metadata(metadata_doc)
+    return orjson.loads(canonical) if orjson is not None else json.loads(canonical)
+
+def verify_metadata_document(metadata_doc: Dict[str, Any]) -> bool:
+    """Verify a stored metadata document against its hash.
+    
+    A hash over the stored bytes; only documents stored before canonical
+    bytes were are serialized again.
+    """
+    return hash_canonical_metadata(get_canonical_metadata(metadata_doc)) == metadata_doc["metadata_hash"]
+
+def build_projection(
+    fields: Optional[List[str]],
+    resolved: str = "metadata",
+    default: bool = True
+) -> Tuple[Optional[Dict[str, int]], bool]:
+    """Build a MongoDB projection for a sparse fieldset.
+    
+    Args:
+        fields: Requested top-level fields, or None for the full document
+        resolved: Field that is resolved from nft_metadata rather than stored
+        default: Whether the resolved field is looked up when no fieldset
+            is given
+        
+    Returns:
+        Tuple[Optional[Dict[str, int]], bool]: (projection, whether the
+        resolved field was requested and must be looked up)
+    """
+    if fields is None:
+        return None, default
+    projection = {field: 1 for field in fields}
+    if "_id" not in fields:
+        projection["_id"] = 0
+    return projection, resolved in fields
+
 def store_metadata(metadata: Dict[str, Any], image_data: Optional[str] = None) -> Tuple[str, str]:
     """Store metadata and optional image, returning hash and ID.
     
@@ -50,15 +172,13 @@ def store_metadata(metadata: Dict[str, Any], image_data: Optional[str] = None) -
             metadata['image_id'] = image_id
         
         # Generate hash and ID
-        metadata_hash = compute_metadata_hash(metadata)
         metadata_id = str(uuid.uuid4())
-        
         metadata_doc = {
             "metadata_id": metadata_id,
-            "metadata_hash": metadata_hash,
-            "metadata": metadata,
+            **encode_metadata_document(metadata),
             "created_at": datetime.utcnow()
         }
+        metadata_hash = metadata_doc["metadata_hash"]
         
         metadata_collection.insert_one(metadata_doc)
         return metadata_hash, metadata_id
@@ -67,6 +187,9 @@ def store_metadata(metadata: Dict[str, Any], image_data: Optional[str] = None) -
 
 def get_metadata_by_hash(metadata_hash: str) -> Dict[str, Any]:
     """Retrieve and verify metadata by its hash."""
+    cached = metadata_cache.get(metadata_hash)
+    if cached is not None:
+        return cached
     try:
         db = get_db()
         metadata_collection = db.nft_metadata
@@ -76,14 +199,43 @@ def get_metadata_by_hash(metadata_hash: str) -> Dict[str, Any]:
             raise ValueError(f"Metadata not found for hash: {metadata_hash}")
         
         # Verify integrity
-        if not verify_metadata(metadata_hash, result["metadata"]):
+        if not verify_metadata_document(result):
             raise ValueError("Metadata integrity check failed")
             
-        return {
-            "metadata": result["metadata"],
+        verified = {
+            "metadata": load_metadata(result),
             "metadata_hash": metadata_hash,
             "verified": True
         }
+        metadata_cache.set(metadata_hash, verified)
+        return verified
+    except Exception as e:
+        raise ValueError(f"Failed to retrieve metadata: {str(e)}")
+
+def get_metadata_json_by_hash(metadata_hash: str) -> bytes:
+    """Get the JSON body of get_metadata_by_hash() without decoding metadata.
+    
+    The verified canonical bytes are embedded as they are stored, so large
+    metadata is neither parsed nor serialized again.
+    """
+    key = ("canonical", metadata_hash)
+    cached = metadata_cache.get(key)
+    if cached is not None:
+        return cached
+    try:
+        result = get_db().nft_metadata.find_one({"metadata_hash": metadata_hash})
+        if not result:
+            raise ValueError(f"Metadata not found for hash: {metadata_hash}")
+        canonical = get_canonical_metadata(result)
+        if hash_canonical_metadata(canonical) != metadata_hash:
+            raise ValueError("Metadata integrity check failed")
+        body = b"".join([
+            b'{"metadata":', canonical,
+            b',"metadata_hash":', json.dumps(metadata_hash).encode(),
+            b',"verified":true}'
+        ])
+        metadata_cache.set(key, body)
+        return body
     except Exception as e:
         raise ValueError(f"Failed to retrieve metadata: {str(e)}")
 
@@ -99,11 +251,11 @@ def get_metadata_by_id(metadata_id: str) -> Dict[str, Any]:
             
         # Verify integrity
         metadata_hash = result["metadata_hash"]
-        verified = verify_metadata(metadata_hash, result["metadata"])
+        verified = verify_metadata_document(result)
 
             
         return {
-            "metadata": result["metadata"],
+            "metadata": load_metadata(result),
             "metadata_hash": metadata_hash,
             "verified": verified
         }
@@ -135,32 +287,40 @@ def track_nft_mint(
             "metadata_hash": metadata_hash
         }
 
+        now = datetime.utcnow()
         nft_data = {
             "nft_id": nft_id,
             "account": account,
             "uri": uri,
             "transaction_hash": transaction_hash,
             "metadata": platform_metadata,
-            "created_at": datetime.utcnow(),
+            "created_at": now,
+            "updated_at": now,
             "status": "minted"
         }
 
-        result = nft_collection.insert_one(nft_data)
-        nft_data["_id"] = str(result.inserted_id)
+        nft_collection.insert_one(nft_data)
         return nft_data
     except Exception as e:
         raise ValueError(f"Failed to track NFT in database: {str(e)}")
 
-def get_account_nfts(account: str) -> List[Dict[str, Any]]:
-    """Get all NFTs minted by an account through our platform"""
+def get_account_nfts(account: str, fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Get all NFTs minted by an account through our platform
+    
+    Args:
+        account: XRPL account address
+        fields: Optional list of fields to return. Full metadata is only
+            resolved when "metadata" is requested.
+    """
     try:
         db = get_db()
         nft_collection = db.nfts
         
-        nfts = list(nft_collection.find({"account": account}))
-        # Convert ObjectId to string for JSON serialization
+        projection, include_metadata = build_projection(fields)
+        nfts = list(nft_collection.find({"account": account}, projection))
+        if not include_metadata:
+            return nfts
         for nft in nfts:
-            nft["_id"] = str(nft["_id"])
             # Fetch full metadata for each NFT
             if "metadata" in nft and "metadata_id" in nft["metadata"]:
                 try:
@@ -176,6 +336,65 @@ def get_account_nfts(account: str) -> List[Dict[str, Any]]:
     except Exception as e:
         raise ValueError(f"Failed to retrieve NFTs from database: {str(e)}")
 
+def get_account_nfts_version(account: str) -> Dict[str, Any]:
+    """Get the count and latest change time of an account's NFTs.
+
+    Used to build cache validators without loading the NFTs themselves.
+    """
+    def load():
+        result = list(get_db().nfts.aggregate([
+            {"$match": {"account": account}},
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "updated_at": {"$max": {"$ifNull": ["$updated_at", "$created_at"]}}
+            }}
+        ]))
+        if not result:
+            return {"count": 0, "updated_at": None}
+        return {"count": result[0]["count"], "updated_at": result[0]["updated_at"]}
+
+    try:
+        return change_watcher.cached(version_cache, ("account", account), load)
+    except Exception as e:
+        raise ValueError(f"Failed to get NFTs version: {str(e)}")
+
+def get_account_nft_changes(address: str, since: Optional[str] = None, limit: int = 500) -> Dict[str, Any]:
+    """Get the NFTs of an account that changed after a sync token.
+
+    NFTs the account still owns are returned with their platform metadata
+    reference; the full metadata is content addressed and can be fetched
+    by hash only when it is new to the client. NFTs transferred away are
+    returned as tombstones with "removed" set.
+
+    Args:
+        address: XRPL account address
+        since: Token returned by the previous call
+        limit: Maximum number of changes to return
+
+    Returns:
+        Dict with the changes, the next token and whether more changes are
+        available right away
+    """
+    try:
+        nfts, token, has_more = _changes_since(
+            get_db().nfts,
+            {"$or": [{"account": address}, {"former_accounts": address}]},
+            since,
+            limit,
+            {"former_accounts": 0}
+        )
+        changes = []
+        for nft in nfts:
+            nft.pop("_id")
+            if nft.get("account") == address:
+                changes.append(nft)
+            else:
+                changes.append({"nft_id": nft["nft_id"], "updated_at": nft["updated_at"], "removed": True})
+        return {"changes": changes, "next": token, "has_more": has_more}
+    except Exception as e:
+        raise ValueError(f"Failed to get NFT changes: {str(e)}")
+
 def update_nft_status(transaction_hash: str, status: str) -> Dict[str, Any]:
     """Update NFT status in database"""
     try:
@@ -194,6 +413,47 @@ def update_nft_status(transaction_hash: str, status: str) -> Dict[str, Any]:
     except Exception as e:
         raise ValueError(f"Failed to update NFT status: {str(e)}")
 
+# Metadata fields copied onto listings at creation time
+LISTING_SUMMARY_FIELDS = ("title", "asset_type", "location", "image_id")
+
+# Listing fields only used for querying, never returned to clients
+LISTING_HIDDEN_FIELDS = {"search_text": 0}
+
+def get_listing_snapshot(metadata_hash: str) -> Dict[str, Any]:
+    """Build the denormalized listing fields for a metadata hash.
+    
+    Metadata is content addressed, so the snapshot never goes stale and can
+    be stored on the listing once.
+    
+    Returns:
+        Dict[str, Any]: asset_type, summary and search_text fields
+    """
+    metadata_collection = get_db().nft_metadata
+    metadata_doc = metadata_collection.find_one(
+        {"metadata_hash": metadata_hash},
+        {
+            "_id": 0,
+            "metadata.description": 1,
+            **{f"metadata.{field}": 1 for field in LISTING_SUMMARY_FIELDS}
+        }
+    )
+    if metadata_doc is None:
+        metadata = {}
+    elif "metadata" in metadata_doc:
+        metadata = metadata_doc["metadata"]
+    else:
+        # Stored with the canonical bytes only, see compress_metadata_documents()
+        metadata = load_metadata(metadata_collection.find_one(
+            {"metadata_hash": metadata_hash},
+            {"_id": 0, "canonical": 1, "encoding": 1}
+        ))
+    summary = {field: metadata.get(field) for field in LISTING_SUMMARY_FIELDS}
+    return {
+        "asset_type": summary["asset_type"],
+        "summary": summary,
+        "search_text": metadata.get("description") or ""
+    }
+
 def create_listing(
     nft_id: str,
     seller_address: str,
@@ -213,32 +473,112 @@ def create_listing(
         if existing:
             raise ValueError(f"NFT {nft_id} is already listed for sale")
         
+        # Snapshot the fields listing cards and search need so the listings
+        # feed can be served without joining nft_metadata
+        snapshot = get_listing_snapshot(metadata_hash)
+        
         listing = {
             "listing_id": str(uuid.uuid4()),
             "nft_id": nft_id,
             "seller_address": seller_address,
             "price_drops": int(price_xrp * 1_000_000),  # Convert XRP to drops
             "metadata_hash": metadata_hash,
+            **snapshot,
             "status": "active",
             "created_at": datetime.utcnow(),
             "updated_at": datetime.utcnow()
         }
         
-        result = listing_collection.insert_one(listing)
-        listing["_id"] = str(result.inserted_id)
+        listing_collection.insert_one(listing)
+        listing.pop("search_text")
+        stats_service.record_listing_opened(listing)
         return listing
     except Exception as e:
         raise ValueError(f"Failed to create listing: {str(e)}")
 
-def get_active_listings() -> List[Dict[str, Any]]:
-    """Get all active marketplace listings"""
+# Supported listing sort orders, each backed by a (status, ...) index
+LISTING_SORTS = {
+    "price": [("price_drops", 1)],
+    "-price": [("price_drops", -1)],
+    "newest": [("created_at", -1)],
+    "oldest": [("created_at", 1)],
+}
+
+def build_listing_query(
+    filters: Optional[Dict[str, Any]] = None,
+    status: str = "active"
+) -> Dict[str, Any]:
+    """Build the MongoDB query for listings matching the filters.
+    
+    Args:
+        filters: Optional dictionary with any of asset_type, seller_address,
+            min_price_drops, max_price_drops, created_after, created_before
+        status: Listing status to match
+    """
+    query = {"status": status}
+    if not filters:
+        return query
+        
+    if filters.get("asset_type"):
+        query["asset_type"] = filters["asset_type"]
+    if filters.get("seller_address"):
+        query["seller_address"] = filters["seller_address"]
+        
+    price_range = {}
+    if filters.get("min_price_drops") is not None:
+        price_range["$gte"] = int(filters["min_price_drops"])
+    if filters.get("max_price_drops") is not None:
+        price_range["$lte"] = int(filters["max_price_drops"])
+    if price_range:
+        query["price_drops"] = price_range
+        
+    created_range = {}
+    if filters.get("created_after") is not None:
+        created_range["$gte"] = filters["created_after"]
+    if filters.get("created_before") is not None:
+        created_range["$lte"] = filters["created_before"]
+    if created_range:
+        query["created_at"] = created_range
+        
+    return query
+
+def get_active_listings(
+    fields: Optional[List[str]] = None,
+    filters: Optional[Dict[str, Any]] = None,
+    sort: Optional[str] = None,
+    include_metadata: bool = False
+) -> List[Dict[str, Any]]:
+    """Get all active marketplace listings
+    
+    Listings carry a summary of their metadata; the full metadata is only
+    looked up when include_metadata is set or "metadata" is in fields.
+    
+    Args:
+        fields: Optional list of fields to return
+        filters: Optional filters, see build_listing_query()
+        sort: Optional sort order, one of LISTING_SORTS
+        include_metadata: Resolve the full metadata of each listing
+    """
     try:
         db = get_db()
         listing_collection = db.marketplace_listings
         
-        listings = list(listing_collection.find({"status": "active"}))
+        if sort is not None and sort not in LISTING_SORTS:
+            raise ValueError(f"Invalid sort: {sort}")
+        
+        projection, requested = build_projection(fields, default=False)
+        include_metadata = include_metadata or requested
+        if projection is None:
+            projection = dict(LISTING_HIDDEN_FIELDS)
+        elif include_metadata:
+            projection["metadata_hash"] = 1
+        cursor = listing_collection.find(build_listing_query(filters), projection)
+        if sort is not None:
+            cursor = cursor.sort(LISTING_SORTS[sort])
+        listings = list(cursor)
+        if not include_metadata:
+            return listings
         for listing in listings:
-            listing["_id"] = str(listing["_id"])
             # Get NFT metadata
             try:
                 metadata_result = get_metadata_by_hash(listing["metadata_hash"])
@@ -250,17 +590,215 @@ def get_active_listings() -> List[Dict[str, Any]]:
     except Exception as e:
         raise ValueError(f"Failed to get listings: {str(e)}")
 
-def get_listing(listing_id: str) -> Dict[str, Any]:
-    """Get a specific listing by ID"""
+def search_listings(
+    text: str,
+    status: str = "active",
+    filters: Optional[Dict[str, Any]] = None,
+    page: int = 1,
+    per_page: int = 20
+) -> Dict[str, Any]:
+    """Full-text search over listing titles, locations and descriptions.
+    
+    Backed by the (status, text) compound index, so every search is scoped
+    to a single listing status. Results are ranked by relevance.
+    
+    Args:
+        text: Search terms, MongoDB $text syntax (phrases, negations)
+        status: Listing status to search in
+        filters: Optional filters, see build_listing_query()
+        page: 1-based page number
+        per_page: Results per page
+        
+    Returns:
+        Dict[str, Any]: results, total, page and per_page
+    """
     try:
         db = get_db()
         listing_collection = db.marketplace_listings
         
-        listing = listing_collection.find_one({"listing_id": listing_id})
+        query = build_listing_query(filters, status=status)
+        query["$text"] = {"$search": text}
+        
+        cursor = listing_collection.find(
+            query,
+            {**LISTING_HIDDEN_FIELDS, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})]).skip((page - 1) * per_page).limit(per_page)
+        
+        return {
+            "results": list(cursor),
+            "total": listing_collection.count_documents(query),
+            "page": page,
+            "per_page": per_page
+        }
+    except Exception as e:
+        raise ValueError(f"Failed to search listings: {str(e)}")
+
+def get_listings_version() -> Dict[str, Any]:
+    """Get the active listing count and latest listing change time.
+
+    Any listing change (creation, cancellation, sale) bumps updated_at, so
+    this is enough to tell whether the active listings feed changed.
+    """
+    def load():
+        listing_collection = get_db().marketplace_listings
+        latest = listing_collection.find_one(
+            {},
+            projection={"_id": 0, "updated_at": 1},
+            sort=[("updated_at", -1)]
+        )
+        return {
+            "count": listing_collection.count_documents({"status": "active"}),
+            "updated_at": latest.get("updated_at") if latest else None
+        }
+
+    try:
+        return change_watcher.cached(version_cache, "listings", load)
+    except Exception as e:
+        raise ValueError(f"Failed to get listings version: {str(e)}")
+
+# Changes newer than this are not returned yet: updated_at is set by the
+# application servers, so a write can land with a slightly older timestamp
+# than one already read. Waiting for it to settle keeps tokens from
+# skipping over such writes.
+CHANGES_SETTLE_MS = int(os.getenv("CHANGES_SETTLE_MS", 2000))
+
+# Maximum number of changes returned per page
+MAX_CHANGES_LIMIT = 1000
+
+def encode_change_token(updated_at: datetime, document_id: ObjectId) -> str:
+    """Encode a position in the (updated_at, _id) order as a sync token."""
+    millis = int(updated_at.replace(tzinfo=timezone.utc).timestamp() * 1000)
+    return f"{millis}-{document_id}"
+
+def decode_change_token(token: str) -> Tuple[datetime, ObjectId]:
+    """Decode a sync token from encode_change_token().
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        millis, document_id = token.split("-", 1)
+        updated_at = datetime.fromtimestamp(int(millis) / 1000, tz=timezone.utc).replace(tzinfo=None)
+        return updated_at, ObjectId(document_id)
+    except Exception:
+        raise ValueError("Invalid since token")
+
+def _changes_since(
+    collection,
+    query: Dict[str, Any],
+    since: Optional[str],
+    limit: int,
+    projection: Optional[Dict[str, Any]] = None
+) -> Tuple[List[Dict[str, Any]], str, bool]:
+    """Page through the documents matching query in (updated_at, _id) order.
+
+    Returns:
+        The documents changed after the since token, the token to resume
+        from and whether more changes are already available.
+    """
+    if not 0 < limit <= MAX_CHANGES_LIMIT:
+        raise ValueError(f"limit must be between 1 and {MAX_CHANGES_LIMIT}")
+    upper = datetime.utcnow() - timedelta(milliseconds=CHANGES_SETTLE_MS)
+    window: Dict[str, Any] = {"updated_at": {"$lte": upper}}
+    if since:
+        updated_at, document_id = decode_change_token(since)
+        window = {"$and": [window, {"$or": [
+            {"updated_at": {"$gt": updated_at}},
+            {"updated_at": updated_at, "_id": {"$gt": document_id}}
+        ]}]}
+    documents = list(collection.find(
+        {"$and": [query, window]},
+        projection
+    ).sort([("updated_at", 1), ("_id", 1)]).limit(limit + 1))
+    has_more = len(documents) > limit
+    documents = documents[:limit]
+    if documents:
+        last = documents[-1]
+        token = encode_change_token(last["updated_at"], last["_id"])
+    elif since and updated_at >= upper:
+        # Issued by a server whose clock is ahead, never move backwards
+        token = since
+    else:
+        # Nothing changed up to upper, the next sync can start from there
+        token = encode_change_token(upper, ObjectId("0" * 24))
+    return documents, token, has_more
+
+def get_listing_changes(since: Optional[str] = None, limit: int = 500) -> Dict[str, Any]:
+    """Get the listings that changed after a sync token.
+
+    Active listings are returned in full. Listings that left the feed
+    (sold, cancelled, invalid) are returned as tombstones with "removed"
+    set, so clients can drop them. Without a token every listing is
+    returned, which is how a client gets its first token.
+
+    Args:
+        since: Token returned by the previous call
+        limit: Maximum number of changes to return
+
+    Returns:
+        Dict with the changes, the next token and whether more changes are
+        available right away
+    """
+    try:
+        listings, token, has_more = _changes_since(
+            get_db().marketplace_listings,
+            {},
+            since,
+            limit,
+            LISTING_HIDDEN_FIELDS
+        )
+        changes = []
+        for listing in listings:
+            listing.pop("_id")
+            if listing.get("status") == "active":
+                changes.append(listing)
+            else:
+                changes.append({
+                    "listing_id": listing["listing_id"],
+                    "status": listing.get("status"),
+                    "updated_at": listing["updated_at"],
+                    "removed": True
+                })
+        return {"changes": changes, "next": token, "has_more": has_more}
+    except Exception as e:
+        raise ValueError(f"Failed to get listing changes: {str(e)}")
+
+def get_listing(
+    listing_id: str,
+    fields: Optional[List[str]] = None,
+    include_metadata: bool = False
+) -> Dict[str, Any]:
+    """Get a specific listing by ID
+    
+    Args:
+        listing_id: The listing identifier
+        fields: Optional list of fields to return
+        include_metadata: Resolve the full metadata, also done when
+            "metadata" is in fields
+    """
+    try:
+        db = get_db()
+        listing_collection = db.marketplace_listings
+        
+        projection, requested = build_projection(fields, default=False)
+        include_metadata = include_metadata or requested
+        if projection is None:
+            # Full listings are cached; copy so metadata is not added to the cached dict
+            listing = change_watcher.cached(
+                listing_cache,
+                listing_id,
+                lambda: listing_collection.find_one({"listing_id": listing_id}, LISTING_HIDDEN_FIELDS)
+            )
+            listing = dict(listing) if listing else None
+        else:
+            if include_metadata:
+                projection["metadata_hash"] = 1
+            listing = listing_collection.find_one({"listing_id": listing_id}, projection)
         if not listing:
             raise ValueError(f"Listing {listing_id} not found")
+        if not include_metadata:
+            return listing
             
-        listing["_id"] = str(listing["_id"])
         # Get NFT metadata
         try:
             metadata_result = get_metadata_by_hash(listing["metadata_hash"])
@@ -272,17 +810,25 @@ def get_listing(listing_id: str) -> Dict[str, Any]:
     except Exception as e:
         raise ValueError(f"Failed to get listing: {str(e)}")
 
+async def get_listing_async(listing_id: str, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Async variant of get_listing() without metadata resolution"""
+    try:
+        projection, _ = build_projection(fields, default=False)
+        if projection is None:
+            projection = dict(LISTING_HIDDEN_FIELDS)
+        listing = await get_async_db().marketplace_listings.find_one({"listing_id": listing_id}, projection)
+        if not listing:
+            raise ValueError(f"Listing {listing_id} not found")
+        return listing
+    except Exception as e:
+        raise ValueError(f"Failed to get listing: {str(e)}")
+
 def update_listing_status(listing_id: str, status: str, additional_data: Dict[str, Any] = None) -> Dict[str, Any]:
     """Update the status of a marketplace listing and add additional data"""
     try:
         db = get_db()
         listing_collection = db.marketplace_listings
         
-        # Verify listing exists
-        existing = listing_collection.find_one({"listing_id": listing_id})
-        if not existing:
-            raise ValueError(f"Listing {listing_id} not found")
-            
         # Prepare update data
         update_data = {
             "status": status,
@@ -293,25 +839,144 @@ def update_listing_status(listing_id: str, status: str, additional_data: Dict[st
         if additional_data:
             update_data.update(additional_data)
         
-        # Update the listing
-        result = listing_collection.update_one(
+        # Update the listing, keeping its previous state for the stats
+        previous = listing_collection.find_one_and_update(
             {"listing_id": listing_id},
             {"$set": update_data}
         )
-        
-        if result.modified_count == 0:
-            raise ValueError(f"Failed to update listing {listing_id}")
+        if not previous:
+            raise ValueError(f"Listing {listing_id} not found")
+            
+        if previous["status"] == "active" and status != "active":
+            stats_service.record_listing_closed(previous)
+        elif previous["status"] != "active" and status == "active":
+            stats_service.record_listing_opened(previous)
             
         # Get and return the updated listing
-        updated_listing = listing_collection.find_one({"listing_id": listing_id})
-        updated_listing["_id"] = str(updated_listing["_id"])
-        return updated_listing
+        return listing_collection.find_one({"listing_id": listing_id})
         
     except Exception as e:
         raise ValueError(f"Failed to update listing status: {str(e)}")
 
+def mark_listing_sold(listing_id: str, buyer_address: str, transaction_hash: str) -> Optional[Dict[str, Any]]:
+    """Mark an active listing sold, at most once per listing and transaction.
+    
+    The listing is only updated while it is active, and a transaction hash
+    already used for another sold listing is refused by a unique index, so
+    validating a purchase twice records a single sale.
+    
+    Returns:
+        Optional[Dict[str, Any]]: The listing before the update, or None if it
+            is not active or the transaction was already used
+    """
+    try:
+        previous = get_db().marketplace_listings.find_one_and_update(
+            {"listing_id": listing_id, "status": "active"},
+            {"$set": {
+                "status": "sold",
+                "buyer_address": buyer_address,
+                "transaction_hash": transaction_hash,
+                "sold_at": datetime.utcnow().isoformat(),
+                "updated_at": datetime.utcnow()
+            }}
+        )
+    except DuplicateKeyError:
+        return None
+    except Exception as e:
+        raise ValueError(f"Failed to mark listing sold: {str(e)}")
+    if previous:
+        stats_service.record_listing_closed(previous)
+    return previous
+
+def backfill_listing_summaries() -> int:
+    """Store the metadata snapshot on listings created without one.
+    
+    Returns:
+        int: Number of listings updated
+    """
+    try:
+        db = get_db()
+        listing_collection = db.marketplace_listings
+        
+        updated = 0
+        missing = listing_collection.find(
+            {"$or": [
+                {"summary": {"$exists": False}},
+                {"search_text": {"$exists": False}}
+            ]},
+            {"_id": 0, "listing_id": 1, "metadata_hash": 1}
+        )
+        for listing in missing:
+            snapshot = get_listing_snapshot(listing.get("metadata_hash"))
+            listing_collection.update_one(
+                {"listing_id": listing["listing_id"]},
+                {"$set": {**snapshot, "updated_at": datetime.utcnow()}}
+            )
+            updated += 1
+        return updated
+    except Exception as e:
+        raise ValueError(f"Failed to backfill listings: {str(e)}")
+
+def backfill_nft_updated_at() -> int:
+    """Set updated_at on NFTs tracked before it was stored at mint time.
+    
+    NFTs without updated_at are never returned by get_account_nft_changes().
+    
+    Returns:
+        int: Number of NFTs updated
+    """
+    try:
+        result = get_db().nfts.update_many(
+            {"updated_at": {"$exists": False}},
+            [{"$set": {"updated_at": {"$ifNull": ["$created_at", "$$NOW"]}}}]
+        )
+        return result.modified_count
+    except Exception as e:
+        raise ValueError(f"Failed to backfill NFTs: {str(e)}")
+
+def compress_metadata_documents(batch_size: int = 500) -> Dict[str, int]:
+    """Add the canonical bytes to metadata stored before they were.
+    
+    The decoded metadata is kept. Documents stored with the canonical bytes
+    only get their METADATA_DECODED_FIELDS back. Documents whose hash no
+    longer matches their metadata are left untouched and counted as
+    mismatched.
+    
+    Returns:
+        Dict[str, int]: Number of documents updated and mismatched
+    """
+    try:
+        metadata_collection = get_db().nft_metadata
+        updated = mismatched = 0
+        legacy = metadata_collection.find(
+            {"$or": [{"canonical": {"$exists": False}}, {"metadata": {"$exists": False}}]},
+            {"_id": 1, "metadata_hash": 1, "metadata": 1, "canonical": 1, "encoding": 1}
+        ).batch_size(batch_size)
+        for metadata_doc in legacy:
+            if "canonical" in metadata_doc:
+                decoded = encode_metadata_document(load_metadata(metadata_doc))["metadata"]
+                metadata_collection.update_one({"_id": metadata_doc["_id"]}, {"$set": {"metadata": decoded}})
+                updated += 1
+                continue
+            encoded = encode_metadata_document(metadata_doc["metadata"])
+            if encoded.pop("metadata_hash") != metadata_doc["metadata_hash"]:
+                mismatched += 1
+                continue
+            # The full decoded document stays in place
+            del encoded["metadata"]
+            metadata_collection.update_one({"_id": metadata_doc["_id"]}, {"$set": encoded})
+            updated += 1
+        return {"updated": updated, "mismatched": mismatched}
+    except Exception as e:
+        raise ValueError(f"Failed to compress metadata: {str(e)}")
+
 def ensure_indexes():
-    """Ensure required indexes exist in MongoDB"""
+    """Ensure required indexes exist in MongoDB
+    
+    Run once per deployment (``flask db indexes``, or by the gunicorn master
+    at startup) rather than on import, so starting a worker or serverless
+    function does not wait on a round trip per index.
+    """
     try:
         db = get_db()
         nft_collection = db.nfts
@@ -325,6 +990,10 @@ def ensure_indexes():
         # Create index on account for faster queries
         nft_collection.create_index("account")
         
+        # Portfolio delta sync, by current and previous owner
+        nft_collection.create_index([("account", 1), ("updated_at", 1), ("_id", 1)])
+        nft_collection.create_index([("former_accounts", 1), ("updated_at", 1), ("_id", 1)])
+        
         # Create unique index on transaction_hash
         nft_collection.create_index("transaction_hash", unique=True)
         
@@ -337,9 +1006,53 @@ def ensure_indexes():
         listing_collection.create_index("nft_id")
         listing_collection.create_index("seller_address")
         listing_collection.create_index("status")
+        # A purchase transaction completes a single listing
+        listing_collection.create_index(
+            "transaction_hash",
+            unique=True,
+            partialFilterExpression={"status": "sold", "transaction_hash": {"$type": "string"}}
+        )
+        # Latest change and delta sync, in (updated_at, _id) order
+        listing_collection.create_index([("updated_at", 1), ("_id", 1)])
+        
+        # Compound indexes for filtered and sorted listing feeds
+        listing_collection.create_index([("status", 1), ("price_drops", 1)])
+        listing_collection.create_index([("status", 1), ("created_at", -1)])
+        listing_collection.create_index([("status", 1), ("asset_type", 1), ("price_drops", 1)])
+        listing_collection.create_index([("status", 1), ("asset_type", 1), ("created_at", -1)])
+        listing_collection.create_index([("status", 1), ("seller_address", 1), ("created_at", -1)])
+        
+        # Text index for listing search, scoped by status
+        listing_collection.create_index(
+            [
+                ("status", 1),
+                ("summary.title", "text"),
+                ("summary.location", "text"),
+                ("search_text", "text")
+            ],
+            name="listing_search",
+            weights={"summary.title": 10, "summary.location": 5, "search_text": 1},
+            default_language="english"
+        )
         
         # Create index for images collection
         image_collection.create_index("image_id", unique=True)
+        image_service.ensure_image_indexes(db)
+        
+        # Create indexes for purchase history and marketplace stats
+        db.nft_transactions.create_index([("transaction_type", 1), ("created_at", -1)])
+        db.nft_transactions.create_index([("asset_type", 1), ("created_at", 1)])
+        db.nft_transactions.create_index([("nft_id", 1), ("created_at", 1)])
+        db.nft_transactions.create_index(
+            "transaction_hash",
+            unique=True,
+            partialFilterExpression={"transaction_type": "purchase"}
+        )
+        stats_service.ensure_stats_indexes(db)
+        price_history_service.ensure_price_history_collection(db)
+        
+        # Offers and listings touched by ledger transactions
+        reconcile_service.ensure_reconcile_indexes(db)
         
         return True
     except Exception as e:
@@ -351,16 +1064,20 @@ def update_nft_ownership(nft_id: str, new_owner: str, transaction_hash: str) ->
         db = get_db()
         nft_collection = db.nfts
         
-        # Update the NFT document
+        # Update the NFT document, remembering the previous owner so its
+        # portfolio sync gets a tombstone
         result = nft_collection.update_one(
             {"nft_id": nft_id},
-            {
+            [{
                 "$set": {
+                    "former_accounts": {
+                        "$setUnion": [{"$ifNull": ["$former_accounts", []]}, ["$account"]]
+                    },
                     "account": new_owner,
                     "last_transfer_hash": transaction_hash,
                     "updated_at": datetime.utcnow()
                 }
-            }
+            }]
         )
         
         if result.modified_count == 0:
@@ -414,40 +1131,92 @@ def record_purchase_transaction(
     nft_id: str,
     buyer: str,
     price_drops: int,
-    transaction_hash: str
+    transaction_hash: str,
+    asset_type: Optional[str] = None
 ) -> Dict[str, Any]:
-    """Record a purchase transaction in the history"""
+    """Record a purchase transaction in the history
+    
+    The asset type is stored on the transaction for the marketplace stats;
+    when not given it is taken from the NFT's most recent listing. The
+    transaction is written by the write-behind buffer, shortly after this
+    returns.
+    
+    Record sales through complete_listing_sale: mark_listing_sold moves a
+    listing out of active once per transaction hash, which is what keeps a
+    sale from being counted twice. The lookup below only sees transactions
+    already flushed from the buffer, not those still waiting in it.
+    """
     try:
         db = get_db()
-        transaction_collection = db.nft_transactions
+        
+        existing = db.nft_transactions.find_one(
+            {"transaction_hash": transaction_hash, "transaction_type": "purchase"},
+            {"_id": 0}
+        )
+        if existing:
+            return existing
+        
+        if asset_type is None:
+            listing = db.marketplace_listings.find_one(
+                {"nft_id": nft_id},
+                {"_id": 0, "asset_type": 1},
+                sort=[("created_at", -1)]
+            )
+            asset_type = listing.get("asset_type") if listing else None
         
         transaction = {
             "transaction_id": str(uuid.uuid4()),
             "nft_id": nft_id,
             "buyer_address": buyer,
-            "price_drops": price_drops,
+            "price_drops": int(price_drops),
             "transaction_hash": transaction_hash,
             "transaction_type": "purchase",
+            "asset_type": asset_type,
             "created_at": datetime.utcnow()
         }
         
-        result = transaction_collection.insert_one(transaction)
-        transaction["_id"] = str(result.inserted_id)
+        write_behind.add("nft_transactions", transaction)
+        stats_service.record_sale(transaction)
+        price_history_service.record_sale_price(transaction)
         
         return transaction
     except Exception as e:
         raise ValueError(f"Failed to record purchase transaction: {str(e)}")
 
+def complete_listing_sale(listing: Dict[str, Any], buyer_address: str, transaction_hash: str) -> bool:
+    """Mark a listing sold, then record its sale.
+    
+    The sale is only recorded once the listing was moved out of active, so
+    a failed or lost status update never leaves a sale behind.
+    
+    Args:
+        listing: Listing with listing_id, nft_id, price_drops and asset_type
+    
+    Returns:
+        bool: False if the listing is not active or the transaction was
+            already recorded
+    """
+    if not mark_listing_sold(listing["listing_id"], buyer_address, transaction_hash):
+        return False
+    record_purchase_transaction(
+        nft_id=listing["nft_id"],
+        buyer=buyer_address,
+        price_drops=listing["price_drops"],
+        transaction_hash=transaction_hash,
+        asset_type=listing.get("asset_type")
+    )
+    return True
+
 def track_nft_offer(offer_data: Dict[str, Any]) -> Dict[str, Any]:
-    """Track an NFT offer in the database"""
+    """Track an NFT offer in the database
+    
+    The offer is written by the write-behind buffer, shortly after this
+    returns.
+    """
     try:
-        db = get_db()
-        offer_collection = db.nft_offers
-        
         offer_data['created_at'] = datetime.utcnow()
-        result = offer_collection.insert_one(offer_data)
+        write_behind.add("nft_offers", offer_data)
         
-        offer_data['_id'] = str(result.inserted_id)
         return offer_data
     except Exception as e:
         raise ValueError(f"Failed to track NFT offer: {str(e)}")
@@ -476,6 +1245,9 @@ def store_nft_image(image_data: str) -> str:
         }
         
         image_collection.insert_one(image_doc)
+        
+        # Thumbnails are generated off the request path
+        image_service.schedule_derivatives(image_id)
         return image_id
     except Exception as e:
         raise ValueError(f"Failed to store image: {str(e)}")
@@ -495,15 +1267,32 @@ def get_nft_image(image_id: str) -> Optional[str]:
     try:
         db = get_db()
         image_doc = db.nft_images.find_one({'image_id': image_id})
-        return image_doc['data'] if image_doc else None
+        if image_doc:
+            return image_doc['data']
+        # Streamed uploads are stored in GridFS
+        upload = image_service.open_uploaded_image(image_id)
+        return base64.b64encode(upload.read()).decode('ascii') if upload is not None else None
     except Exception as e:
         raise ValueError(f"Failed to retrieve image: {str(e)}")
 
-def get_metadata_with_image(metadata_hash: str) -> Dict[str, Any]:
+def image_exists(image_id: str) -> bool:
+    """Check whether an image was stored, inline or as a streamed upload."""
+    try:
+        db = get_db()
+        if db.nft_images.count_documents({'image_id': image_id}, limit=1):
+            return True
+        return db[f"{image_service.UPLOAD_BUCKET}.files"].count_documents({'filename': image_id}, limit=1) > 0
+    except Exception as e:
+        raise ValueError(f"Failed to look up image: {str(e)}")
+
+def get_metadata_with_image(metadata_hash: str, image_size: Optional[str] = None) -> Dict[str, Any]:
     """Retrieve metadata including image data if available.
     
     Args:
         metadata_hash: Hash of the metadata to retrieve
+        image_size: Optional derivative size (see image_service) to return
+            instead of the full resolution image. The original is returned
+            while the derivative is not generated yet.
         
     Returns:
         Dict[str, Any]: Metadata with image data if available
@@ -518,17 +1307,23 @@ def get_metadata_with_image(metadata_hash: str) -> Dict[str, Any]:
         if not metadata_doc:
             raise ValueError(f"Metadata not found for hash {metadata_hash}")
             
-        metadata = metadata_doc["metadata"].copy()
+        metadata = dict(load_metadata(metadata_doc))
         
         # Add image data if present
         if "image_id" in metadata:
-            image_data = get_nft_image(metadata["image_id"])
-            if image_data:
-                metadata["image"] = image_data
+            derivative = None
+            if image_size not in (None, image_service.ORIGINAL_SIZE):
+                derivative = image_service.get_image_derivative(metadata["image_id"], image_size)
+            if derivative is not None:
+                metadata["image"] = derivative["data"]
+                metadata["image_size"] = image_size
+                metadata["image_content_type"] = derivative["content_type"]
+            else:
+                image_data = get_nft_image(metadata["image_id"])
+                if image_data:
+                    metadata["image"] = image_data
+                    metadata["image_size"] = image_service.ORIGINAL_SIZE
                 
         return metadata
     except Exception as e:
         raise ValueError(f"Failed to get metadata: {str(e)}")
-
-# Create indexes when module is imported
-ensure_indexes() 
\ No newline at end of file
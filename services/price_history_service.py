@@ -0,0 +1,318 @@
+"""Sale price history stored as a MongoDB time-series collection"""
+from typing import Dict, Any, List, Optional, Sequence
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import re
+import time
+from pymongo.errors import CollectionInvalid, OperationFailure
+from .database import get_db
+
+# numpy is optional and slow to import, so it is loaded by _numpy() the
+# first time candles are computed; False until then
+np = False
+
+def _numpy():
+    """Import numpy on first use, or None when it is not installed."""
+    global np
+    if np is False:
+        try:
+            import numpy
+        except ImportError:  # pragma: no cover - numpy is optional
+            numpy = None
+        np = numpy
+    return np
+
+logger = logging.getLogger(__name__)
+
+PRICE_HISTORY_COLLECTION = "nft_price_history"
+
+INTERVAL_UNITS = {
+    "m": 60_000,
+    "h": 3_600_000,
+    "d": 86_400_000,
+    "w": 604_800_000,
+}
+
+# Seconds after which a process that found no time-series collection
+# looks again, e.g. once flask db indexes has created it
+TIMESERIES_RECHECK_SECONDS = float(os.getenv("PRICE_HISTORY_RECHECK_SECONDS", 60))
+
+# Set by ensure_price_history_collection() or timeseries_available();
+# None until checked
+_timeseries_available: Optional[bool] = None
+_timeseries_checked_at = 0.0
+
+def parse_interval(interval: str) -> int:
+    """Parse an interval such as "15m", "4h" or "1d" into milliseconds.
+
+    Raises:
+        ValueError: If the interval is malformed
+    """
+    match = re.fullmatch(r"(\d+)([mhdw])", interval or "")
+    if not match or int(match.group(1)) == 0:
+        raise ValueError(f"Invalid interval: {interval}")
+    return int(match.group(1)) * INTERVAL_UNITS[match.group(2)]
+
+def ensure_price_history_collection(db) -> bool:
+    """Create the time-series collection if the server supports it.
+
+    Returns:
+        bool: Whether sales are stored in the time-series collection. When
+        False (MongoDB < 5.0) candles are computed from nft_transactions.
+    """
+    global _timeseries_available, _timeseries_checked_at
+    _timeseries_checked_at = time.monotonic()
+    try:
+        db.create_collection(
+            PRICE_HISTORY_COLLECTION,
+            timeseries={"timeField": "ts", "metaField": "meta", "granularity": "hours"}
+        )
+    except CollectionInvalid:
+        # Already exists
+        pass
+    except OperationFailure as e:
+        logger.info("Time-series collections unavailable, using in-memory candles: %s", e)
+        _timeseries_available = False
+        return False
+
+    history = db[PRICE_HISTORY_COLLECTION]
+    history.create_index([("meta.asset_type", 1), ("ts", 1)])
+    history.create_index([("meta.nft_id", 1), ("ts", 1)])
+    _timeseries_available = True
+    return True
+
+def timeseries_available() -> bool:
+    """Check whether the time-series collection is in use.
+
+    The collection is created by ensure_indexes(), never on the request
+    path: until it exists, sales are only kept in nft_transactions, and
+    the lookup is repeated every TIMESERIES_RECHECK_SECONDS. Sales missed
+    meanwhile are copied by backfill_price_history().
+    """
+    global _timeseries_available, _timeseries_checked_at
+    if _timeseries_available is None or (
+        not _timeseries_available and time.monotonic() - _timeseries_checked_at > TIMESERIES_RECHECK_SECONDS
+    ):
+        names = get_db().list_collection_names(filter={"name": PRICE_HISTORY_COLLECTION, "type": "timeseries"})
+        if not names and _timeseries_available is None:
+            logger.warning("%s does not exist, run flask db indexes", PRICE_HISTORY_COLLECTION)
+        _timeseries_available = bool(names)
+        _timeseries_checked_at = time.monotonic()
+    return _timeseries_available
+
+def record_sale_price(transaction: Dict[str, Any]) -> None:
+    """Write a completed purchase into the price history."""
+    try:
+        if not timeseries_available():
+            return
+        get_db()[PRICE_HISTORY_COLLECTION].insert_one({
+            "ts": transaction["created_at"],
+            "meta": {
+                "asset_type": transaction.get("asset_type"),
+                "nft_id": transaction["nft_id"]
+            },
+            "price_drops": transaction["price_drops"]
+        })
+    except Exception as e:
+        logger.warning("Failed to record sale price: %s", e)
+
+def _candle(bucket_ms: int, open_: int, high: int, low: int, close: int, volume: int, trades: int) -> Dict[str, Any]:
+    """Format a single OHLC candle."""
+    return {
+        "time": datetime.fromtimestamp(bucket_ms / 1000, tz=timezone.utc),
+        "open": int(open_),
+        "high": int(high),
+        "low": int(low),
+        "close": int(close),
+        "volume_drops": int(volume),
+        "trades": int(trades)
+    }
+
+def compute_ohlc(timestamps_ms: Sequence[int], prices: Sequence[int], interval_ms: int) -> List[Dict[str, Any]]:
+    """Compute OHLC candles in memory from sale timestamps and prices.
+
+    Vectorized with numpy when available: sales are sorted once, bucket
+    boundaries found with a single comparison and every aggregate computed
+    with ufunc.reduceat over the boundaries.
+    """
+    if len(timestamps_ms) == 0:
+        return []
+    np = _numpy()
+    if np is None:
+        return _compute_ohlc_python(timestamps_ms, prices, interval_ms)
+
+    ts = np.asarray(timestamps_ms, dtype=np.int64)
+    px = np.asarray(prices, dtype=np.int64)
+    order = np.argsort(ts, kind="stable")
+    ts, px = ts[order], px[order]
+
+    buckets = ts - ts % interval_ms
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(ts)]
+
+    columns = zip(
+        buckets[starts],
+        px[starts],
+        np.maximum.reduceat(px, starts),
+        np.minimum.reduceat(px, starts),
+        px[ends - 1],
+        np.add.reduceat(px, starts),
+        ends - starts
+    )
+    return [_candle(*column) for column in columns]
+
+def _compute_ohlc_python(timestamps_ms: Sequence[int], prices: Sequence[int], interval_ms: int) -> List[Dict[str, Any]]:
+    """Pure Python equivalent of compute_ohlc()."""
+    candles = []
+    current = None
+    for ts, price in sorted(zip(timestamps_ms, prices), key=lambda sale: sale[0]):
+        bucket = ts - ts % interval_ms
+        if current is None or current[0] != bucket:
+            if current is not None:
+                candles.append(_candle(*current))
+            current = [bucket, price, price, price, price, 0, 0]
+        current[2] = max(current[2], price)
+        current[3] = min(current[3], price)
+        current[4] = price
+        current[5] += price
+        current[6] += 1
+    candles.append(_candle(*current))
+    return candles
+
+def get_ohlc(
+    interval: str = "1d",
+    asset_type: Optional[str] = None,
+    nft_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """Get OHLC and volume candles for sales in a time range.
+
+    Args:
+        interval: Candle width, e.g. "15m", "1h", "1d", "1w"
+        asset_type: Optional asset type to restrict to
+        nft_id: Optional NFT to restrict to
+        start: Range start, defaults to 100 intervals before end
+        end: Range end, defaults to now
+
+    Raises:
+        ValueError: If the interval is invalid or the query fails
+    """
+    interval_ms = parse_interval(interval)
+    end = end or datetime.utcnow()
+    start = start or end - timedelta(milliseconds=interval_ms * 100)
+
+    try:
+        db = get_db()
+        if not timeseries_available():
+            return _get_ohlc_in_memory(db, interval_ms, asset_type, nft_id, start, end)
+
+        match = {"ts": {"$gte": start, "$lt": end}}
+        if asset_type is not None:
+            match["meta.asset_type"] = asset_type
+        if nft_id is not None:
+            match["meta.nft_id"] = nft_id
+
+        epoch_ms = {"$toLong": "$ts"}
+        rows = db[PRICE_HISTORY_COLLECTION].aggregate([
+            {"$match": match},
+            {"$sort": {"ts": 1}},
+            {"$group": {
+                "_id": {"$subtract": [epoch_ms, {"$mod": [epoch_ms, interval_ms]}]},
+                "open": {"$first": "$price_drops"},
+                "high": {"$max": "$price_drops"},
+                "low": {"$min": "$price_drops"},
+                "close": {"$last": "$price_drops"},
+                "volume_drops": {"$sum": "$price_drops"},
+                "trades": {"$sum": 1}
+            }},
+            {"$sort": {"_id": 1}}
+        ])
+        return [
+            _candle(row["_id"], row["open"], row["high"], row["low"], row["close"], row["volume_drops"], row["trades"])
+            for row in rows
+        ]
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Failed to get price history: {str(e)}")
+
+def _get_ohlc_in_memory(db, interval_ms: int, asset_type, nft_id, start, end) -> List[Dict[str, Any]]:
+    """Compute candles from nft_transactions when time-series is unavailable."""
+    query = {"transaction_type": "purchase", "created_at": {"$gte": start, "$lt": end}}
+    if asset_type is not None:
+        query["asset_type"] = asset_type
+    if nft_id is not None:
+        query["nft_id"] = nft_id
+
+    timestamps, prices = [], []
+    for sale in db.nft_transactions.find(query, {"_id": 0, "created_at": 1, "price_drops": 1}):
+        created_at = sale["created_at"].replace(tzinfo=timezone.utc)
+        timestamps.append(int(created_at.timestamp() * 1000))
+        prices.append(int(sale["price_drops"]))
+    return compute_ohlc(timestamps, prices, interval_ms)
+
+def _sale_key(ts: datetime, nft_id: str, price_drops: int):
+    return ts.replace(tzinfo=None), nft_id, int(price_drops)
+
+def backfill_price_history(batch_size: int = 1000) -> int:
+    """Copy the past purchases missing from the time-series collection.
+
+    Sales already in the collection, matched on time, NFT and price, are
+    skipped, so the backfill can run while sales are being recorded and
+    be repeated. The collection is created if needed, never dropped.
+
+    Returns:
+        int: Number of sales copied
+    """
+    try:
+        db = get_db()
+        if not ensure_price_history_collection(db):
+            return 0
+        history = db[PRICE_HISTORY_COLLECTION]
+
+        copied = 0
+        sales = db.nft_transactions.find(
+            {"transaction_type": "purchase"},
+            {"_id": 0, "created_at": 1, "asset_type": 1, "nft_id": 1, "price_drops": 1}
+        ).sort("created_at", 1).batch_size(batch_size)
+        batch = []
+        for sale in sales:
+            batch.append(sale)
+            if len(batch) >= batch_size:
+                copied += _copy_missing_sales(history, batch)
+                batch = []
+        if batch:
+            copied += _copy_missing_sales(history, batch)
+        return copied
+    except Exception as e:
+        raise ValueError(f"Failed to backfill price history: {str(e)}")
+
+def _copy_missing_sales(history, sales: List[Dict[str, Any]]) -> int:
+    """Insert the sales of a batch that the time series does not have yet."""
+    recorded = Counter(
+        _sale_key(point["ts"], point["meta"]["nft_id"], point["price_drops"])
+        for point in history.find(
+            {
+                "ts": {"$gte": sales[0]["created_at"], "$lte": sales[-1]["created_at"]},
+                "meta.nft_id": {"$in": list({sale["nft_id"] for sale in sales})}
+            },
+            {"_id": 0, "ts": 1, "meta.nft_id": 1, "price_drops": 1}
+        )
+    )
+    missing = []
+    for sale in sales:
+        key = _sale_key(sale["created_at"], sale["nft_id"], sale["price_drops"])
+        if recorded[key]:
+            recorded[key] -= 1
+            continue
+        missing.append({
+            "ts": sale["created_at"],
+            "meta": {"asset_type": sale.get("asset_type"), "nft_id": sale["nft_id"]},
+            "price_drops": int(sale["price_drops"])
+        })
+    if missing:
+        history.insert_many(missing, ordered=False)
+    return len(missing)
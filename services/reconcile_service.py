@@ -0,0 +1,351 @@
+"""Reconciliation of tracked NFTs, listings and offers with the ledger
+
+The database only learns about transfers, burns and offers through the API,
+so anything that happens on the ledger while the service is down, or
+outside the marketplace, leaves nfts, marketplace_listings and nft_offers
+behind. reconcile_ledger() walks account_tx of every tracked account from
+its stored checkpoint and applies what it finds:
+
+- NFTokenAcceptOffer: the NFT moves to its new owner, listings open before
+  the transfer are closed and the consumed offers marked accepted
+- NFTokenCancelOffer: the offers and the listings selling through them are
+  cancelled
+- NFTokenBurn: the NFT is marked burned and its listings and offers
+  cancelled
+
+Corrections of a page of transactions are sent as one bulk write per
+collection before the checkpoint moves past the page, and the checkpoint
+keeps the account_tx marker, so an interrupted run resumes at the page it
+stopped at. A transaction seen through several accounts, or again after a
+resume, changes nothing the second time.
+"""
+from typing import Any, Dict, Iterable, List, Optional
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+import logging
+import os
+from pymongo import UpdateMany, UpdateOne
+from .database import get_db
+from .stats_service import rebuild_stats
+from .xrpl_service import get_client, TF_SELL_NFTOKEN
+
+logger = logging.getLogger(__name__)
+
+# Ledger progress, one document per account
+CHECKPOINT_COLLECTION = "ledger_checkpoints"
+
+# Accounts reconciled at once
+RECONCILE_WORKERS = int(os.getenv("RECONCILE_WORKERS", 4))
+
+# Transactions per account_tx page, i.e. per bulk write
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", 200))
+
+# Ledger dates count seconds from 2000-01-01
+RIPPLE_EPOCH = 946684800
+
+# Orders transactions: ledger_index * LEDGER_POSITION_SCALE + TransactionIndex
+LEDGER_POSITION_SCALE = 1_000_000
+
+# account_tx errors meaning there is nothing to read: the checkpoint is
+# already at the last validated ledger, or the account does not exist
+NOTHING_TO_READ = {"lgrIdxsInvalid", "actNotFound"}
+
+
+def tracked_accounts() -> List[str]:
+    """Owners of tracked NFTs and sellers of active listings and offers."""
+    db = get_db()
+    accounts = set()
+    for collection, field, query in (
+        (db.nfts, "$account", {}),
+        (db.marketplace_listings, "$seller_address", {"status": "active"}),
+        (db.nft_offers, "$seller_address", {"status": "active"})
+    ):
+        for group in collection.aggregate([{"$match": query}, {"$group": {"_id": field}}]):
+            accounts.add(group["_id"])
+    accounts.discard(None)
+    return sorted(accounts)
+
+def load_checkpoint(account: str) -> Dict[str, Any]:
+    """Get the ledger progress of an account; empty if never reconciled.
+
+    Returns:
+        Dict with ledger_index, the last ledger fully read, and while a
+        scan is in progress the marker and target ledger of its next page
+    """
+    checkpoint = get_db()[CHECKPOINT_COLLECTION].find_one({"_id": account}, {"_id": 0})
+    return checkpoint or {"ledger_index": None, "marker": None, "target": None}
+
+def save_checkpoint(account: str, checkpoint: Dict[str, Any]) -> None:
+    """Store the ledger progress of an account."""
+    get_db()[CHECKPOINT_COLLECTION].update_one(
+        {"_id": account},
+        {"$set": {**checkpoint, "updated_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+def _closed_at(entry: Dict[str, Any], tx: Dict[str, Any]) -> datetime:
+    """Close time of the ledger of a transaction, as a naive UTC datetime."""
+    if entry.get("close_time_iso"):
+        return datetime.strptime(entry["close_time_iso"], "%Y-%m-%dT%H:%M:%SZ")
+    return datetime.fromtimestamp(tx["date"] + RIPPLE_EPOCH, tz=timezone.utc).replace(tzinfo=None)
+
+def _drops(amount: Any) -> Optional[int]:
+    """XRP amount in drops; None for issued currencies."""
+    return int(amount) if isinstance(amount, str) else None
+
+def parse_events(entry: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Extract the changes to tracked state from an account_tx entry.
+
+    Handles API version 1 (tx) and 2 (tx_json) entries. Failed
+    transactions and unrelated transaction types give no events.
+    """
+    tx = entry.get("tx_json") or entry.get("tx") or {}
+    meta = entry.get("meta")
+    if not isinstance(meta, dict) or meta.get("TransactionResult") != "tesSUCCESS":
+        return []
+    transaction_type = tx.get("TransactionType")
+    if transaction_type not in ("NFTokenAcceptOffer", "NFTokenCancelOffer", "NFTokenBurn"):
+        return []
+
+    ledger_index = entry.get("ledger_index") or tx["ledger_index"]
+    common = {
+        "transaction_hash": entry.get("hash") or tx.get("hash"),
+        "position": ledger_index * LEDGER_POSITION_SCALE + meta.get("TransactionIndex", 0),
+        "closed_at": _closed_at(entry, tx)
+    }
+    # Offers removed from the ledger by the transaction
+    offers = {
+        node["DeletedNode"]["LedgerIndex"]: node["DeletedNode"].get("FinalFields", {})
+        for node in meta.get("AffectedNodes", [])
+        if node.get("DeletedNode", {}).get("LedgerEntryType") == "NFTokenOffer"
+    }
+
+    if transaction_type == "NFTokenAcceptOffer":
+        sell_offer_id = next((offer_id for offer_id, offer in offers.items() if offer.get("Flags", 0) & TF_SELL_NFTOKEN), None)
+        buy = next((offer for offer in offers.values() if not offer.get("Flags", 0) & TF_SELL_NFTOKEN), None)
+        sell = offers.get(sell_offer_id)
+        offer = sell or buy
+        if offer is None:
+            return []
+        return [{
+            "type": "transfer",
+            "nft_id": meta.get("nftoken_id") or offer["NFTokenID"],
+            # A brokered sale has both offers; the buyer owns the buy offer
+            "buyer": buy["Owner"] if buy else tx["Account"],
+            "seller": sell["Owner"] if sell else tx["Account"],
+            "sell_offer_id": sell_offer_id,
+            "offer_ids": list(offers),
+            "price_drops": _drops(offer.get("Amount")),
+            **common
+        }]
+    if transaction_type == "NFTokenCancelOffer":
+        return [{"type": "cancel", "offer_ids": list(tx.get("NFTokenOffers", [])), **common}]
+    return [{"type": "burn", "nft_id": tx["NFTokenID"], "offer_ids": list(offers), **common}]
+
+def _nft_unchanged_since(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Match NFTs whose state predates the event.
+
+    An NFT last written by the API after the transaction closed is newer
+    than it; one written by a reconciliation is newer if it applied a later
+    transaction.
+    """
+    return {
+        "ledger_position": {"$not": {"$gte": event["position"]}},
+        "$or": [
+            {"updated_at": {"$lt": event["closed_at"]}},
+            {"$expr": {"$eq": ["$updated_at", "$reconciled_at"]}}
+        ]
+    }
+
+def build_corrections(events: Iterable[Dict[str, Any]], now: datetime) -> Dict[str, List[Any]]:
+    """Turn events into update operations per collection.
+
+    Every update is filtered on the state the event moves away from, so
+    applying it again, or after a later event, does nothing.
+    """
+    operations: Dict[str, List[Any]] = {"nfts": [], "marketplace_listings": [], "nft_offers": []}
+    for event in events:
+        offers = {"offer_id": {"$in": event["offer_ids"]}, "status": "active"}
+        if event["type"] == "transfer":
+            operations["nfts"].append(UpdateOne(
+                {"nft_id": event["nft_id"], "account": {"$ne": event["buyer"]}, **_nft_unchanged_since(event)},
+                [{"$set": {
+                    "former_accounts": {"$setUnion": [{"$ifNull": ["$former_accounts", []]}, ["$account"]]},
+                    "account": event["buyer"],
+                    "last_transfer_hash": event["transaction_hash"],
+                    "ledger_position": event["position"],
+                    "updated_at": now,
+                    "reconciled_at": now
+                }}]
+            ))
+            listings = {"nft_id": event["nft_id"], "status": "active", "created_at": {"$lt": event["closed_at"]}}
+            operations["marketplace_listings"].append(UpdateMany(
+                {**listings, "seller_address": event["seller"]},
+                {"$set": {
+                    "status": "sold",
+                    "buyer_address": event["buyer"],
+                    "transaction_hash": event["transaction_hash"],
+                    "final_price_drops": event["price_drops"],
+                    "completed_at": event["closed_at"],
+                    "updated_at": now
+                }}
+            ))
+            # Listings of earlier owners can no longer be filled
+            operations["marketplace_listings"].append(UpdateMany(
+                listings,
+                {"$set": {"status": "cancelled", "updated_at": now}}
+            ))
+            operations["nft_offers"].append(UpdateMany(offers, {"$set": {"status": "accepted", "updated_at": now}}))
+        elif event["type"] == "cancel":
+            operations["marketplace_listings"].append(UpdateMany(
+                {"sell_offer_id": {"$in": event["offer_ids"]}, "status": "active"},
+                {"$set": {"status": "cancelled", "updated_at": now}}
+            ))
+            operations["nft_offers"].append(UpdateMany(offers, {"$set": {"status": "cancelled", "updated_at": now}}))
+        else:
+            operations["nfts"].append(UpdateOne(
+                {"nft_id": event["nft_id"], "status": {"$ne": "burned"}},
+                {"$set": {
+                    "status": "burned",
+                    "burn_transaction_hash": event["transaction_hash"],
+                    "ledger_position": event["position"],
+                    "updated_at": now,
+                    "reconciled_at": now
+                }}
+            ))
+            operations["marketplace_listings"].append(UpdateMany(
+                {"nft_id": event["nft_id"], "status": "active", "created_at": {"$lt": event["closed_at"]}},
+                {"$set": {"status": "cancelled", "updated_at": now}}
+            ))
+            operations["nft_offers"].append(UpdateMany(
+                {"$or": [{"offer_id": {"$in": event["offer_ids"]}}, {"nft_id": event["nft_id"]}], "status": "active"},
+                {"$set": {"status": "cancelled", "updated_at": now}}
+            ))
+    return operations
+
+def apply_corrections(operations: Dict[str, List[Any]]) -> Dict[str, int]:
+    """Send the operations of each collection as one ordered bulk write.
+
+    Returns:
+        Dict[str, int]: Documents modified per collection
+    """
+    db = get_db()
+    modified = {}
+    for collection, requests in operations.items():
+        if requests:
+            modified[collection] = db[collection].bulk_write(requests, ordered=True).modified_count
+    return modified
+
+def fetch_account_tx(
+    account: str,
+    ledger_index_min: int,
+    ledger_index_max: int,
+    marker: Any = None,
+    limit: int = RECONCILE_PAGE_SIZE
+) -> Optional[Dict[str, Any]]:
+    """Read a page of validated transactions of an account, oldest first.
+
+    Returns:
+        The account_tx result, or None if there is nothing to read
+
+    Raises:
+        ValueError: If the node returns an error
+    """
+    from xrpl.models.requests import AccountTx
+    response = get_client().request(AccountTx(
+        account=account,
+        ledger_index_min=ledger_index_min,
+        ledger_index_max=ledger_index_max,
+        forward=True,
+        limit=limit,
+        marker=marker
+    ))
+    if response.is_successful():
+        return response.result
+    if response.result.get("error") in NOTHING_TO_READ:
+        return None
+    raise ValueError(f"account_tx failed: {response.result.get('error_message') or response.result.get('error')}")
+
+def reconcile_account(account: str, page_size: int = RECONCILE_PAGE_SIZE) -> Dict[str, int]:
+    """Apply the transactions of an account since its checkpoint.
+
+    The first run reads the whole history the node has. Each page is
+    corrected before the checkpoint is moved past it.
+
+    Returns:
+        Dict[str, int]: Pages and transactions read, documents modified
+            per collection
+
+    Raises:
+        ValueError: If the ledger or the database cannot be read
+    """
+    try:
+        checkpoint = load_checkpoint(account)
+        counts: Counter = Counter()
+        while True:
+            last = checkpoint.get("ledger_index")
+            marker = checkpoint.get("marker")
+            result = fetch_account_tx(
+                account,
+                last + 1 if last is not None else -1,
+                # A marker is only valid for the range it was returned for
+                checkpoint["target"] if marker else -1,
+                marker=marker,
+                limit=page_size
+            )
+            if result is None:
+                break
+            transactions = result.get("transactions", [])
+            events = [event for entry in transactions for event in parse_events(entry)]
+            if events:
+                counts.update(apply_corrections(build_corrections(events, datetime.utcnow())))
+            counts.update(pages=1, transactions=len(transactions))
+
+            if result.get("marker"):
+                checkpoint = {"ledger_index": last, "marker": result["marker"], "target": result["ledger_index_max"]}
+            else:
+                checkpoint = {"ledger_index": result["ledger_index_max"], "marker": None, "target": None}
+            save_checkpoint(account, checkpoint)
+            if checkpoint["marker"] is None:
+                break
+        return dict(counts)
+    except Exception as e:
+        raise ValueError(f"Failed to reconcile account {account}: {str(e)}")
+
+def reconcile_ledger(
+    accounts: Optional[List[str]] = None,
+    workers: int = RECONCILE_WORKERS,
+    page_size: int = RECONCILE_PAGE_SIZE
+) -> Dict[str, int]:
+    """Reconcile the tracked accounts, workers accounts at a time.
+
+    An account that fails is logged and skipped; its checkpoint is left at
+    the last page applied, so the next run retries from there. Marketplace
+    stats are rebuilt when listings were closed.
+
+    Returns:
+        Dict[str, int]: Accounts reconciled and failed, and the totals of
+            reconcile_account()
+    """
+    if accounts is None:
+        accounts = tracked_accounts()
+    totals: Counter = Counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="reconcile") as pool:
+        futures = {pool.submit(reconcile_account, account, page_size): account for account in accounts}
+        for future in as_completed(futures):
+            try:
+                totals.update(future.result())
+                totals["accounts"] += 1
+            except ValueError as e:
+                logger.warning("%s", e)
+                totals["failed"] += 1
+    if totals["marketplace_listings"]:
+        rebuild_stats()
+    return dict(totals)
+
+def ensure_reconcile_indexes(db) -> None:
+    """Create the indexes used to find the offers and listings of a transaction."""
+    db.nft_offers.create_index("offer_id")
+    db.nft_offers.create_index([("nft_id", 1), ("status", 1)])
+    db.marketplace_listings.create_index("sell_offer_id", sparse=True)
@@ -0,0 +1,268 @@
+"""Incrementally maintained marketplace statistics per asset type"""
+from typing import Dict, Any, List, Optional
+from datetime import datetime, timedelta
+import logging
+from pymongo import DeleteMany, DeleteOne, ReplaceOne, ReturnDocument
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+# Hourly volume buckets are kept a little longer than the widest window
+VOLUME_WINDOWS = {"24h": timedelta(hours=24), "7d": timedelta(days=7)}
+BUCKET_RETENTION = timedelta(days=8)
+
+def _hour(at: datetime) -> datetime:
+    """Truncate a datetime to the start of its hour."""
+    return at.replace(minute=0, second=0, microsecond=0)
+
+def _empty_volume() -> Dict[str, int]:
+    """Volume and sales counters for every window, all zero."""
+    return {
+        f"{stat}_{window}": 0
+        for window in VOLUME_WINDOWS
+        for stat in ("volume_drops", "sales")
+    }
+
+def _refresh_floor(db, asset_type: Optional[str]) -> None:
+    """Recompute the floor price of an asset type from the active listings.
+
+    Uses the (status, asset_type, price_drops) index, so this is a single
+    index seek rather than a scan.
+    """
+    cheapest = db.marketplace_listings.find_one(
+        {"status": "active", "asset_type": asset_type},
+        {"_id": 0, "price_drops": 1},
+        sort=[("price_drops", 1)]
+    )
+    db.marketplace_stats.update_one(
+        {"asset_type": asset_type},
+        {"$set": {
+            "floor_price_drops": cheapest["price_drops"] if cheapest else None,
+            "updated_at": datetime.utcnow()
+        }}
+    )
+
+def record_listing_opened(listing: Dict[str, Any]) -> None:
+    """Account for a listing becoming active."""
+    try:
+        db = get_db()
+        # $min ignores a missing floor, so this is a single atomic update
+        db.marketplace_stats.update_one(
+            {"asset_type": listing.get("asset_type")},
+            [{"$set": {
+                "active_count": {"$add": [{"$ifNull": ["$active_count", 0]}, 1]},
+                "floor_price_drops": {"$min": ["$floor_price_drops", listing["price_drops"]]},
+                "updated_at": datetime.utcnow()
+            }}],
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("Failed to update stats for new listing: %s", e)
+
+def record_listing_closed(listing: Dict[str, Any]) -> None:
+    """Account for an active listing being sold, cancelled or invalidated."""
+    try:
+        db = get_db()
+        stats = db.marketplace_stats.find_one_and_update(
+            {"asset_type": listing.get("asset_type")},
+            {
+                "$inc": {"active_count": -1},
+                "$set": {"updated_at": datetime.utcnow()}
+            },
+            return_document=ReturnDocument.AFTER
+        )
+        # Only the floor listing leaving can raise the floor price
+        if stats and stats.get("floor_price_drops") == listing.get("price_drops"):
+            _refresh_floor(db, listing.get("asset_type"))
+    except Exception as e:
+        logger.warning("Failed to update stats for closed listing: %s", e)
+
+def record_sale(transaction: Dict[str, Any]) -> None:
+    """Account for a completed purchase in the volume buckets and last sale."""
+    try:
+        db = get_db()
+        asset_type = transaction.get("asset_type")
+        sold_at = transaction["created_at"]
+
+        db.marketplace_stats_hourly.update_one(
+            {"asset_type": asset_type, "hour": _hour(sold_at)},
+            {"$inc": {"volume_drops": transaction["price_drops"], "sales": 1}},
+            upsert=True
+        )
+        db.marketplace_stats.update_one(
+            {"asset_type": asset_type},
+            {
+                "$set": {
+                    "last_sale": {
+                        "nft_id": transaction["nft_id"],
+                        "price_drops": transaction["price_drops"],
+                        "transaction_hash": transaction["transaction_hash"],
+                        "sold_at": sold_at
+                    },
+                    "updated_at": datetime.utcnow()
+                },
+                "$setOnInsert": {"active_count": 0, "floor_price_drops": None}
+            },
+            upsert=True
+        )
+    except Exception as e:
+        logger.warning("Failed to update stats for sale: %s", e)
+
+def get_marketplace_stats(asset_type: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Get the marketplace statistics, optionally for a single asset type.
+
+    Reads one rollup document per asset type plus at most a week of hourly
+    buckets, independently of how many listings or sales exist.
+
+    Raises:
+        ValueError: If the statistics cannot be read
+    """
+    try:
+        db = get_db()
+        query = {} if asset_type is None else {"asset_type": asset_type}
+
+        stats = {
+            doc["asset_type"]: doc
+            for doc in db.marketplace_stats.find(query, {"_id": 0})
+        }
+
+        now = datetime.utcnow()
+        buckets = db.marketplace_stats_hourly.find(
+            {**query, "hour": {"$gte": _hour(now - VOLUME_WINDOWS["7d"])}},
+            {"_id": 0}
+        )
+        volumes = {}
+        for bucket in buckets:
+            volume = volumes.setdefault(bucket["asset_type"], _empty_volume())
+            for window, span in VOLUME_WINDOWS.items():
+                if bucket["hour"] >= _hour(now - span):
+                    volume[f"volume_drops_{window}"] += bucket["volume_drops"]
+                    volume[f"sales_{window}"] += bucket["sales"]
+
+        results = []
+        for key in sorted(set(stats) | set(volumes), key=lambda value: value or ""):
+            doc = stats.get(key, {"asset_type": key})
+            results.append({
+                "asset_type": key,
+                "active_count": doc.get("active_count", 0),
+                "floor_price_drops": doc.get("floor_price_drops"),
+                "last_sale": doc.get("last_sale"),
+                **volumes.get(key, _empty_volume())
+            })
+        return results
+    except Exception as e:
+        raise ValueError(f"Failed to get marketplace stats: {str(e)}")
+
+def rebuild_stats() -> Dict[str, int]:
+    """Recompute all statistics from listings and transactions.
+
+    Everything is computed by a single aggregation over marketplace_listings
+    that unions in the purchase history, then written back in bulk. Each
+    rollup and bucket is replaced in place and only the stale ones are
+    deleted, so /stats keeps answering during a rebuild and updates made by
+    concurrent sales are not rejected; one landing between the aggregation
+    and the write is overwritten, and counted again by the next rebuild.
+
+    Returns:
+        Dict[str, int]: Number of rollup documents and hourly buckets written
+    """
+    try:
+        db = get_db()
+        since = _hour(datetime.utcnow() - BUCKET_RETENTION)
+
+        rows = db.marketplace_listings.aggregate([
+            {"$match": {"status": "active"}},
+            {"$group": {
+                "_id": "$asset_type",
+                "active_count": {"$sum": 1},
+                "floor_price_drops": {"$min": "$price_drops"}
+            }},
+            {"$addFields": {"kind": "listings"}},
+            {"$unionWith": {"coll": "nft_transactions", "pipeline": [
+                {"$match": {"transaction_type": "purchase", "created_at": {"$gte": since}}},
+                {"$group": {
+                    "_id": {
+                        "asset_type": "$asset_type",
+                        "hour": {"$dateFromParts": {
+                            "year": {"$year": "$created_at"},
+                            "month": {"$month": "$created_at"},
+                            "day": {"$dayOfMonth": "$created_at"},
+                            "hour": {"$hour": "$created_at"}
+                        }}
+                    },
+                    "volume_drops": {"$sum": "$price_drops"},
+                    "sales": {"$sum": 1}
+                }},
+                {"$addFields": {"kind": "volume"}}
+            ]}},
+            {"$unionWith": {"coll": "nft_transactions", "pipeline": [
+                {"$match": {"transaction_type": "purchase"}},
+                {"$sort": {"created_at": -1}},
+                {"$group": {
+                    "_id": "$asset_type",
+                    "last_sale": {"$first": {
+                        "nft_id": "$nft_id",
+                        "price_drops": "$price_drops",
+                        "transaction_hash": "$transaction_hash",
+                        "sold_at": "$created_at"
+                    }}
+                }},
+                {"$addFields": {"kind": "last_sale"}}
+            ]}}
+        ])
+
+        now = datetime.utcnow()
+        rollups = {}
+        buckets = []
+        for row in rows:
+            if row["kind"] == "volume":
+                buckets.append({
+                    "asset_type": row["_id"]["asset_type"],
+                    "hour": row["_id"]["hour"],
+                    "volume_drops": row["volume_drops"],
+                    "sales": row["sales"]
+                })
+                continue
+            rollup = rollups.setdefault(row["_id"], {
+                "asset_type": row["_id"],
+                "active_count": 0,
+                "floor_price_drops": None,
+                "last_sale": None,
+                "updated_at": now
+            })
+            if row["kind"] == "listings":
+                rollup["active_count"] = row["active_count"]
+                rollup["floor_price_drops"] = row["floor_price_drops"]
+            else:
+                rollup["last_sale"] = row["last_sale"]
+
+        db.marketplace_stats.bulk_write([
+            *(ReplaceOne({"asset_type": key}, rollup, upsert=True) for key, rollup in rollups.items()),
+            DeleteMany({"asset_type": {"$nin": list(rollups)}})
+        ], ordered=False)
+
+        current = {(bucket["asset_type"], bucket["hour"]) for bucket in buckets}
+        stale = [
+            DeleteOne({"_id": bucket["_id"]})
+            for bucket in db.marketplace_stats_hourly.find({}, {"asset_type": 1, "hour": 1})
+            if (bucket.get("asset_type"), bucket["hour"]) not in current
+        ]
+        replaced = [
+            ReplaceOne({"asset_type": bucket["asset_type"], "hour": bucket["hour"]}, bucket, upsert=True)
+            for bucket in buckets
+        ]
+        if replaced or stale:
+            db.marketplace_stats_hourly.bulk_write(replaced + stale, ordered=False)
+
+        return {"asset_types": len(rollups), "buckets": len(buckets)}
+    except Exception as e:
+        raise ValueError(f"Failed to rebuild stats: {str(e)}")
+
+def ensure_stats_indexes(db) -> None:
+    """Create the indexes used by the statistics collections."""
+    db.marketplace_stats.create_index("asset_type", unique=True)
+    db.marketplace_stats_hourly.create_index([("asset_type", 1), ("hour", 1)], unique=True)
+    db.marketplace_stats_hourly.create_index(
+        "hour",
+        expireAfterSeconds=int(BUCKET_RETENTION.total_seconds())
+    )
@@ -0,0 +1,319 @@
+"""Write-behind buffer for history inserts
+
+Offers and purchase transactions are history: the request that creates them
+does not read them back, so their inserts are buffered and written by a
+background thread with one insert_many per collection, once max_batch
+documents are pending or every flush_interval seconds. Readers see them
+after at most flush_interval.
+
+A batch that cannot be written is saved to a spool file instead of being
+dropped. Each file is written under a temporary name and renamed once
+complete, so replays never read a file that is still being written. Spool
+files are replayed when a buffer starts and after the next successful
+flush; documents get their _id when buffered, so a replayed document that
+was already written is skipped as a duplicate. A worker claims a spool
+file by renaming it after its pid; claimed files are only taken over once
+that worker is gone or the claim is stale. Documents the server rejected
+WRITE_BEHIND_MAX_ATTEMPTS times are moved to the dead-letter directory.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import glob
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+# WRITE_BEHIND=0 inserts on the request path
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND", "1") == "1"
+
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", 500))
+WRITE_BEHIND_FLUSH_MS = float(os.getenv("WRITE_BEHIND_FLUSH_MS", 500))
+
+# Above this many pending documents, callers flush themselves
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", 10_000))
+
+WRITE_BEHIND_SPOOL_DIR = os.getenv("WRITE_BEHIND_SPOOL_DIR", "/var/tmp/rwa-write-behind")
+
+# Seconds after which a file claimed by a live worker is replayed again
+WRITE_BEHIND_CLAIM_SECONDS = float(os.getenv("WRITE_BEHIND_CLAIM_SECONDS", 600))
+
+# Writes a document may be rejected by the server before it is dead-lettered;
+# batches lost to connection errors are retried without limit
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", 5))
+
+# Subdirectory of the spool directory, one <collection>.ndjson file each
+DEAD_LETTER_DIR = "dead-letter"
+
+DUPLICATE_KEY = 11000
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindBuffer:
+    """Buffered inserts flushed by a background thread.
+
+    Args:
+        max_batch: Pending documents that trigger a flush
+        flush_interval: Maximum seconds a document stays buffered
+        max_pending: Pending documents above which add() flushes itself
+        spool_dir: Where batches that failed to be written are kept
+        max_attempts: Rejected writes of a document before it is dead-lettered
+        enabled: Buffer inserts, otherwise write them in add()
+    """
+
+    def __init__(
+        self,
+        max_batch: int = WRITE_BEHIND_MAX_BATCH,
+        flush_interval: float = WRITE_BEHIND_FLUSH_MS / 1000,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        spool_dir: str = WRITE_BEHIND_SPOOL_DIR,
+        max_attempts: int = WRITE_BEHIND_MAX_ATTEMPTS,
+        enabled: bool = WRITE_BEHIND_ENABLED
+    ):
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.spool_dir = spool_dir
+        self.max_attempts = max_attempts
+        self.enabled = enabled
+        self._pending: Dict[str, List[Dict[str, Any]]] = {}
+        self._count = 0
+        self._spooled = False
+        self._lock = threading.Lock()
+        # Held while writing or spooling, also by replay_spool() within flush()
+        self._flush_lock = threading.RLock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def pending(self) -> int:
+        """Documents buffered in this process"""
+        return self._count if self._pid == os.getpid() else 0
+
+    def add(self, collection: str, document: Dict[str, Any]) -> None:
+        """Queue a document for insertion.
+
+        The document gets its _id right away and must not be modified
+        afterwards.
+
+        Raises:
+            PyMongoError: Only when buffering is disabled
+        """
+        document.setdefault("_id", ObjectId())
+        if not self.enabled:
+            get_db()[collection].insert_one(document)
+            return
+        self._start()
+        with self._lock:
+            self._pending.setdefault(collection, []).append(document)
+            self._count += 1
+            count = self._count
+        if count >= self.max_pending:
+            self.flush()
+        elif count >= self.max_batch:
+            self._wake.set()
+
+    def flush(self) -> int:
+        """Write the pending documents, spooling the batches that fail.
+
+        Returns:
+            int: Number of documents written
+        """
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending, self._count = self._pending, {}, 0
+            written = 0
+            failed = False
+            for collection, documents in pending.items():
+                inserted, unwritten, rejected = self._insert(collection, documents)
+                written += inserted
+                if unwritten or rejected:
+                    failed = True
+                    self._retry(collection, unwritten, rejected, 0)
+            if pending and not failed and self._spooled:
+                self._spooled = False
+                self.replay_spool()
+            return written
+
+    def close(self, timeout: Optional[float] = 5.0) -> None:
+        """Stop the flush thread and write what is still pending."""
+        if self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            thread.join(timeout)
+        self._thread = None
+        self.flush()
+
+    def replay_spool(self) -> int:
+        """Write the batches spooled by any process, then delete their files.
+
+        Returns:
+            int: Number of documents written
+        """
+        with self._flush_lock:
+            return self._replay_spool()
+
+    def _replay_spool(self) -> int:
+        written = 0
+        claimed_paths = glob.glob(os.path.join(self.spool_dir, "*.replay")) + \
+            glob.glob(os.path.join(self.spool_dir, "*.tmp"))
+        paths = glob.glob(os.path.join(self.spool_dir, "*.ndjson")) + \
+            [path for path in claimed_paths if self._orphaned(path)]
+        for path in paths:
+            # Claim the file so other workers do not replay it at the same time
+            claimed = os.path.join(self.spool_dir, f"replay-{os.getpid()}-{uuid.uuid4().hex}.replay")
+            try:
+                os.rename(path, claimed)
+                with open(claimed, "rb") as spool:
+                    batches = self._read_spool(spool, path)
+            except FileNotFoundError:
+                continue
+            for (collection, attempts), documents in batches.items():
+                for start in range(0, len(documents), self.max_batch):
+                    inserted, unwritten, rejected = self._insert(collection, documents[start:start + self.max_batch])
+                    written += inserted
+                    self._retry(collection, unwritten, rejected, attempts)
+            try:
+                os.remove(claimed)
+            except FileNotFoundError:
+                pass
+        if written:
+            logger.info("Replayed %d spooled documents", written)
+        return written
+
+    def _orphaned(self, path: str) -> bool:
+        """Whether a claimed or partly written spool file was left by a worker that is gone."""
+        match = re.search(r"-(\d+)-", os.path.basename(path))
+        if match is None:
+            return True
+        pid = int(match.group(1))
+        if pid == os.getpid() or not _pid_alive(pid):
+            return True
+        try:
+            return time.time() - os.path.getmtime(path) > WRITE_BEHIND_CLAIM_SECONDS
+        except FileNotFoundError:
+            return False
+
+    def _read_spool(self, spool, path: str) -> Dict[Tuple[str, int], List[Dict[str, Any]]]:
+        """Group the spooled documents by collection and attempts, skipping torn lines."""
+        batches: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        for number, line in enumerate(spool, 1):
+            if not line.strip():
+                continue
+            try:
+                entry = json_util.loads(line)
+                key = (entry["collection"], entry.get("attempts", 0))
+                batches.setdefault(key, []).append(entry["document"])
+            except (ValueError, KeyError, TypeError):
+                # A worker that crashed while spooling leaves a partial line
+                logger.warning("Skipped undecodable line %d of %s", number, path)
+        return batches
+
+    def _insert(self, collection: str, documents: List[Dict[str, Any]]):
+        """Insert a batch.
+
+        Returns the number written, the documents not written because of a
+        connection error and the documents the server rejected.
+        """
+        try:
+            get_db()[collection].insert_many(documents, ordered=False)
+            return len(documents), [], []
+        except BulkWriteError as e:
+            failed = [error["index"] for error in e.details["writeErrors"] if error["code"] != DUPLICATE_KEY]
+            if failed:
+                logger.warning("Failed to write %d documents to %s", len(failed), collection)
+            return e.details["nInserted"], [], [documents[index] for index in failed]
+        except PyMongoError as e:
+            logger.warning("Failed to write %d documents to %s: %s", len(documents), collection, e)
+            return 0, documents, []
+
+    def _retry(self, collection: str, unwritten, rejected, attempts: int) -> None:
+        """Spool documents for the next replay, dead-lettering those rejected too often."""
+        if unwritten:
+            self._spool(collection, unwritten, attempts)
+        if rejected:
+            if attempts + 1 >= self.max_attempts:
+                self._dead_letter(collection, rejected)
+            else:
+                self._spool(collection, rejected, attempts + 1)
+
+    def _spool(self, collection: str, documents: List[Dict[str, Any]], attempts: int = 0) -> None:
+        os.makedirs(self.spool_dir, exist_ok=True)
+        name = f"write-behind-{os.getpid()}-{uuid.uuid4().hex}"
+        temporary = os.path.join(self.spool_dir, f"{name}.tmp")
+        path = os.path.join(self.spool_dir, f"{name}.ndjson")
+        with open(temporary, "wb") as spool:
+            for document in documents:
+                entry = {"collection": collection, "document": document, "attempts": attempts}
+                spool.write(json_util.dumps(entry).encode() + b"\n")
+            spool.flush()
+            os.fsync(spool.fileno())
+        # Only complete files have the name replays look for
+        os.rename(temporary, path)
+        self._spooled = True
+        logger.warning("Spooled %d documents for %s to %s", len(documents), collection, path)
+
+    def _dead_letter(self, collection: str, documents: List[Dict[str, Any]]) -> None:
+        directory = os.path.join(self.spool_dir, DEAD_LETTER_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{collection}.ndjson")
+        lines = b"".join(json_util.dumps(document).encode() + b"\n" for document in documents)
+        # A single append, so lines of concurrent workers do not interleave
+        with open(path, "ab") as dead_letter:
+            dead_letter.write(lines)
+            dead_letter.flush()
+            os.fsync(dead_letter.fileno())
+        logger.error("Gave up on %d documents for %s after %d attempts, see %s",
+                     len(documents), collection, self.max_attempts, path)
+
+    def _start(self) -> None:
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            # Documents inherited across fork are written by the parent
+            self._pending, self._count = {}, 0
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self.replay_spool()
+        except Exception:
+            logger.exception("Failed to replay spooled documents")
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+
+# Buffer shared by the services of this process
+write_behind = WriteBehindBuffer()
+atexit.register(write_behind.close)
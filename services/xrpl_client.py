@@ -0,0 +1,110 @@
+"""XRPL JSON-RPC clients with pooled connections and request timing
+
+Imported on first use by xrpl_service, since xrpl-py is the slowest
+dependency to import and most requests never reach the XRPL node.
+"""
+from typing import Optional
+from json import JSONDecodeError
+import asyncio
+import os
+import threading
+import time
+import weakref
+import httpx
+from xrpl.clients import JsonRpcClient
+from xrpl.asyncio.clients import AsyncJsonRpcClient, XRPLRequestFailureException
+from xrpl.asyncio.clients.utils import json_to_response, request_to_json_rpc
+from xrpl.models.requests.request import Request
+from xrpl.models.response import Response
+from .xrpl_service import REQUEST_TIMEOUT, _notify_listeners
+
+# Pooled HTTP client for sync requests, owned by the process that created it
+_http_client: Optional[httpx.Client] = None
+_http_client_pid: Optional[int] = None
+_http_client_lock = threading.Lock()
+
+# Pooled HTTP clients for async requests, one per event loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _get_http_client() -> httpx.Client:
+    global _http_client, _http_client_pid
+    if _http_client is None or _http_client_pid != os.getpid():
+        with _http_client_lock:
+            if _http_client is None or _http_client_pid != os.getpid():
+                # A client inherited across fork shares its sockets with the
+                # parent, so it is dropped rather than closed
+                _http_client = httpx.Client(timeout=REQUEST_TIMEOUT)
+                _http_client_pid = os.getpid()
+    return _http_client
+
+def close_http_clients() -> None:
+    """Close the pooled HTTP clients; new ones are created on next use"""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None and _http_client_pid == os.getpid():
+            _http_client.close()
+        _http_client = None
+    _async_http_clients.clear()
+
+def _parse_response(response: httpx.Response) -> Response:
+    try:
+        return json_to_response(response.json())
+    except JSONDecodeError:
+        raise XRPLRequestFailureException({
+            "error": response.status_code,
+            "error_message": response.text
+        })
+
+class InstrumentedJsonRpcClient(JsonRpcClient):
+    """JSON-RPC client reporting request durations to the registered listeners
+
+    Requests share a pooled HTTP client per process, so sync callers reuse
+    connections to the node instead of opening one per request.
+    """
+
+    async def _request_impl(self, request: Request, *, timeout: float = REQUEST_TIMEOUT) -> Response:
+        # Run by SyncClient.request() in a throwaway event loop, so the
+        # blocking call does not hold up any other coroutine
+        response = _get_http_client().post(
+            self.url,
+            json=request_to_json_rpc(request),
+            timeout=timeout
+        )
+        return _parse_response(response)
+
+    def request(self, request: Request) -> Response:
+        start = time.perf_counter()
+        try:
+            return super().request(request)
+        finally:
+            _notify_listeners(request, self.url, start)
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    http_client = _async_http_clients.get(loop)
+    if http_client is None:
+        http_client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+        _async_http_clients[loop] = http_client
+    return http_client
+
+class InstrumentedAsyncJsonRpcClient(AsyncJsonRpcClient):
+    """Async JSON-RPC client reporting request durations to the registered listeners
+    
+    Requests share a pooled HTTP client per event loop instead of opening a
+    new client and connection for every request.
+    """
+
+    async def _request_impl(self, request: Request, *, timeout: float = REQUEST_TIMEOUT) -> Response:
+        response = await _get_async_http_client().post(
+            self.url,
+            json=request_to_json_rpc(request),
+            timeout=timeout
+        )
+        return _parse_response(response)
+
+    async def request(self, request: Request) -> Response:
+        start = time.perf_counter()
+        try:
+            return await super().request(request)
+        finally:
+            _notify_listeners(request, self.url, start)
@@ -1,16 +1,106 @@
 """XRPL service for transaction handling"""
-from typing import Dict, Any, Optional
-import xrpl
-from xrpl.clients import JsonRpcClient
-from xrpl.models.requests import AccountNFTs, Tx
+from typing import TYPE_CHECKING, Dict, Any, Optional, Callable, List
+import logging
+import time
 import os
-from xrpl.models.transactions import NFTokenMint, Payment, NFTokenCreateOffer
-from xrpl.utils import str_to_hex
 
-def get_client() -> JsonRpcClient:
+if TYPE_CHECKING:
+    from xrpl.clients import JsonRpcClient
+    from xrpl.asyncio.clients import AsyncJsonRpcClient
+    from xrpl.models.requests.request import Request
+    from xrpl.models.response import Response
+
+logger = logging.getLogger(__name__)
+
+# Called after every XRPL request with (method, node_url, duration_ms)
+_request_listeners: List[Callable[[str, str, float], None]] = []
+
+def add_request_listener(listener: Callable[[str, str, float], None]) -> None:
+    """Register a callback notified of the duration of every XRPL request."""
+    if listener not in _request_listeners:
+        _request_listeners.append(listener)
+
+def _notify_listeners(request: "Request", node_url: str, start: float) -> None:
+    duration_ms = (time.perf_counter() - start) * 1000
+    for listener in _request_listeners:
+        listener(request.method.value, node_url, duration_ms)
+
+# Seconds to wait for a response from the XRPL node
+REQUEST_TIMEOUT = 10.0
+
+# The client module, once imported by _clients()
+_xrpl_client = None
+
+def _clients():
+    """Import the XRPL client module on first use"""
+    global _xrpl_client
+    if _xrpl_client is None:
+        from . import xrpl_client
+        _xrpl_client = xrpl_client
+    return _xrpl_client
+
+def close_http_clients() -> None:
+    """Close the pooled HTTP clients; new ones are created on next use"""
+    if _xrpl_client is not None:
+        _xrpl_client.close_http_clients()
+
+def get_node_url() -> str:
+    """Get the XRPL node JSON-RPC URL"""
+    return os.getenv("XRPL_NODE_URL", "https://s.altnet.rippletest.net:51234")
+
+def get_client() -> "JsonRpcClient":
     """Get XRPL client"""
-    node_url = os.getenv("XRPL_NODE_URL", "https://s.altnet.rippletest.net:51234")
-    return JsonRpcClient(node_url)
+    return _clients().InstrumentedJsonRpcClient(get_node_url())
+
+def get_async_client() -> "AsyncJsonRpcClient":
+    """Get async XRPL client"""
+    return _clients().InstrumentedAsyncJsonRpcClient(get_node_url())
+
+# NFTokenMint limits enforced by the ledger (transfer fee in 1/1000 percent,
+# URI in bytes, i.e. characters before hex encoding)
+MAX_TRANSFER_FEE = 50000
+MAX_URI_LENGTH = 256
+
+# NFTokenCreateOfferFlag.TF_SELL_NFTOKEN
+TF_SELL_NFTOKEN = 0x00000001
+
+# Fast template builders. These emit exactly what the xrpl-py models'
+# to_dict() returns, without the model's type checks and validation, for
+# callers whose inputs are already known to be valid.
+
+def build_nft_mint_tx(account: str, hex_uri: str, flags: int, transfer_fee: int, taxon: int) -> Dict[str, Any]:
+    """Build the NFTokenMint dict NFTokenMint(...).to_dict() would return"""
+    return {
+        "account": account,
+        "transaction_type": "NFTokenMint",
+        "flags": flags,
+        "signing_pub_key": "",
+        "nftoken_taxon": taxon,
+        "transfer_fee": transfer_fee,
+        "uri": hex_uri
+    }
+
+def build_payment_tx(account: str, destination: str, amount: str) -> Dict[str, Any]:
+    """Build the XRP Payment dict Payment(...).to_dict() would return"""
+    return {
+        "account": account,
+        "transaction_type": "Payment",
+        "signing_pub_key": "",
+        "amount": amount,
+        "destination": destination
+    }
+
+def build_nft_sell_offer_tx(account: str, nft_id: str, destination: str, amount: str) -> Dict[str, Any]:
+    """Build the sell offer dict NFTokenCreateOffer(...).to_dict() would return"""
+    return {
+        "account": account,
+        "transaction_type": "NFTokenCreateOffer",
+        "flags": TF_SELL_NFTOKEN,
+        "signing_pub_key": "",
+        "nftoken_id": nft_id,
+        "amount": amount,
+        "destination": destination
+    }
 
 def generate_nft_mint_template(
     account: str,
@@ -18,28 +108,38 @@ def generate_nft_mint_template(
     flags: int = 8,
     transfer_fee: int = 0,
     taxon: int = 0,
-    metadata: Dict[str, Any] = None
+    metadata: Dict[str, Any] = None,
+    validated: bool = False
 ) -> Dict[str, Any]:
-    """Generate an unsigned NFT mint transaction template"""
+    """Generate an unsigned NFT mint transaction template
+    
+    Args:
+        validated: Whether the caller already enforced the transfer fee and
+            URI length limits, in which case the transaction is built
+            directly instead of through the xrpl-py model
+    """
     try:
         # Convert URI to hex - this is what's actually stored on chain
-        hex_uri = str_to_hex(uri)
-        print(f"\nDebug - URI hex length: {len(hex_uri)}")
-        print(f"Debug - URI hex: {hex_uri}")
+        hex_uri = uri.encode("utf-8").hex()
+        logger.debug("Mint URI hex length %d: %s", len(hex_uri), hex_uri)
         
         # Create the transaction template
-        mint_tx = NFTokenMint(
-            account=account,
-            uri=hex_uri,
-            flags=int(flags),
-            transfer_fee=int(transfer_fee),
-            nftoken_taxon=int(taxon)
-        )
+        if validated:
+            template = build_nft_mint_tx(account, hex_uri, int(flags), int(transfer_fee), int(taxon))
+        else:
+            from xrpl.models.transactions import NFTokenMint
+            template = NFTokenMint(
+                account=account,
+                uri=hex_uri,
+                flags=int(flags),
+                transfer_fee=int(transfer_fee),
+                nftoken_taxon=int(taxon)
+            ).to_dict()
         
         # Convert to dictionary for JSON serialization
         return {
             "transaction_type": "NFTokenMint",
-            "template": mint_tx.to_dict(),
+            "template": template,
             "instructions": {
                 "fee": "10",  # Standard fee in drops
                 "sequence": None,  # Client needs to set this
@@ -52,21 +152,31 @@ def generate_nft_mint_template(
 def create_payment_template(
     account: str,
     destination: str,
-    amount_drops: int
+    amount_drops: int,
+    validated: bool = False
 ) -> Dict[str, Any]:
-    """Generate an unsigned XRP payment transaction template"""
+    """Generate an unsigned XRP payment transaction template
+    
+    Args:
+        validated: Whether the caller already checked the destination
+            differs from the account, skipping the xrpl-py model
+    """
     try:
         # Create the payment transaction
-        payment_tx = Payment(
-            account=account,
-            destination=destination,
-            amount=str(amount_drops)
-        )
+        if validated:
+            template = build_payment_tx(account, destination, str(amount_drops))
+        else:
+            from xrpl.models.transactions import Payment
+            template = Payment(
+                account=account,
+                destination=destination,
+                amount=str(amount_drops)
+            ).to_dict()
         
         # Convert to dictionary for JSON serialization
         return {
             "transaction_type": "Payment",
-            "template": payment_tx.to_dict(),
+            "template": template,
             "instructions": {
                 "fee": "10",
                 "sequence": None,
@@ -79,22 +189,33 @@ def create_payment_template(
 def create_nft_offer_template(
     account: str,
     destination: str,
-    nft_id: str
+    nft_id: str,
+    validated: bool = False
 ) -> Dict[str, Any]:
-    """Generate an unsigned NFT offer transaction template"""
+    """Generate an unsigned NFT sell offer transaction template
+    
+    Args:
+        validated: Whether the caller already checked the destination
+            differs from the account, skipping the xrpl-py model
+    """
     try:
         # Create the NFT offer transaction
-        offer_tx = NFTokenCreateOffer(
-            account=account,
-            nftoken_id=nft_id,
-            destination=destination,
-            amount="0"  # 0 since payment is handled separately
-        )
+        if validated:
+            template = build_nft_sell_offer_tx(account, nft_id, destination, "0")
+        else:
+            from xrpl.models.transactions import NFTokenCreateOffer, NFTokenCreateOfferFlag
+            template = NFTokenCreateOffer(
+                account=account,
+                nftoken_id=nft_id,
+                destination=destination,
+                amount="0",  # 0 since payment is handled separately
+                flags=NFTokenCreateOfferFlag.TF_SELL_NFTOKEN
+            ).to_dict()
         
         # Convert to dictionary for JSON serialization
         return {
             "transaction_type": "NFTokenCreateOffer",
-            "template": offer_tx.to_dict(),
+            "template": template,
             "instructions": {
                 "fee": "10",
                 "sequence": None,
@@ -142,73 +263,110 @@ def create_nft_sell_offer_template(
     except Exception as e:
         raise ValueError(f"Failed to generate NFT sell offer template: {str(e)}")
 
+def _check_transaction(tx_response: "Response", expected_type: Optional[str]) -> Dict[str, Any]:
+    """Interpret a tx response for verify_xrpl_transaction()"""
+    if not tx_response.is_successful():
+        return {
+            "success": False,
+            "message": "Failed to fetch transaction"
+        }
+        
+    tx_data = tx_response.result
+    
+    # Verify transaction type if specified
+    if expected_type and tx_data.get("TransactionType") != expected_type:
+        return {
+            "success": False,
+            "message": f"Transaction type mismatch. Expected {expected_type}"
+        }
+        
+    # Check if transaction was successful
+    if tx_data.get("meta", {}).get("TransactionResult") != "tesSUCCESS":
+        return {
+            "success": False,
+            "message": "Transaction was not successful"
+        }
+        
+    return {
+        "success": True,
+        "transaction": tx_data
+    }
+
 def verify_xrpl_transaction(transaction_hash: str, expected_type: str = None) -> Dict[str, Any]:
     """Verify a transaction on the XRPL"""
     try:
+        from xrpl.models.requests import Tx
         client = get_client()
         
         # Get transaction details
-        tx_response = client.request(xrpl.models.requests.Tx(
+        tx_response = client.request(Tx(
             transaction=transaction_hash
         ))
-        
-        if not tx_response.is_successful():
-            return {
-                "success": False,
-                "message": "Failed to fetch transaction"
-            }
-            
-        tx_data = tx_response.result
-        
-        # Verify transaction type if specified
-        if expected_type and tx_data.get("TransactionType") != expected_type:
-            return {
-                "success": False,
-                "message": f"Transaction type mismatch. Expected {expected_type}"
-            }
-            
-        # Check if transaction was successful
-        if tx_data.get("meta", {}).get("TransactionResult") != "tesSUCCESS":
-            return {
-                "success": False,
-                "message": "Transaction was not successful"
-            }
-            
+        return _check_transaction(tx_response, expected_type)
+    except Exception as e:
         return {
-            "success": True,
-            "transaction": tx_data
+            "success": False,
+            "message": f"Failed to verify transaction: {str(e)}"
         }
-        
+
+async def verify_xrpl_transaction_async(transaction_hash: str, expected_type: str = None) -> Dict[str, Any]:
+    """Async variant of verify_xrpl_transaction()"""
+    try:
+        from xrpl.models.requests import Tx
+        client = get_async_client()
+        tx_response = await client.request(Tx(
+            transaction=transaction_hash
+        ))
+        return _check_transaction(tx_response, expected_type)
     except Exception as e:
         return {
             "success": False,
             "message": f"Failed to verify transaction: {str(e)}"
         }
 
+def _owns_nft(response: "Response", nft_id: str) -> bool:
+    """Check an account_nfts response for an NFT"""
+    if not response.is_successful():
+        raise ValueError("Failed to fetch account NFTs")
+        
+    # Check if the NFT is in the account's NFTs
+    account_nfts = response.result.get("account_nfts", [])
+    for nft in account_nfts:
+        if nft.get("NFTokenID") == nft_id:
+            return True
+            
+    return False
+
 def verify_nft_ownership(account: str, nft_id: str) -> bool:
     """Verify if an account owns a specific NFT."""
     try:
+        from xrpl.models.requests import AccountNFTs
         client = get_client()
         
         # Use AccountNFTs request to get all NFTs owned by the account
-        request = xrpl.models.requests.AccountNFTs(
+        request = AccountNFTs(
             account=account,
             ledger_index="validated"
         )
         
         response = client.request(request)
-        if not response.is_successful():
-            raise ValueError("Failed to fetch account NFTs")
-            
-        # Check if the NFT is in the account's NFTs
-        account_nfts = response.result.get("account_nfts", [])
-        for nft in account_nfts:
-            if nft.get("NFTokenID") == nft_id:
-                return True
-                
-        return False
+        return _owns_nft(response, nft_id)
     except Exception as e:
         raise ValueError(f"Failed to verify NFT ownership: {str(e)}")
+
+async def verify_nft_ownership_async(account: str, nft_id: str) -> bool:
+    """Async variant of verify_nft_ownership()"""
+    try:
+        from xrpl.models.requests import AccountNFTs
+        client = get_async_client()
+        response = await client.request(AccountNFTs(
+            account=account,
+            ledger_index="validated"
+        ))
+        return _owns_nft(response, nft_id)
+    except Exception as e:
+        raise ValueError(f"Failed to verify NFT ownership: {str(e)}")
+
 def verify_transaction_signature(signed_tx: Dict[str, Any]) -> bool:
     """Verify the signature of a signed transaction"""
     # Skip verification as it will be handled by the XRPL network
@@ -9,6 +9,7 @@ setup(
         "flask==3.0.0",
         "flask-pymongo==2.3.0",
         "flask-cors==4.0.0",
+        "orjson>=3.9",
         "python-dotenv==1.0.0",
         "xrpl-py==2.4.0",
     ],
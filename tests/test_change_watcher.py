@@ -0,0 +1,215 @@
+import os
+import queue
+import time
+import pytest
+from unittest.mock import patch, MagicMock
+from pymongo.errors import AutoReconnect, OperationFailure
+from services import database
+from services.change_watcher import ChangeWatcher, TOKEN_COLLECTION
+from services.mongodb_service import listing_cache, version_cache
+
+# Change streams need a replica set, e.g. a single node started with
+# mongod --replSet rs0 and rs.initiate()
+REPLICA_SET_URI = os.getenv("MONGODB_REPLICA_SET_URI")
+
+@pytest.fixture
+def watcher():
+    """A watcher marked as running without opening a stream."""
+    watcher = ChangeWatcher(name="test")
+    watcher._running = True
+    watcher._pid = os.getpid()
+    yield watcher
+    listing_cache.clear()
+    version_cache.clear()
+
+def listing_change(listing_id, operation="update"):
+    """Change event for a listing, as projected by build_pipeline()."""
+    return {
+        "operationType": operation,
+        "ns": {"db": "rwa", "coll": "marketplace_listings"},
+        "fullDocument": {"listing_id": listing_id, "status": "sold"}
+    }
+
+def test_listing_change_invalidates_caches(watcher):
+    """Test a listing change drops that listing and the listings version."""
+    listing_cache.set("listing-1", {"listing_id": "listing-1"})
+    listing_cache.set("listing-2", {"listing_id": "listing-2"})
+    version_cache.set("listings", {"count": 2})
+
+    watcher.dispatch(listing_change("listing-1"))
+    assert listing_cache.get("listing-1") is None
+    assert listing_cache.get("listing-2") is not None
+    assert version_cache.get("listings") is None
+
+def test_nft_transfer_invalidates_every_account(watcher):
+    """Test an ownership change drops the versions of all accounts."""
+    version_cache.set(("account", "rSeller"), {"count": 1})
+    version_cache.set(("account", "rOther"), {"count": 3})
+    watcher.dispatch({
+        "operationType": "update",
+        "ns": {"db": "rwa", "coll": "nfts"},
+        "fullDocument": {"nft_id": "nft-1", "account": "rBuyer"},
+        "updateDescription": {"updatedFields": {"account": "rBuyer"}}
+    })
+    assert len(version_cache) == 0
+
+def test_cached_skips_load_racing_with_change(watcher):
+    """Test a value loaded while a change arrived is not cached."""
+    def load():
+        watcher.dispatch(listing_change("listing-1"))
+        return {"listing_id": "listing-1", "status": "active"}
+
+    assert watcher.cached(listing_cache, "listing-1", load)["status"] == "active"
+    assert listing_cache.get("listing-1") is None
+    watcher.cached(listing_cache, "listing-1", lambda: {"listing_id": "listing-1"})
+    assert listing_cache.get("listing-1") is not None
+
+def test_cached_bypassed_when_not_watching(watcher):
+    """Test watched caches are not used while the stream is down."""
+    watcher.reset()
+    watcher.cached(listing_cache, "listing-1", lambda: {"listing_id": "listing-1"})
+    assert len(listing_cache) == 0
+
+class FakeChangeStream:
+    """Change stream fed by the test, with the interface used by the watcher."""
+
+    def __init__(self, resume_after=None):
+        self.resume_token = resume_after
+        self.alive = True
+        self._changes = queue.Queue()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.alive = False
+
+    def push(self, change, token=None):
+        self._changes.put((change, token))
+
+    def try_next(self):
+        try:
+            change, token = self._changes.get(timeout=0.01)
+        except queue.Empty:
+            return None
+        if isinstance(change, Exception):
+            raise change
+        self.resume_token = {"_data": token}
+        return change
+
+@pytest.fixture
+def fake_streams():
+    """Database whose watch() opens a FakeChangeStream, with the watch() calls."""
+    streams, calls = [], []
+    db = MagicMock()
+    db.__getitem__.return_value.find_one.return_value = None
+
+    def watch(pipeline, resume_after=None, **kwargs):
+        calls.append(resume_after)
+        if isinstance(streams[len(calls) - 1], Exception):
+            raise streams[len(calls) - 1]
+        return streams[len(calls) - 1]
+
+    db.watch.side_effect = watch
+    with patch('services.change_watcher.get_db', return_value=db):
+        yield db, streams, calls
+    listing_cache.clear()
+
+def test_watch_loop_invalidates_and_resumes(fake_streams):
+    """Test the watcher thread invalidates on changes and reopens a failed stream from the saved token."""
+    db, streams, calls = fake_streams
+    streams += [FakeChangeStream(), FakeChangeStream({"_data": "token-1"})]
+    watcher = ChangeWatcher(name="test", token_save_interval=0, retry_interval=0.01)
+    watcher.start()
+    try:
+        assert wait_for(lambda: watcher.running)
+        watcher.cached(listing_cache, "listing-1", lambda: {"listing_id": "listing-1", "status": "active"})
+        assert listing_cache.get("listing-1") is not None
+
+        streams[0].push(listing_change("listing-1"), token="token-1")
+        assert wait_for(lambda: listing_cache.get("listing-1") is None)
+        saved = db.__getitem__.return_value.update_one.call_args[0][1]["$set"]["resume_token"]
+        assert saved == {"_data": "token-1"}
+
+        # A failed stream clears the caches, changes may have been missed
+        watcher.cached(listing_cache, "listing-2", lambda: {"listing_id": "listing-2"})
+        streams[0].push(AutoReconnect("connection reset"))
+        assert wait_for(lambda: len(calls) == 2 and watcher.running)
+        assert calls == [None, {"_data": "token-1"}]
+        assert listing_cache.get("listing-2") is None
+    finally:
+        watcher.stop()
+
+def test_watch_loop_forgets_stale_token(fake_streams):
+    """Test a resume token the server no longer knows is dropped and the stream reopened from now."""
+    db, streams, calls = fake_streams
+    tokens = db.__getitem__.return_value
+    tokens.find_one.side_effect = lambda query: None if tokens.delete_one.called else {"resume_token": {"_data": "token-0"}}
+    streams += [OperationFailure("history lost", code=286), FakeChangeStream()]
+    watcher = ChangeWatcher(name="test", retry_interval=60)
+    watcher.start()
+    try:
+        assert wait_for(lambda: watcher.running)
+        assert calls == [{"_data": "token-0"}, None]
+        tokens.delete_one.assert_called_once_with({"_id": "test"})
+    finally:
+        watcher.stop()
+
+@pytest.fixture
+def replica_set():
+    """Point the shared client at a replica set."""
+    if not REPLICA_SET_URI:
+        pytest.skip("MONGODB_REPLICA_SET_URI is not set")
+    with patch.dict(os.environ, {"MONGODB_URI": REPLICA_SET_URI, "MONGODB_DB": "rwa_change_watcher_test"}):
+        database.close_client()
+        db = database.get_db()
+        db.marketplace_listings.delete_many({})
+        db[TOKEN_COLLECTION].delete_many({})
+        yield db
+        database.get_client().drop_database("rwa_change_watcher_test")
+        database.close_client()
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.05)
+    return True
+
+def test_change_stream_invalidation(replica_set):
+    """Test writes through another client invalidate this worker's cache."""
+    watcher = ChangeWatcher(name="test", token_save_interval=0)
+    watcher.start()
+    try:
+        assert wait_for(lambda: watcher.running)
+        replica_set.marketplace_listings.insert_one({"listing_id": "listing-1", "status": "active"})
+        assert wait_for(lambda: replica_set[TOKEN_COLLECTION].find_one({"_id": "test"}) is not None)
+
+        watcher.cached(listing_cache, "listing-1", lambda: {"listing_id": "listing-1", "status": "active"})
+        assert listing_cache.get("listing-1") is not None
+        replica_set.marketplace_listings.update_one({"listing_id": "listing-1"}, {"$set": {"status": "cancelled"}})
+        assert wait_for(lambda: listing_cache.get("listing-1") is None)
+    finally:
+        watcher.stop()
+        listing_cache.clear()
+
+def test_change_stream_resumes_from_stored_token(replica_set):
+    """Test a restarted watcher receives the changes made while it was down."""
+    seen = []
+    watcher = ChangeWatcher(name="test", token_save_interval=0)
+    watcher.start()
+    assert wait_for(lambda: watcher.running)
+    watcher.stop()
+
+    replica_set.marketplace_listings.insert_one({"listing_id": "listing-2", "status": "active"})
+
+    restarted = ChangeWatcher(name="test", token_save_interval=0)
+    with patch.object(restarted, "dispatch", side_effect=seen.append):
+        restarted.start()
+        try:
+            assert wait_for(lambda: any(
+                (change.get("fullDocument") or {}).get("listing_id") == "listing-2" for change in seen
+            ))
+        finally:
+            restarted.stop()
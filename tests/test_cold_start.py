@@ -0,0 +1,75 @@
+"""Cold start budget for serverless deployments
+
+Each cold start imports the application in a fresh interpreter before the
+first request is served. The budget covers that import, measured with
+``python -X importtime``; see "Cold start" in docs/marketplace_api.md.
+Run with ``pytest -s`` to print the per-package report.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+import pytest
+
+# Milliseconds to import the application, including creating it
+COLD_START_BUDGET_MS = float(os.getenv("COLD_START_BUDGET_MS", 1000))
+
+# Only needed once a request reaches the XRPL node or computes candles
+LAZY_MODULES = ("xrpl", "numpy", "httpx")
+
+PROBE = """
+import json, sys
+import backend.wsgi
+from backend.services import database
+print(json.dumps({"modules": sorted(sys.modules), "connected": database._client is not None}))
+"""
+
+def import_report(stderr):
+    """Parse -X importtime output into total and per-package self times in ms."""
+    packages = defaultdict(float)
+    total = 0.0
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        packages[name.strip().split(".")[0]] += int(self_us) / 1000
+        if len(name) - len(name.lstrip()) == 1:
+            # Cumulative times of top level imports add up to the whole
+            # startup, the interpreter's own site imports included
+            total += int(cumulative_us) / 1000
+    return total, dict(packages)
+
+@pytest.fixture(scope="module")
+def cold_start():
+    """Import the application in a fresh interpreter, as a cold start does."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), VERCEL="1")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", PROBE],
+        capture_output=True, text=True, env=env, timeout=60
+    )
+    assert result.returncode == 0, result.stderr[-2000:]
+    total, packages = import_report(result.stderr)
+    probe = json.loads(result.stdout.splitlines()[-1])
+
+    print(f"\nCold start import: {total:.0f} ms (budget {COLD_START_BUDGET_MS:.0f} ms)")
+    for name, ms in sorted(packages.items(), key=lambda item: -item[1])[:15]:
+        print(f"  {name:30s} {ms:8.1f} ms")
+    return total, probe
+
+def test_cold_start_budget(cold_start):
+    """Test importing and creating the app stays within the cold start budget."""
+    total, _ = cold_start
+    assert total <= COLD_START_BUDGET_MS
+
+def test_heavy_modules_are_lazy(cold_start):
+    """Test XRPL and numpy are only imported by the requests that need them."""
+    _, probe = cold_start
+    loaded = [name for name in probe["modules"] if name.split(".")[0] in LAZY_MODULES]
+    assert loaded == []
+
+def test_no_connection_at_import(cold_start):
+    """Test MongoDB is not contacted before the first request."""
+    _, probe = cold_start
+    assert probe["connected"] is False
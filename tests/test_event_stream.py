@@ -0,0 +1,62 @@
+from services.event_stream import EventBroker, iter_frames, listing_event, nft_event, RESET_EVENT
+
+def test_replay_and_fan_out():
+    """Test events are replayed after Last-Event-ID and queued for every client."""
+    broker = EventBroker(buffer_size=10, client_buffer=10)
+    for i in range(3):
+        broker.publish("listing.created", {"listing_id": f"listing-{i}"}, event_id=f"token-{i}")
+
+    resumed = broker.subscribe("token-0")
+    fresh = broker.subscribe()
+    assert resumed.get(0).startswith(b"id: token-1\n")
+    assert resumed.get(0).startswith(b"id: token-2\n")
+    assert fresh.get(0) is None
+
+    broker.publish("listing.sold", {"listing_id": "listing-0"}, event_id="token-3")
+    assert resumed.get(0) == fresh.get(0)
+
+def test_unknown_last_event_id_resets():
+    """Test a client resuming from an event no longer buffered is told to reload."""
+    broker = EventBroker(buffer_size=2, client_buffer=10)
+    for i in range(3):
+        broker.publish("listing.created", {}, event_id=f"token-{i}")
+    subscription = broker.subscribe("token-0")
+    assert f"event: {RESET_EVENT}".encode() in subscription.get(0)
+
+def test_slow_client_is_dropped():
+    """Test a client that falls behind its buffer is dropped and sent a reset."""
+    broker = EventBroker(buffer_size=10, client_buffer=2)
+    subscription = broker.subscribe()
+    for i in range(3):
+        broker.publish("listing.created", {}, event_id=f"token-{i}")
+    assert subscription.overflowed
+    assert len(broker) == 0
+
+    frames = list(iter_frames(subscription, heartbeat=0.01, max_seconds=1))
+    assert f"event: {RESET_EVENT}".encode() in frames[-1]
+
+def test_heartbeat():
+    """Test an idle stream sends keep-alive comments until it expires."""
+    broker = EventBroker()
+    frames = list(iter_frames(broker.subscribe(), heartbeat=0.01, max_seconds=0.05))
+    assert frames[0].startswith(b"retry:")
+    assert b": keep-alive\n\n" in frames
+
+def test_change_events():
+    """Test listing and NFT changes map to stream events."""
+    sold = {
+        "operationType": "update",
+        "fullDocument": {"listing_id": "listing-1", "status": "sold", "search_text": "x"},
+        "updateDescription": {"updatedFields": {"status": "sold"}}
+    }
+    assert listing_event(sold) == ("listing.sold", {"listing_id": "listing-1", "status": "sold"})
+    repriced = {**sold, "updateDescription": {"updatedFields": {"price_drops": 5}}}
+    assert listing_event(repriced)[0] == "listing.updated"
+
+    transfer = {
+        "operationType": "update",
+        "fullDocument": {"nft_id": "nft-1", "account": "rBuyer"},
+        "updateDescription": {"updatedFields": {"account": "rBuyer"}}
+    }
+    assert nft_event(transfer) == ("nft.transferred", {"nft_id": "nft-1", "account": "rBuyer"})
+    assert nft_event({**transfer, "updateDescription": {"updatedFields": {"status": "x"}}}) is None
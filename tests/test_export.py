@@ -0,0 +1,90 @@
+import gzip
+import json
+import os
+import pytest
+from datetime import datetime
+from unittest.mock import patch
+from bson import ObjectId
+from app import create_app
+from services.export_service import export_ndjson, iter_ndjson, iter_gzip
+
+@pytest.fixture
+def app():
+    """Create and configure a test Flask application."""
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    """Create a test client."""
+    return app.test_client()
+
+def test_iter_ndjson_chunks():
+    """Test documents are encoded one per line and yielded in chunks."""
+    documents = ({"_id": ObjectId(), "n": n, "created_at": datetime(2025, 1, 10)} for n in range(100))
+    chunks = list(iter_ndjson(documents, chunk_size=256))
+    assert len(chunks) > 1
+    lines = b"".join(chunks).splitlines()
+    assert len(lines) == 100
+    first = json.loads(lines[0])
+    assert first["n"] == 0
+    assert first["created_at"].startswith("2025-01-10T00:00:00")
+
+def test_iter_gzip():
+    """Test compressed chunks form a single gzip stream."""
+    chunks = [b'{"n":1}\n' * 1000, b'{"n":2}\n']
+    assert gzip.decompress(b"".join(iter_gzip(chunks))) == b"".join(chunks)
+
+def test_export_uses_batched_cursor():
+    """Test exports read a sorted server-side cursor with the batch size."""
+    documents = [{"_id": ObjectId(), "listing_id": "listing-1"}]
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.return_value.__enter__.return_value = iter(documents)
+
+        body = b"".join(export_ndjson("listings", batch_size=50))
+        assert json.loads(body)["listing_id"] == "listing-1"
+        args, kwargs = mock_find.call_args
+        assert args[1] == {"search_text": 0}
+        assert kwargs["batch_size"] == 50
+        assert kwargs["sort"] == [("_id", 1)]
+
+        with pytest.raises(ValueError):
+            export_ndjson("users")
+        with pytest.raises(ValueError):
+            export_ndjson("nfts", after="not-an-id")
+
+AUTHORIZATION = {'Authorization': 'Bearer secret'}
+
+def test_export_route(client):
+    """Test the export route streams NDJSON and gzips it when accepted."""
+    with patch.dict(os.environ, {'EXPORT_API_TOKEN': 'secret'}), \
+         patch('backend.routes.export_routes.export_ndjson') as mock_export:
+        mock_export.return_value = iter([b'{"nft_id":"nft-1"}\n'])
+        response = client.get('/api/export/nfts?batch_size=10', headers=AUTHORIZATION)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        assert response.is_streamed
+        assert 'Accept-Encoding' in response.vary
+        assert json.loads(response.data)["nft_id"] == "nft-1"
+        mock_export.assert_called_once_with('nfts', after=None, compress=False, batch_size=10)
+
+        mock_export.return_value = iter([gzip.compress(b'{"nft_id":"nft-1"}\n')])
+        response = client.get('/api/export/nfts', headers={**AUTHORIZATION, 'Accept-Encoding': 'gzip'})
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.vary
+        assert mock_export.call_args.kwargs['compress'] is True
+
+        mock_export.side_effect = ValueError("Unknown export: users")
+        assert client.get('/api/export/users', headers=AUTHORIZATION).status_code == 400
+
+def test_export_route_token(client):
+    """Test exports require the bearer token and are disabled without one."""
+    with patch('backend.routes.export_routes.export_ndjson') as mock_export:
+        mock_export.return_value = iter([])
+        with patch.dict(os.environ, {'EXPORT_API_TOKEN': ''}):
+            assert client.get('/api/export/nfts', headers=AUTHORIZATION).status_code == 404
+        with patch.dict(os.environ, {'EXPORT_API_TOKEN': 'secret'}):
+            assert client.get('/api/export/nfts').status_code == 401
+            assert client.get('/api/export/nfts', headers={'Authorization': 'Bearer other'}).status_code == 401
+            assert client.get('/api/export/nfts', headers=AUTHORIZATION).status_code == 200
+        mock_export.assert_called_once()
@@ -0,0 +1,69 @@
+import pytest
+from app import create_app
+from unittest.mock import patch
+from services import health_service
+
+@pytest.fixture
+def app():
+    """Create and configure a test Flask application."""
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    """Create a test client."""
+    return app.test_client()
+
+@pytest.fixture
+def healthy():
+    """Patch both dependency checks to succeed."""
+    with patch('backend.services.health_service.check_mongodb') as mock_mongodb, \
+         patch('backend.services.health_service.check_xrpl') as mock_xrpl:
+        mock_mongodb.return_value = {"ok": True, "latency_ms": 1.5}
+        mock_xrpl.return_value = {"ok": True, "latency_ms": 80.0}
+        yield mock_mongodb, mock_xrpl
+
+def test_liveness(client):
+    """Test liveness does not depend on MongoDB or XRPL."""
+    with patch('backend.services.health_service.check_mongodb') as mock_mongodb:
+        response = client.get('/health/live')
+    assert response.status_code == 200
+    assert response.json == {'status': 'alive'}
+    mock_mongodb.assert_not_called()
+
+def test_readiness(client, healthy):
+    """Test readiness reports each dependency's latency."""
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.json['status'] == 'ready'
+    assert response.json['checks']['mongodb']['latency_ms'] == 1.5
+    assert response.json['checks']['xrpl']['latency_ms'] == 80.0
+
+def test_readiness_dependency_down(client, healthy):
+    """Test readiness fails when a dependency is slow or unreachable."""
+    healthy[1].return_value = {"ok": False, "error": "XRPL check failed: timed out"}
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.json['status'] == 'unavailable'
+
+def test_readiness_draining(client, healthy):
+    """Test readiness fails once the worker starts draining."""
+    with patch('backend.services.health_service.is_draining', return_value=True):
+        response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.json['draining'] is True
+
+def test_draining():
+    """Test the draining flag is set on mark_draining()."""
+    assert not health_service.is_draining()
+    health_service.mark_draining()
+    assert health_service.is_draining()
+    health_service._draining.clear()
+
+def test_check_mongodb_latency_budget():
+    """Test a dependency answering over its latency budget is not ready."""
+    with patch.object(health_service, 'get_db'), \
+         patch.dict('os.environ', {'READY_MONGODB_MAX_MS': '-1'}):
+        result = health_service.check_mongodb()
+    assert result['ok'] is False
+    assert 'latency_ms' in result
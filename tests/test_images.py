@@ -0,0 +1,217 @@
+import base64
+import io
+import json
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch, MagicMock
+from PIL import Image
+from app import create_app
+from services.image_service import (
+    DERIVATIVE_SIZES,
+    ImageTooLarge,
+    UnsupportedImageType,
+    render_derivatives,
+    schedule_derivatives,
+    sniff_content_type,
+    store_image_stream
+)
+
+@pytest.fixture
+def app():
+    """Create and configure a test Flask application."""
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    """Create a test client."""
+    return app.test_client()
+
+def encode_image(mode, size, format="PNG"):
+    output = io.BytesIO()
+    Image.new(mode, size, "red" if mode != "P" else 1).save(output, format)
+    return output.getvalue()
+
+@pytest.mark.parametrize("mode,format", [("RGBA", "PNG"), ("P", "GIF"), ("RGB", "JPEG"), ("L", "PNG")])
+def test_render_derivatives(mode, format):
+    """Test every size fits its box and keeps the aspect ratio."""
+    derivatives = render_derivatives(encode_image(mode, (2000, 1000), format))
+    assert set(derivatives) == set(DERIVATIVE_SIZES)
+    for size, edge in DERIVATIVE_SIZES.items():
+        derivative = derivatives[size]
+        assert (derivative["width"], derivative["height"]) == (edge, edge // 2)
+        image = Image.open(io.BytesIO(derivative["data"]))
+        assert image.size == (edge, edge // 2)
+        assert derivative["content_type"] == Image.MIME[image.format]
+
+def test_render_derivatives_small_image():
+    """Test images smaller than a derivative are never upscaled."""
+    derivatives = render_derivatives(encode_image("RGB", (100, 50)))
+    assert derivatives["small"]["width"] == 100
+
+def test_schedule_derivatives():
+    """Test only the image ID is sent to the pool, which reads the original and stores the derivatives."""
+    stored = {}
+    done = threading.Event()
+
+    def store(image_id, derivatives):
+        stored[image_id] = derivatives
+        done.set()
+
+    original = encode_image("RGB", (1024, 1024))
+    pool = ThreadPoolExecutor(1)
+    try:
+        with patch('services.image_service._get_pool', return_value=pool), \
+             patch.object(pool, 'submit', wraps=pool.submit) as mock_submit, \
+             patch('services.image_service.open_uploaded_image', return_value=io.BytesIO(original)), \
+             patch('services.image_service.store_derivatives', side_effect=store):
+            assert schedule_derivatives("image-1") is not None
+            assert done.wait(60)
+            assert mock_submit.call_args[0][1:] == ("image-1",)
+    finally:
+        pool.shutdown()
+    assert stored["image-1"]["small"]["width"] == DERIVATIVE_SIZES["small"]
+
+def test_get_image_route(client):
+    """Test derivatives are served as binary with the original as fallback."""
+    with patch('backend.routes.transaction_routes.get_image_derivative') as mock_derivative, \
+         patch('backend.routes.transaction_routes.open_uploaded_image', return_value=None), \
+         patch('backend.routes.transaction_routes.get_nft_image') as mock_image:
+        mock_derivative.return_value = {"data": b"webp-bytes", "content_type": "image/webp"}
+        mock_image.return_value = base64.b64encode(b"original-bytes").decode()
+
+        response = client.get('/api/transaction/image/image-1?size=small')
+        assert response.status_code == 200
+        assert response.data == b"webp-bytes"
+        assert response.mimetype == "image/webp"
+        assert "immutable" in response.headers["Cache-Control"]
+
+        mock_derivative.return_value = None
+        response = client.get('/api/transaction/image/image-1?size=small')
+        assert response.data == b"original-bytes"
+        assert "immutable" not in response.headers["Cache-Control"]
+
+        response = client.get('/api/transaction/image/image-1')
+        assert response.data == b"original-bytes"
+
+        mock_image.return_value = None
+        assert client.get('/api/transaction/image/image-1').status_code == 404
+
+def test_get_uploaded_image_route(client):
+    """Test streamed uploads are sent one GridFS chunk at a time."""
+    chunks = [b"\x89PNG\r\n\x1a\n" + b"\n" * 100, b"a\nb\nc", b""]
+    upload = MagicMock(metadata={"content_type": "image/png"}, length=sum(map(len, chunks)))
+    upload.readchunk.side_effect = chunks
+    with patch('backend.routes.transaction_routes.open_uploaded_image', return_value=upload):
+        response = client.get('/api/transaction/image/image-1', buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == "image/png"
+        assert list(response.response) == chunks[:-1]
+        response.close()
+    upload.close.assert_called_once()
+
+def test_address_nfts_image_size(client):
+    """Test portfolios embed the requested image derivative."""
+    with patch('backend.routes.transaction_routes.get_account_nfts_version') as mock_version, \
+         patch('backend.routes.transaction_routes.get_account_nfts') as mock_nfts, \
+         patch('backend.routes.transaction_routes.get_metadata_with_image') as mock_metadata:
+        mock_version.return_value = {"count": 1, "updated_at": None}
+        mock_nfts.return_value = [{"nft_id": "test-nft-id", "metadata": {"metadata_hash": "test-hash"}}]
+        mock_metadata.return_value = {"title": "Test NFT", "image_size": "small"}
+
+        response = client.get('/api/transaction/nfts/rTestAddress123?size=small')
+        assert response.status_code == 200
+        assert response.headers.get('ETag')
+        mock_metadata.assert_called_once_with("test-hash", "small")
+
+        response = client.get('/api/transaction/nfts/rTestAddress123?size=huge')
+        assert response.status_code == 400
+
+def test_address_nfts_image_fallback_not_validated(client):
+    """Test portfolios embedding an original in place of a derivative get no ETag."""
+    with patch('backend.routes.transaction_routes.get_account_nfts_version') as mock_version, \
+         patch('backend.routes.transaction_routes.get_account_nfts') as mock_nfts, \
+         patch('backend.routes.transaction_routes.get_metadata_with_image') as mock_metadata:
+        mock_version.return_value = {"count": 1, "updated_at": None}
+        mock_nfts.return_value = [{"nft_id": "test-nft-id", "metadata": {"metadata_hash": "test-hash"}}]
+        mock_metadata.return_value = {"title": "Test NFT", "image_size": "original"}
+
+        response = client.get('/api/transaction/nfts/rTestAddress123?size=small')
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
+        assert response.headers['Cache-Control'] == 'max-age=60'
+
+def test_sniff_content_type():
+    """Test accepted formats are recognized from their first bytes."""
+    assert sniff_content_type(encode_image("RGB", (8, 8), "PNG")) == "image/png"
+    assert sniff_content_type(encode_image("RGB", (8, 8), "JPEG")) == "image/jpeg"
+    assert sniff_content_type(encode_image("RGB", (8, 8), "WEBP")) == "image/webp"
+    assert sniff_content_type(b"<svg xmlns=...") is None
+
+def test_store_image_stream_limits():
+    """Test uploads are rejected early and their partial chunks deleted."""
+    image = encode_image("RGB", (256, 256), "PNG")
+    with patch('services.image_service._bucket') as mock_bucket:
+        upload = mock_bucket.return_value.open_upload_stream.return_value
+        upload.closed = False
+        with pytest.raises(UnsupportedImageType):
+            store_image_stream(iter([b"<svg>", b"not an image"]))
+        mock_bucket.return_value.open_upload_stream.assert_not_called()
+
+        chunks = [image[i:i + 100] for i in range(0, len(image), 100)]
+        with pytest.raises(ImageTooLarge):
+            store_image_stream(iter(chunks), max_bytes=len(image) - 1)
+        upload.abort.assert_called_once()
+        upload.close.assert_not_called()
+
+def test_upload_image_route(client):
+    """Test raw and multipart uploads are streamed to storage."""
+    image = encode_image("RGB", (64, 64), "PNG")
+    received = []
+
+    def store(chunks):
+        received.append(b"".join(chunks))
+        return {"image_id": "image-1", "content_type": "image/png", "size": len(received[-1]), "sha256": "x"}
+
+    with patch('backend.routes.transaction_routes.store_image_stream', side_effect=store) as mock_store:
+        response = client.post('/api/transaction/image/upload', data=image, content_type='image/png')
+        assert response.status_code == 201
+        assert json.loads(response.data)["image_id"] == "image-1"
+        assert received[-1] == image
+
+        response = client.post(
+            '/api/transaction/image/upload',
+            data={"title": "x", "file": (io.BytesIO(image), "image.png", "image/png")},
+            content_type='multipart/form-data'
+        )
+        assert response.status_code == 201
+        assert received[-1] == image
+
+        response = client.post('/api/transaction/image/upload', json={"image": "base64"})
+        assert response.status_code == 415
+
+        # Oversized bodies are refused before being read
+        with patch('backend.routes.transaction_routes.IMAGE_UPLOAD_MAX_BYTES', 10):
+            response = client.post('/api/transaction/image/upload', data=image, content_type='image/png')
+        assert response.status_code == 413
+        assert mock_store.call_count == 2
+
+def test_mint_template_image_id(client):
+    """Test mint templates reference an uploaded image by its ID."""
+    with patch('backend.routes.transaction_routes.image_exists') as mock_exists, \
+         patch('backend.routes.transaction_routes.store_metadata') as mock_store, \
+         patch('backend.routes.transaction_routes.generate_nft_mint_template') as mock_template:
+        mock_store.return_value = ("0123456789abcdef", "metadata-id")
+        mock_template.return_value = {"TransactionType": "NFTokenMint"}
+        body = {"account": "rTestAddress123", "metadata": {"title": "Test NFT"}, "image_id": "image-1"}
+
+        mock_exists.return_value = False
+        assert client.post('/api/transaction/nft/mint/template', json=body).status_code == 400
+
+        mock_exists.return_value = True
+        response = client.post('/api/transaction/nft/mint/template', json=body)
+        assert response.status_code == 200
+        metadata, image_data = mock_store.call_args[0]
+        assert metadata["image_id"] == "image-1"
+        assert image_data is None
@@ -0,0 +1,43 @@
+import pytest
+from datetime import datetime
+from bson import ObjectId
+from flask import Flask, json
+from json_provider import ORJSONProvider
+
+@pytest.fixture
+def json_app():
+    """Create a bare Flask application using the orjson provider."""
+    app = Flask(__name__)
+    app.json = ORJSONProvider(app)
+    return app
+
+@pytest.fixture
+def provider(json_app):
+    """Get the application's JSON provider."""
+    return json_app.json
+
+def test_encodes_mongodb_types(provider):
+    """Test ObjectId, datetime and bytes are encoded natively."""
+    object_id = ObjectId()
+    payload = {
+        "_id": object_id,
+        "created_at": datetime(2025, 1, 10),
+        "data": b"image"
+    }
+
+    result = json.loads(provider.dumps(payload))
+    assert result["_id"] == str(object_id)
+    assert result["created_at"] == "2025-01-10T00:00:00+00:00"
+    assert result["data"] == "aW1hZ2U="
+
+def test_response_is_json(json_app):
+    """Test response() returns the encoded payload."""
+    with json_app.app_context():
+        response = json_app.json.response({"count": 1})
+    assert response.mimetype == "application/json"
+    assert response.get_json() == {"count": 1}
+
+def test_rejects_unknown_types(provider):
+    """Test unsupported objects still raise TypeError."""
+    with pytest.raises(TypeError):
+        provider.dumps({"value": object()})
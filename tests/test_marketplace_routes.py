@@ -1,7 +1,9 @@
 import pytest
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import json
 from app import create_app
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 
 @pytest.fixture
 def app():
@@ -12,4 +14,201 @@ def app():
 @pytest.fixture
 def client(app):
     """Create a test client."""
-    return app.test_client() 
\ No newline at end of file
+    return app.test_client() 
+
+@pytest.fixture
+def mock_listings():
+    """Patch the listing queries used by the listings feed."""
+    with patch('backend.routes.marketplace_routes.get_listings_version') as mock_version, \
+         patch('backend.routes.marketplace_routes.get_active_listings') as mock_listings:
+        mock_version.return_value = {"count": 1, "updated_at": "2025-01-10T00:00:00"}
+        mock_listings.return_value = [{
+            "listing_id": "test-listing-id",
+            "nft_id": "test-nft-id",
+            "price_drops": 100_000_000,
+            "metadata": {"description": "x" * 4096},
+            "status": "active"
+        }]
+        yield mock_listings
+
+def test_listings_conditional_get(client, mock_listings):
+    """Test listings return a weak ETag and honour If-None-Match."""
+    response = client.get('/api/marketplace/listings')
+    assert response.status_code == 200
+    etag = response.headers['ETag']
+    assert etag.startswith('W/')
+
+    response = client.get('/api/marketplace/listings', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+    # The listings are only loaded for the first request
+    assert mock_listings.call_count == 1
+
+def test_listings_gzip(client, mock_listings):
+    """Test large listing payloads are compressed when accepted."""
+    response = client.get('/api/marketplace/listings', headers={'Accept-Encoding': 'gzip'})
+    assert response.status_code == 200
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    response = client.get('/api/marketplace/listings')
+    assert 'Content-Encoding' not in response.headers
+    assert json.loads(response.data)['count'] == 1
+
+def test_listings_filters(client, mock_listings):
+    """Test listing filters and sort are passed to the service layer."""
+    response = client.get(
+        '/api/marketplace/listings?asset_type=Real%20Estate&min_price_drops=1000&sort=newest'
+    )
+    assert response.status_code == 200
+    kwargs = mock_listings.call_args.kwargs
+    assert kwargs['filters']['asset_type'] == 'Real Estate'
+    assert kwargs['filters']['min_price_drops'] == 1000
+    assert kwargs['sort'] == 'newest'
+
+    response = client.get('/api/marketplace/listings?min_price_drops=cheap')
+    assert response.status_code == 400
+
+def test_search_listings(client):
+    """Test listing search validates input and paginates."""
+    response = client.get('/api/marketplace/search')
+    assert response.status_code == 400
+
+    with patch('backend.routes.marketplace_routes.search_listings') as mock_search:
+        mock_search.return_value = {"results": [], "total": 0, "page": 2, "per_page": 100}
+        response = client.get('/api/marketplace/search?q=paris%20apartment&page=2&per_page=500')
+        assert response.status_code == 200
+        args, kwargs = mock_search.call_args
+        assert args == ('paris apartment',)
+        assert kwargs['status'] == 'active'
+        assert kwargs['page'] == 2
+        assert kwargs['per_page'] == 100
+
+def test_server_timing(client, mock_listings):
+    """Test responses carry a Server-Timing breakdown of backend work."""
+    from backend.middleware.profiling import record
+    mock_listings.side_effect = lambda *args, **kwargs: record("mongo", 2.5) or []
+
+    response = client.get('/api/marketplace/listings')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert 'mongo;dur=2.50;desc="1 calls"' in timing
+    assert 'serialize;dur=' in timing
+    assert 'total;dur=' in timing
+
+def test_buy_template(client):
+    """Test buy templates pair a payment with a sell offer to the buyer."""
+    listing = {
+        "listing_id": "test-listing-id",
+        "nft_id": "test-nft-id",
+        "seller_address": "rSellerAddress123",
+        "price_drops": 100_000_000,
+        "status": "active"
+    }
+    with patch('backend.routes.marketplace_routes.get_listing_async', new_callable=AsyncMock) as mock_listing, \
+         patch('backend.routes.marketplace_routes.verify_nft_ownership_async', new_callable=AsyncMock) as mock_verify:
+        mock_listing.return_value = listing
+        mock_verify.return_value = True
+
+        response = client.post('/api/marketplace/buy/template/test-listing-id', json={'buyer_address': 'rBuyerAddress123'})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data['payment_template']['template']['amount'] == '100000000'
+        assert data['nft_offer_template']['template']['destination'] == 'rBuyerAddress123'
+        assert data['nft_offer_template']['template']['flags'] == 1
+
+        response = client.post('/api/marketplace/buy/template/test-listing-id', json={'buyer_address': 'rSellerAddress123'})
+        assert response.status_code == 400
+
+def test_event_stream(client):
+    """Test the stream replays events after Last-Event-ID and pushes new ones."""
+    from backend.services.event_stream import EventBroker
+    broker = EventBroker(buffer_size=10, client_buffer=10)
+    broker.publish("listing.created", {"listing_id": "listing-1"}, event_id="token-1")
+    broker.publish("listing.sold", {"listing_id": "listing-1"}, event_id="token-2")
+
+    with patch('backend.routes.marketplace_routes.change_watcher'), \
+         patch('backend.routes.marketplace_routes.broker', broker):
+        response = client.get('/api/marketplace/stream', headers={'Last-Event-ID': 'token-1'}, buffered=False)
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+        assert 'Content-Encoding' not in response.headers
+        frames = iter(response.response)
+        assert next(frames) == b"retry: 3000\n\n"
+        assert next(frames).startswith(b"id: token-2\nevent: listing.sold\n")
+
+        broker.publish("listing.created", {"listing_id": "listing-2"}, event_id="token-3")
+        assert b'"listing_id":"listing-2"' in next(frames)
+        response.close()
+    assert len(broker) == 0
+
+def test_saturated_streams_leave_request_threads(app, mock_listings):
+    """Test streams beyond the cap are refused so regular requests still get a thread."""
+    from backend.services.event_stream import EventBroker, stream_capacity
+    threads = 4
+    broker = EventBroker(max_clients=stream_capacity(threads, reserved=2))
+    release = threading.Event()
+
+    def hold_stream():
+        response = app.test_client().get('/api/marketplace/stream', buffered=False)
+        if response.status_code == 200:
+            next(iter(response.response))
+            release.wait(10)
+            response.close()
+        return response.status_code
+
+    with patch('backend.routes.marketplace_routes.change_watcher'), \
+         patch('backend.routes.marketplace_routes.broker', broker), \
+         ThreadPoolExecutor(threads) as worker:
+        streams = [worker.submit(hold_stream) for _ in range(threads)]
+        try:
+            # Two threads are held by streams, the other two are free again
+            listings = worker.submit(lambda: app.test_client().get('/api/marketplace/listings'))
+            assert listings.result(timeout=5).status_code == 200
+            assert len(broker) == 2
+        finally:
+            release.set()
+        assert sorted(stream.result() for stream in streams) == [200, 200, 503, 503]
+
+def test_listing_changes(client):
+    """Test the delta sync passes the token through and rejects bad limits."""
+    with patch('backend.routes.marketplace_routes.get_listing_changes') as mock_changes:
+        mock_changes.return_value = {
+            "changes": [{"listing_id": "test-listing-id", "status": "sold", "removed": True}],
+            "next": "1736467200000-000000000000000000000000",
+            "has_more": False
+        }
+        
+        response = client.get('/api/marketplace/listings/changes?since=1736380800000-000000000000000000000000&limit=50')
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data["changes"][0]["removed"] is True
+        mock_changes.assert_called_once_with(since="1736380800000-000000000000000000000000", limit=50)
+        
+        mock_changes.side_effect = ValueError("Invalid since token")
+        response = client.get('/api/marketplace/listings/changes?since=garbage')
+        assert response.status_code == 400
+        
+        response = client.get('/api/marketplace/listings/changes?limit=many')
+        assert response.status_code == 400
+
+def test_validate_purchase_records_sale_once(client):
+    """Test a purchase is only recorded by the request that marks the listing sold."""
+    with patch('backend.routes.marketplace_routes.get_listing_async', new_callable=AsyncMock) as mock_listing, \
+         patch('backend.routes.marketplace_routes.verify_nft_ownership_async', new_callable=AsyncMock) as mock_owner, \
+         patch('backend.routes.marketplace_routes.complete_listing_sale') as mock_complete:
+        mock_listing.return_value = {"nft_id": "test-nft-id", "price_drops": 100, "asset_type": "Real Estate"}
+        mock_owner.return_value = True
+        body = {"buyer_address": "rBuyer", "transaction_hash": "HASH1"}
+
+        mock_complete.return_value = True
+        response = client.post('/api/marketplace/listing/test-listing-id/validate-purchase', json=body)
+        assert response.status_code == 200
+        listing, buyer, transaction_hash = mock_complete.call_args[0]
+        assert listing["listing_id"] == "test-listing-id"
+        assert (buyer, transaction_hash) == ("rBuyer", "HASH1")
+
+        # Already sold, cancelled, or the transaction completed another listing
+        mock_complete.return_value = False
+        response = client.post('/api/marketplace/listing/test-listing-id/validate-purchase', json=body)
+        assert response.status_code == 409
@@ -0,0 +1,54 @@
+import os
+import pytest
+from app import create_app
+from unittest.mock import patch
+from services.cache import LRUCache
+
+@pytest.fixture
+def app():
+    """Create and configure a test Flask application."""
+    app = create_app('testing')
+    return app
+
+@pytest.fixture
+def client(app):
+    """Create a test client."""
+    return app.test_client()
+
+def test_metrics_endpoint(client):
+    """Test route latency and status counts are exposed for scraping."""
+    with patch('backend.routes.marketplace_routes.get_marketplace_stats') as mock_stats:
+        mock_stats.return_value = []
+        assert client.get('/api/marketplace/stats').status_code == 200
+
+    with patch.dict(os.environ, {'METRICS_API_TOKEN': 'secret'}):
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    body = response.get_data(as_text=True)
+    assert '# TYPE http_request_duration_seconds histogram' in body
+    assert 'http_requests_total{method="GET",route="/api/marketplace/stats",status="200"}' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/api/marketplace/stats",le="+Inf"}' in body
+    assert 'cache_requests_total{cache="metadata_by_hash",result="hit"}' in body
+
+def test_metrics_require_token(client):
+    """Test metrics are only served with the configured bearer token."""
+    with patch.dict(os.environ, {'METRICS_API_TOKEN': ''}):
+        assert client.get('/metrics').status_code == 404
+    with patch.dict(os.environ, {'METRICS_API_TOKEN': 'secret'}):
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer other'}).status_code == 401
+        response = client.get('/metrics', headers={'Authorization': 'Bearer secret'})
+        assert response.status_code == 200
+
+def test_lru_cache():
+    """Test the LRU cache counts hits and misses and evicts the oldest entry."""
+    cache = LRUCache("test_cache", maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+    assert (cache.hits, cache.misses) == (2, 1)
+    assert len(cache) == 2
@@ -12,4 +12,29 @@ def app():
 @pytest.fixture
 def client(app):
     """Create a test client."""
-    return app.test_client() 
\ No newline at end of file
+    return app.test_client() 
+
+def test_get_address_nfts_fields(client):
+    """Test sparse NFT fieldsets skip metadata resolution."""
+    with patch('backend.routes.transaction_routes.get_account_nfts_version') as mock_version, \
+         patch('backend.routes.transaction_routes.get_account_nfts') as mock_nfts, \
+         patch('backend.routes.transaction_routes.get_metadata_with_image') as mock_metadata:
+        mock_version.return_value = {"count": 1, "updated_at": None}
+        mock_nfts.return_value = [{"nft_id": "test-nft-id", "status": "minted"}]
+        
+        response = client.get('/api/transaction/nfts/rTestAddress123?fields=nft_id,status')
+        assert response.status_code == 200
+        assert json.loads(response.data)['nfts'] == [{"nft_id": "test-nft-id", "status": "minted"}]
+        mock_nfts.assert_called_once_with('rTestAddress123', fields=['nft_id', 'status'])
+        mock_metadata.assert_not_called()
+
+def test_mint_template_invalid_metadata(client):
+    """Test metadata not matching its asset type schema is rejected before being stored."""
+    with patch('backend.routes.transaction_routes.store_metadata') as mock_store:
+        response = client.post('/api/transaction/nft/mint/template', json={
+            "account": "rTestAddress123",
+            "metadata": {"title": "Test NFT", "asset_type": "Real Estate", "square_footage": "large"}
+        })
+        assert response.status_code == 400
+        assert "location" in json.loads(response.data)["error"]
+        mock_store.assert_not_called()
@@ -0,0 +1,107 @@
+from datetime import datetime
+from unittest.mock import patch
+from services.reconcile_service import (
+    LEDGER_POSITION_SCALE,
+    build_corrections,
+    parse_events,
+    reconcile_account
+)
+
+SELLER = "rPEPPER7kfTD9w2To4CQk6UCfuHM9c6GDY"
+BUYER = "rN7n7otQDd6FczFgLdSqtcsAUxDkw6fzRH"
+NFT_ID = "000800006203F49C21D5D6E022CB16DE3538F248662FC73C29ABA6A90000001A"
+
+def offer_node(offer_id, owner, flags, amount="25000000"):
+    """DeletedNode of an NFTokenOffer consumed by a transaction."""
+    return {"DeletedNode": {
+        "LedgerEntryType": "NFTokenOffer",
+        "LedgerIndex": offer_id,
+        "FinalFields": {"Owner": owner, "NFTokenID": NFT_ID, "Flags": flags, "Amount": amount}
+    }}
+
+def account_tx_entry(tx, nodes=(), ledger_index=100, result="tesSUCCESS"):
+    """account_tx entry as returned with API version 2."""
+    return {
+        "hash": f"HASH{ledger_index}",
+        "ledger_index": ledger_index,
+        "close_time_iso": "2025-01-10T12:00:00Z",
+        "tx_json": tx,
+        "meta": {"TransactionResult": result, "TransactionIndex": 7, "AffectedNodes": list(nodes)}
+    }
+
+def test_parse_accept_offer():
+    """Test accepted sell and buy offers give the new owner and the consumed offers."""
+    sell = account_tx_entry(
+        {"TransactionType": "NFTokenAcceptOffer", "Account": BUYER, "NFTokenSellOffer": "SELL1"},
+        [offer_node("SELL1", SELLER, 1)]
+    )
+    [event] = parse_events(sell)
+    assert event["type"] == "transfer"
+    assert (event["nft_id"], event["seller"], event["buyer"]) == (NFT_ID, SELLER, BUYER)
+    assert event["sell_offer_id"] == "SELL1"
+    assert event["price_drops"] == 25_000_000
+    assert event["position"] == 100 * LEDGER_POSITION_SCALE + 7
+    assert event["closed_at"] == datetime(2025, 1, 10, 12)
+
+    buy = account_tx_entry(
+        {"TransactionType": "NFTokenAcceptOffer", "Account": SELLER, "NFTokenBuyOffer": "BUY1"},
+        [offer_node("BUY1", BUYER, 0)]
+    )
+    [event] = parse_events(buy)
+    assert (event["seller"], event["buyer"], event["sell_offer_id"]) == (SELLER, BUYER, None)
+
+def test_parse_ignores_failed_and_unrelated():
+    """Test failed transactions and other transaction types give no events."""
+    failed = account_tx_entry({"TransactionType": "NFTokenBurn", "NFTokenID": NFT_ID}, result="tecNO_PERMISSION")
+    payment = account_tx_entry({"TransactionType": "Payment", "Account": BUYER})
+    assert parse_events(failed) == []
+    assert parse_events(payment) == []
+
+    [burn] = parse_events(account_tx_entry({"TransactionType": "NFTokenBurn", "NFTokenID": NFT_ID}))
+    assert burn["type"] == "burn"
+    [cancel] = parse_events(account_tx_entry({"TransactionType": "NFTokenCancelOffer", "NFTokenOffers": ["SELL1"]}))
+    assert cancel["offer_ids"] == ["SELL1"]
+
+def test_transfer_corrections_skip_newer_state():
+    """Test a transfer only applies to NFTs and listings older than the transaction."""
+    [event] = parse_events(account_tx_entry(
+        {"TransactionType": "NFTokenAcceptOffer", "Account": BUYER, "NFTokenSellOffer": "SELL1"},
+        [offer_node("SELL1", SELLER, 1)]
+    ))
+    operations = build_corrections([event], datetime(2025, 2, 1))
+    [nft] = operations["nfts"]
+    assert nft._filter["account"] == {"$ne": BUYER}
+    assert nft._filter["ledger_position"] == {"$not": {"$gte": event["position"]}}
+    sold, stale = operations["marketplace_listings"]
+    assert sold._filter["seller_address"] == SELLER
+    assert sold._filter["created_at"] == {"$lt": event["closed_at"]}
+    assert sold._doc["$set"]["status"] == "sold"
+    assert stale._doc["$set"]["status"] == "cancelled"
+    [offers] = operations["nft_offers"]
+    assert offers._filter["offer_id"] == {"$in": ["SELL1"]}
+
+def test_reconcile_account_resumes_from_checkpoint():
+    """Test pages are corrected before the checkpoint moves and a marker is resumed."""
+    saved = []
+    pages = [
+        {"transactions": [account_tx_entry({"TransactionType": "NFTokenBurn", "NFTokenID": NFT_ID})],
+         "marker": {"ledger": 100, "seq": 7}, "ledger_index_max": 250},
+        {"transactions": [], "ledger_index_max": 250}
+    ]
+    with patch('services.reconcile_service.load_checkpoint') as mock_load, \
+         patch('services.reconcile_service.save_checkpoint', side_effect=lambda account, checkpoint: saved.append(checkpoint)), \
+         patch('services.reconcile_service.fetch_account_tx', side_effect=pages) as mock_fetch, \
+         patch('services.reconcile_service.apply_corrections', return_value={"nfts": 1}) as mock_apply:
+        mock_load.return_value = {"ledger_index": 90, "marker": None, "target": None}
+
+        counts = reconcile_account(SELLER)
+        assert counts == {"nfts": 1, "pages": 2, "transactions": 1}
+        assert mock_fetch.call_args_list[0].args == (SELLER, 91, -1)
+        # The next page keeps the range the marker was returned for
+        assert mock_fetch.call_args_list[1].args == (SELLER, 91, 250)
+        assert mock_fetch.call_args_list[1].kwargs["marker"] == {"ledger": 100, "seq": 7}
+        assert saved == [
+            {"ledger_index": 90, "marker": {"ledger": 100, "seq": 7}, "target": 250},
+            {"ledger_index": 250, "marker": None, "target": None}
+        ]
+        assert mock_apply.call_count == 1
@@ -1,14 +1,47 @@
 import pytest
-from unittest.mock import patch, MagicMock
+import asyncio
+import json
+import re
+from datetime import datetime
+from bson import ObjectId
+from unittest.mock import patch, MagicMock, AsyncMock
 from services.xrpl_service import (
     verify_nft_ownership,
-    submit_signed_transaction
+    verify_nft_ownership_async,
+    verify_xrpl_transaction
 )
 from services.mongodb_service import (
     create_listing,
     get_active_listings,
     get_listing,
-    get_account_nfts
+    get_account_nfts,
+    build_listing_query,
+    search_listings,
+    get_listing_changes,
+    get_account_nft_changes,
+    encode_change_token,
+    decode_change_token,
+    compute_metadata_hash,
+    encode_metadata_document,
+    compress_metadata_documents,
+    get_listing_snapshot,
+    get_metadata_json_by_hash,
+    load_metadata,
+    complete_listing_sale,
+    mark_listing_sold,
+    record_purchase_transaction,
+    verify_metadata_document
+)
+from services.metadata_schema_service import InvalidMetadata, validate_metadata
+from services.stats_service import get_marketplace_stats, rebuild_stats
+from services.price_history_service import (
+    compute_ohlc,
+    _compute_ohlc_python,
+    parse_interval,
+    PRICE_HISTORY_COLLECTION,
+    backfill_price_history,
+    record_sale_price,
+    timeseries_available
 )
 
 def test_verify_nft_ownership():
@@ -25,24 +58,38 @@ def test_verify_nft_ownership():
         result = verify_nft_ownership(test_address, test_nft_id)
         assert result is True
 
-def test_submit_signed_transaction():
-    """Test transaction submission."""
-    test_tx = {
-        "tx_blob": "test_blob",
-        "hash": "test_hash"
-    }
+def test_verify_nft_ownership_async():
+    """Test async NFT ownership verification."""
+    test_address = "rTestAddress123"
+    test_nft_id = "test-nft-id"
+    
+    with patch('xrpl.asyncio.clients.async_client.AsyncClient.request', new_callable=AsyncMock) as mock_request:
+        mock_request.return_value = MagicMock()
+        mock_request.return_value.is_successful.return_value = True
+        mock_request.return_value.result = {
+            "account_nfts": [{"NFTokenID": test_nft_id}]
+        }
+        
+        assert asyncio.run(verify_nft_ownership_async(test_address, test_nft_id)) is True
+        assert asyncio.run(verify_nft_ownership_async(test_address, "other-nft-id")) is False
+
+def test_verify_xrpl_transaction():
+    """Test transaction verification checks type and result."""
+    test_hash = "test_hash"
     
     with patch('xrpl.clients.JsonRpcClient.request') as mock_request:
-        mock_request.return_value.status = "success"
+        mock_request.return_value.is_successful.return_value = True
         mock_request.return_value.result = {
-            "engine_result": "tesSUCCESS",
-            "tx_json": {"hash": "test_hash"}
+            "TransactionType": "NFTokenCreateOffer",
+            "meta": {"TransactionResult": "tesSUCCESS"}
         }
         
-        result = submit_signed_transaction(test_tx, "rTestAddress123")
-        assert result is not None
-        assert result['status'] == "success"
-        assert result['engine_result'] == "tesSUCCESS"
+        result = verify_xrpl_transaction(test_hash, expected_type="NFTokenCreateOffer")
+        assert result['success'] is True
+        assert result['transaction']['TransactionType'] == "NFTokenCreateOffer"
+        
+        result = verify_xrpl_transaction(test_hash, expected_type="NFTokenMint")
+        assert result['success'] is False
 
 # MongoDB Service Tests
 def test_create_listing():
@@ -88,7 +135,7 @@ def test_get_active_listings():
             "verified": True
         }
         
-        listings = get_active_listings()
+        listings = get_active_listings(include_metadata=True)
         assert listings is not None
         assert len(listings) == 1
         assert listings[0]['status'] == "active"
@@ -138,5 +185,390 @@ def test_get_nfts_by_address():
         assert nfts is not None
         assert len(nfts) == 1
         assert nfts[0]['account'] == test_address
-        assert nfts[0]['full_metadata'] == {"title": "Test NFT"}
-        assert nfts[0]['metadata_verified'] == True 
\ No newline at end of file
+        assert nfts[0]['metadata'] == {"title": "Test NFT", "metadata_hash": "test-hash"}
+        assert nfts[0]['metadata_verified'] == True 
+
+def test_get_listing_with_fields():
+    """Test sparse listing lookups skip the metadata lookup."""
+    test_id = "test-listing-id"
+    mock_listing = {
+        "nft_id": "test-nft-id",
+        "seller_address": "rTestAddress123"
+    }
+    
+    with patch('pymongo.collection.Collection.find_one') as mock_find_one, \
+         patch('services.mongodb_service.get_metadata_by_hash') as mock_get_metadata:
+        mock_find_one.return_value = mock_listing
+        
+        listing = get_listing(test_id, fields=["nft_id", "seller_address"])
+        assert listing == mock_listing
+        assert mock_find_one.call_args[0][1] == {"nft_id": 1, "seller_address": 1, "_id": 0}
+        mock_get_metadata.assert_not_called()
+
+def test_build_listing_query():
+    """Test listing filters are translated to an indexed query."""
+    query = build_listing_query({
+        "asset_type": "Real Estate",
+        "min_price_drops": 1_000_000,
+        "max_price_drops": 5_000_000,
+        "seller_address": None
+    })
+    assert query == {
+        "status": "active",
+        "asset_type": "Real Estate",
+        "price_drops": {"$gte": 1_000_000, "$lte": 5_000_000}
+    }
+
+def test_get_active_listings_sorted():
+    """Test listings are sorted server-side and bad sorts are rejected."""
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.return_value.sort.return_value = []
+        
+        listings = get_active_listings(fields=["listing_id"], sort="price")
+        assert listings == []
+        mock_find.return_value.sort.assert_called_once_with([("price_drops", 1)])
+        
+        with pytest.raises(ValueError):
+            get_active_listings(sort="random")
+
+def test_get_active_listings_without_metadata():
+    """Test the listings feed is served from listing summaries alone."""
+    mock_listings = [{
+        "listing_id": "test-listing-id",
+        "metadata_hash": "test-hash",
+        "summary": {"title": "Test NFT", "asset_type": "Real Estate"},
+        "status": "active"
+    }]
+    
+    with patch('pymongo.collection.Collection.find') as mock_find, \
+         patch('services.mongodb_service.get_metadata_by_hash') as mock_get_metadata:
+        mock_find.return_value = mock_listings
+        
+        listings = get_active_listings()
+        assert listings[0]['summary']['title'] == "Test NFT"
+        assert 'metadata' not in listings[0]
+        mock_get_metadata.assert_not_called()
+
+def test_search_listings():
+    """Test search is scoped by status and ranked by text score."""
+    with patch('pymongo.collection.Collection.find') as mock_find, \
+         patch('pymongo.collection.Collection.count_documents') as mock_count:
+        cursor = mock_find.return_value.sort.return_value.skip.return_value.limit.return_value
+        cursor.__iter__.return_value = iter([{"listing_id": "test-listing-id", "score": 1.5}])
+        mock_count.return_value = 1
+        
+        result = search_listings("paris", page=2, per_page=10)
+        query = mock_find.call_args[0][0]
+        assert query["status"] == "active"
+        assert query["$text"] == {"$search": "paris"}
+        mock_find.return_value.sort.return_value.skip.assert_called_once_with(10)
+        assert result["total"] == 1
+        assert result["results"][0]["listing_id"] == "test-listing-id"
+
+def test_get_marketplace_stats():
+    """Test stats combine the rollup with the hourly volume windows."""
+    from datetime import datetime, timedelta
+    now = datetime.utcnow()
+    rollups = [{
+        "asset_type": "Real Estate",
+        "active_count": 3,
+        "floor_price_drops": 5_000_000,
+        "last_sale": None
+    }]
+    buckets = [
+        {"asset_type": "Real Estate", "hour": now - timedelta(hours=2), "volume_drops": 10, "sales": 1},
+        {"asset_type": "Real Estate", "hour": now - timedelta(days=3), "volume_drops": 20, "sales": 2}
+    ]
+    
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.side_effect = [rollups, buckets]
+        
+        stats = get_marketplace_stats()
+        assert len(stats) == 1
+        assert stats[0]['active_count'] == 3
+        assert stats[0]['floor_price_drops'] == 5_000_000
+        assert stats[0]['volume_drops_24h'] == 10
+        assert stats[0]['volume_drops_7d'] == 30
+        assert stats[0]['sales_7d'] == 3
+
+def test_rebuild_stats_replaces_in_place():
+    """Test rebuilds upsert each rollup and bucket and only delete stale ones."""
+    hour = datetime(2025, 1, 10, 12)
+    rows = [
+        {"_id": "Art", "active_count": 2, "floor_price_drops": 5, "kind": "listings"},
+        {"_id": {"asset_type": "Art", "hour": hour}, "volume_drops": 10, "sales": 1, "kind": "volume"}
+    ]
+    existing = [
+        {"_id": "kept", "asset_type": "Art", "hour": hour},
+        {"_id": "stale", "asset_type": "Art", "hour": datetime(2025, 1, 9)}
+    ]
+    with patch('pymongo.collection.Collection.aggregate', return_value=rows), \
+         patch('pymongo.collection.Collection.find', return_value=existing), \
+         patch('pymongo.collection.Collection.bulk_write') as mock_bulk, \
+         patch('pymongo.collection.Collection.delete_many') as mock_delete, \
+         patch('pymongo.collection.Collection.insert_many') as mock_insert:
+        assert rebuild_stats() == {"asset_types": 1, "buckets": 1}
+        mock_delete.assert_not_called()
+        mock_insert.assert_not_called()
+        rollup_ops, bucket_ops = (call.args[0] for call in mock_bulk.call_args_list)
+        assert rollup_ops[0]._filter == {"asset_type": "Art"}
+        assert rollup_ops[0]._doc["active_count"] == 2
+        assert rollup_ops[-1]._filter == {"asset_type": {"$nin": ["Art"]}}
+        assert [op._filter for op in bucket_ops] == [{"asset_type": "Art", "hour": hour}, {"_id": "stale"}]
+
+def test_price_history_collection_not_created_on_request():
+    """Test sales and candles only look the time series up, again once the recheck interval has passed."""
+    db = MagicMock()
+    db.list_collection_names.return_value = []
+    sale = {"created_at": datetime(2025, 1, 10), "nft_id": "test-nft-id", "price_drops": 100}
+    with patch('services.price_history_service.get_db', return_value=db), \
+         patch('services.price_history_service._timeseries_available', None), \
+         patch('services.price_history_service.TIMESERIES_RECHECK_SECONDS', 60):
+        record_sale_price(sale)
+        assert not timeseries_available()
+        db.list_collection_names.assert_called_once()
+        db.create_collection.assert_not_called()
+        db.__getitem__.return_value.insert_one.assert_not_called()
+
+        # Created by flask db indexes while the process was running
+        db.list_collection_names.return_value = [PRICE_HISTORY_COLLECTION]
+        with patch('services.price_history_service.TIMESERIES_RECHECK_SECONDS', 0):
+            record_sale_price(sale)
+        db.__getitem__.return_value.insert_one.assert_called_once()
+
+def test_backfill_price_history_copies_missing_sales():
+    """Test the backfill keeps the collection and only copies sales it does not have."""
+    db = MagicMock()
+    recorded = {"created_at": datetime(2025, 1, 10), "nft_id": "test-nft-id", "price_drops": 100}
+    missed = {"created_at": datetime(2025, 1, 11), "nft_id": "test-nft-id", "price_drops": 120}
+    db.nft_transactions.find.return_value.sort.return_value.batch_size.return_value = [recorded, missed]
+    history = db.__getitem__.return_value
+    history.find.return_value = [{"ts": recorded["created_at"], "meta": {"nft_id": "test-nft-id"}, "price_drops": 100}]
+    with patch('services.price_history_service.get_db', return_value=db), \
+         patch('services.price_history_service._timeseries_available', None):
+        assert backfill_price_history() == 1
+        [copied] = history.insert_many.call_args[0][0]
+        assert (copied["ts"], copied["price_drops"]) == (missed["created_at"], 120)
+        history.drop.assert_not_called()
+        history.delete_many.assert_not_called()
+
+def test_compute_ohlc():
+    """Test in-memory candles match the pure Python implementation."""
+    hour = parse_interval("1h")
+    timestamps = [3 * hour + 10, hour + 5, hour + 1, 3 * hour + 20, hour + 900]
+    prices = [40, 20, 10, 30, 15]
+    
+    candles = compute_ohlc(timestamps, prices, hour)
+    assert candles == _compute_ohlc_python(timestamps, prices, hour)
+    assert [(c['open'], c['high'], c['low'], c['close'], c['trades']) for c in candles] == [
+        (10, 20, 10, 15, 3),
+        (40, 40, 30, 30, 2)
+    ]
+    assert candles[0]['volume_drops'] == 45
+    
+    with pytest.raises(ValueError):
+        parse_interval("5s")
+
+def test_change_token_roundtrip():
+    """Test sync tokens encode a millisecond position and reject garbage."""
+    document_id = ObjectId()
+    token = encode_change_token(datetime(2025, 1, 10, 12, 0, 0, 123000), document_id)
+    assert decode_change_token(token) == (datetime(2025, 1, 10, 12, 0, 0, 123000), document_id)
+    
+    with pytest.raises(ValueError):
+        decode_change_token("not-a-token")
+
+def test_get_listing_changes():
+    """Test listing changes page after the token and tombstone closed listings."""
+    updated_at = datetime(2025, 1, 10)
+    since = encode_change_token(updated_at, ObjectId())
+    listings = [
+        {"_id": ObjectId(), "listing_id": "listing-1", "status": "active", "price_drops": 1, "updated_at": updated_at},
+        {"_id": ObjectId(), "listing_id": "listing-2", "status": "sold", "price_drops": 2, "updated_at": updated_at},
+        {"_id": ObjectId(), "listing_id": "listing-3", "status": "active", "price_drops": 3, "updated_at": updated_at}
+    ]
+    last_id = listings[1]["_id"]
+    
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.return_value.sort.return_value.limit.return_value = listings
+        
+        result = get_listing_changes(since=since, limit=2)
+        query = mock_find.call_args[0][0]
+        assert "$or" in query["$and"][1]["$and"][1]
+        mock_find.return_value.sort.assert_called_once_with([("updated_at", 1), ("_id", 1)])
+        mock_find.return_value.sort.return_value.limit.assert_called_once_with(3)
+        
+        assert result["has_more"] is True
+        assert result["changes"][0]["price_drops"] == 1
+        assert result["changes"][1] == {
+            "listing_id": "listing-2",
+            "status": "sold",
+            "updated_at": updated_at,
+            "removed": True
+        }
+        assert decode_change_token(result["next"]) == (updated_at, last_id)
+        
+        with pytest.raises(ValueError):
+            get_listing_changes(since="garbage")
+
+def test_get_listing_changes_empty():
+    """Test an empty page still moves the token forward."""
+    since = encode_change_token(datetime(2025, 1, 10), ObjectId())
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.return_value.sort.return_value.limit.return_value = []
+        
+        result = get_listing_changes(since=since)
+        assert result["changes"] == []
+        assert result["has_more"] is False
+        assert decode_change_token(result["next"])[0] > datetime(2025, 1, 10)
+
+def test_get_account_nft_changes():
+    """Test NFTs transferred away are returned as tombstones."""
+    updated_at = datetime(2025, 1, 10)
+    nfts = [
+        {"_id": ObjectId(), "nft_id": "nft-1", "account": "rOwner", "updated_at": updated_at},
+        {"_id": ObjectId(), "nft_id": "nft-2", "account": "rBuyer", "updated_at": updated_at}
+    ]
+    
+    with patch('pymongo.collection.Collection.find') as mock_find:
+        mock_find.return_value.sort.return_value.limit.return_value = nfts
+        
+        result = get_account_nft_changes("rOwner")
+        query = mock_find.call_args[0][0]
+        assert query["$and"][0] == {"$or": [{"account": "rOwner"}, {"former_accounts": "rOwner"}]}
+        assert result["changes"][0]["account"] == "rOwner"
+        assert result["changes"][1] == {"nft_id": "nft-2", "updated_at": updated_at, "removed": True}
+        assert result["has_more"] is False
+
+def test_metadata_document_roundtrip():
+    """Test metadata is stored as canonical bytes, compressed when large."""
+    small = {"title": "Test NFT", "asset_type": "Real Estate"}
+    large = {**small, "legal_text": "renovated apartment with a view " * 200}
+    
+    small_doc = encode_metadata_document(small)
+    assert small_doc["encoding"] == "identity"
+    assert small_doc["metadata_hash"] == compute_metadata_hash(small)
+    
+    large_doc = encode_metadata_document(large)
+    assert large_doc["encoding"] == "zlib"
+    assert len(large_doc["canonical"]) < large_doc["size"] / 10
+    # Listing and query fields stay readable without decompressing
+    assert large_doc["metadata"] == small
+    
+    for metadata, document in ((small, small_doc), (large, large_doc)):
+        assert load_metadata(document) == metadata
+        assert verify_metadata_document(document)
+    
+    # Documents stored before canonical bytes still verify
+    assert verify_metadata_document({"metadata_hash": compute_metadata_hash(small), "metadata": small})
+    tampered = encode_metadata_document({**small, "title": "Other NFT"})
+    assert not verify_metadata_document({**tampered, "metadata_hash": small_doc["metadata_hash"]})
+
+def test_listing_snapshot_reads_decoded_fields():
+    """Test listing snapshots project the decoded fields, decoding canonical bytes only for older documents."""
+    metadata = {"title": "Test NFT", "asset_type": "Real Estate", "description": "Loft", "legal_text": "x" * 4096}
+    document = encode_metadata_document(metadata)
+    with patch('pymongo.collection.Collection.find_one') as mock_find_one:
+        mock_find_one.return_value = {"metadata": document["metadata"]}
+        snapshot = get_listing_snapshot(document["metadata_hash"])
+        assert snapshot["summary"]["title"] == "Test NFT"
+        assert snapshot["search_text"] == "Loft"
+        assert mock_find_one.call_count == 1
+        assert "canonical" not in mock_find_one.call_args[0][1]
+
+        mock_find_one.side_effect = [{}, {"canonical": document["canonical"], "encoding": document["encoding"]}]
+        assert get_listing_snapshot(document["metadata_hash"]) == snapshot
+
+def test_compress_metadata_keeps_decoded_fields():
+    """Test the migration adds canonical bytes without removing decoded metadata."""
+    metadata = {"title": "Test NFT", "asset_type": "Real Estate", "legal_text": "x" * 4096}
+    document = encode_metadata_document(metadata)
+    legacy = {"_id": 1, "metadata_hash": document["metadata_hash"], "metadata": metadata}
+    canonical_only = {"_id": 2, "metadata_hash": document["metadata_hash"],
+                      "canonical": document["canonical"], "encoding": document["encoding"]}
+    with patch('pymongo.collection.Collection.find') as mock_find, \
+         patch('pymongo.collection.Collection.update_one') as mock_update:
+        mock_find.return_value.batch_size.return_value = [legacy, canonical_only]
+        assert compress_metadata_documents() == {"updated": 2, "mismatched": 0}
+        (_, converted), (_, restored) = [call[0] for call in mock_update.call_args_list]
+        assert "$unset" not in converted
+        assert converted["$set"]["canonical"] == document["canonical"]
+        assert "metadata" not in converted["$set"]
+        assert restored == {"$set": {"metadata": document["metadata"]}}
+
+def test_get_metadata_json_by_hash():
+    """Test the canonical bytes are embedded in the response as stored."""
+    metadata = {"title": "Test NFT", "description": "x" * 4096}
+    document = encode_metadata_document(metadata)
+    with patch('pymongo.collection.Collection.find_one') as mock_find_one:
+        mock_find_one.return_value = document
+        
+        body = json.loads(get_metadata_json_by_hash(document["metadata_hash"]))
+        assert body == {"metadata": metadata, "metadata_hash": document["metadata_hash"], "verified": True}
+        
+        mock_find_one.return_value = {**document, "metadata_hash": "0" * 16}
+        with pytest.raises(ValueError):
+            get_metadata_json_by_hash("0" * 16)
+
+def test_validate_metadata():
+    """Test metadata is checked against the schema of its asset type."""
+    real_estate = {"title": "Test NFT", "asset_type": "Real Estate", "location": "Test location"}
+    validate_metadata(real_estate)
+    # Unknown asset types only need the shared fields
+    validate_metadata({"title": "Test NFT", "asset_type": "Wine"})
+    # Metadata minted before asset types and titles existed
+    validate_metadata({"description": "Test description"})
+    validate_metadata({"asset_type": "Fine Art", "artist": "Unknown"})
+    validate_metadata({
+        "title": "Test NFT",
+        "asset_type": "Vehicles",
+        "vin": "1HGCM82633A004352",
+        "features": ["sunroof"]
+    })
+    
+    invalid = [
+        ({**real_estate, "location": None}, "data.location must be string"),
+        ({"title": "Test NFT", "asset_type": "Real Estate"}, "must contain ['location']"),
+        ({"title": "Test NFT", "asset_type": "Vehicles", "vin": "1HGCM82633A00435O"}, "data.vin must match"),
+        ({"title": "Test NFT", "asset_type": ["Real Estate"]}, "data.asset_type must be string"),
+        ({"asset_type": "Fine Art"}, "must contain ['artist']"),
+        ({"title": ""}, "data.title must be longer than or equal to 1 characters"),
+        ("Test NFT", "data must be object")
+    ]
+    for metadata, message in invalid:
+        with pytest.raises(InvalidMetadata, match=re.escape(message)):
+            validate_metadata(metadata)
+
+def test_purchase_recorded_once():
+    """Test a listing is sold once and a transaction hash counted once."""
+    with patch('pymongo.collection.Collection.find_one_and_update') as mock_update, \
+         patch('services.mongodb_service.stats_service') as mock_stats:
+        mock_update.return_value = None
+        assert mark_listing_sold("test-listing-id", "rBuyer", "HASH1") is None
+        assert mock_update.call_args[0][0] == {"listing_id": "test-listing-id", "status": "active"}
+        mock_stats.record_listing_closed.assert_not_called()
+
+    existing = {"transaction_hash": "HASH1", "transaction_type": "purchase", "price_drops": 100}
+    with patch('pymongo.collection.Collection.find_one', return_value=existing), \
+         patch('services.mongodb_service.write_behind') as mock_buffer, \
+         patch('services.mongodb_service.stats_service') as mock_stats:
+        assert record_purchase_transaction("test-nft-id", "rBuyer", 100, "HASH1") == existing
+        mock_buffer.add.assert_not_called()
+        mock_stats.record_sale.assert_not_called()
+
+def test_complete_listing_sale_order():
+    """Test the sale is only recorded after the listing status update succeeded."""
+    listing = {"listing_id": "test-listing-id", "nft_id": "test-nft-id", "price_drops": 100}
+    with patch('services.mongodb_service.mark_listing_sold') as mock_sold, \
+         patch('services.mongodb_service.record_purchase_transaction') as mock_record:
+        mock_sold.side_effect = ValueError("Failed to mark listing sold")
+        with pytest.raises(ValueError):
+            complete_listing_sale(listing, "rBuyer", "HASH1")
+        mock_sold.side_effect = None
+        mock_sold.return_value = None
+        assert complete_listing_sale(listing, "rBuyer", "HASH1") is False
+        mock_record.assert_not_called()
+
+        mock_sold.return_value = {**listing, "status": "active"}
+        assert complete_listing_sale(listing, "rBuyer", "HASH1") is True
+        mock_record.assert_called_once()
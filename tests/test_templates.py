@@ -0,0 +1,56 @@
+import pytest
+
+hypothesis = pytest.importorskip("hypothesis")
+from hypothesis import given, strategies as st
+
+# The model path imports xrpl-py on first use; load it up front so the
+# first example does not pay for the import
+import xrpl.models.transactions  # noqa: F401
+
+from services.xrpl_service import (
+    generate_nft_mint_template,
+    create_payment_template,
+    create_nft_offer_template,
+    MAX_TRANSFER_FEE,
+    MAX_URI_LENGTH
+)
+
+# Classic addresses and hex NFT IDs; the models only check them as strings
+addresses = st.text(alphabet="rpshnaf39wBUDNEGHJKLM4PQRST7VWXYZ2bcdeCg65jkm8oFqi1tuvAxyz", min_size=25, max_size=35)
+nft_ids = st.text(alphabet="0123456789ABCDEF", min_size=64, max_size=64)
+uris = st.text(alphabet=st.characters(min_codepoint=32, max_codepoint=126), max_size=MAX_URI_LENGTH)
+
+def assert_same_template(fast, model):
+    """Templates must match, including key order in the serialized JSON."""
+    assert fast == model
+    assert list(fast["template"].items()) == list(model["template"].items())
+
+@given(
+    account=addresses,
+    uri=uris,
+    flags=st.integers(min_value=0, max_value=15),
+    transfer_fee=st.integers(min_value=0, max_value=MAX_TRANSFER_FEE),
+    taxon=st.integers(min_value=0, max_value=2**32 - 1)
+)
+def test_mint_template_fast_path(account, uri, flags, transfer_fee, taxon):
+    """Test the fast mint template matches the xrpl-py model output."""
+    args = (account, uri, flags, transfer_fee, taxon)
+    assert_same_template(generate_nft_mint_template(*args, validated=True), generate_nft_mint_template(*args))
+
+@given(
+    account=addresses,
+    destination=addresses,
+    amount_drops=st.integers(min_value=1, max_value=10**17)
+)
+def test_payment_template_fast_path(account, destination, amount_drops):
+    """Test the fast payment template matches the xrpl-py model output."""
+    hypothesis.assume(account != destination)
+    args = (account, destination, amount_drops)
+    assert_same_template(create_payment_template(*args, validated=True), create_payment_template(*args))
+
+@given(account=addresses, destination=addresses, nft_id=nft_ids)
+def test_offer_template_fast_path(account, destination, nft_id):
+    """Test the fast sell offer template matches the xrpl-py model output."""
+    hypothesis.assume(account != destination)
+    args = (account, destination, nft_id)
+    assert_same_template(create_nft_offer_template(*args, validated=True), create_nft_offer_template(*args))
@@ -0,0 +1,154 @@
+import glob
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+from unittest.mock import patch, MagicMock
+from pymongo.errors import AutoReconnect, BulkWriteError
+from services.write_behind import WriteBehindBuffer
+
+def test_flush_on_batch_size(tmp_path):
+    """Test a full batch is written with one insert_many without waiting for the interval."""
+    db = MagicMock()
+    flushed = threading.Event()
+    db.__getitem__.return_value.insert_many.side_effect = lambda documents, ordered: flushed.set()
+    buffer = WriteBehindBuffer(max_batch=3, flush_interval=60, spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        for n in range(3):
+            buffer.add("nft_offers", {"offer_id": f"offer-{n}"})
+        assert flushed.wait(5)
+        documents = db.__getitem__.return_value.insert_many.call_args[0][0]
+        assert [document["offer_id"] for document in documents] == ["offer-0", "offer-1", "offer-2"]
+        assert all("_id" in document for document in documents)
+        assert buffer.pending == 0
+        buffer.close()
+
+def test_close_flushes_pending(tmp_path):
+    """Test documents still buffered on shutdown are written."""
+    db = MagicMock()
+    buffer = WriteBehindBuffer(max_batch=100, flush_interval=60, spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        buffer.add("nft_transactions", {"transaction_id": "transaction-1"})
+        db.__getitem__.return_value.insert_many.assert_not_called()
+        buffer.close()
+    db.__getitem__.assert_called_with("nft_transactions")
+    assert db.__getitem__.return_value.insert_many.call_count == 1
+
+def test_failed_flush_is_spooled_and_replayed(tmp_path):
+    """Test unwritten batches survive in the spool and are not written twice."""
+    db = MagicMock()
+    insert_many = db.__getitem__.return_value.insert_many
+    buffer = WriteBehindBuffer(max_batch=100, flush_interval=60, spool_dir=str(tmp_path))
+    created_at = datetime(2025, 1, 10, 12, 30)
+    with patch('services.write_behind.get_db', return_value=db):
+        buffer._start = lambda: None
+        buffer.add("nft_offers", {"offer_id": "offer-1", "created_at": created_at})
+        buffer.add("nft_offers", {"offer_id": "offer-2", "created_at": created_at})
+
+        insert_many.side_effect = AutoReconnect("connection refused")
+        assert buffer.flush() == 0
+        assert len(os.listdir(tmp_path)) == 1
+
+        # offer-1 was written before the connection dropped
+        insert_many.side_effect = BulkWriteError({
+            "nInserted": 1,
+            "writeErrors": [{"index": 0, "code": 11000, "errmsg": "duplicate key"}]
+        })
+        assert buffer.replay_spool() == 1
+        assert os.listdir(tmp_path) == []
+        replayed = insert_many.call_args[0][0]
+        assert [document["offer_id"] for document in replayed] == ["offer-1", "offer-2"]
+        assert replayed[0]["created_at"] == created_at
+
+def test_disabled_buffer_inserts_immediately(tmp_path):
+    """Test WRITE_BEHIND=0 keeps the synchronous insert."""
+    db = MagicMock()
+    buffer = WriteBehindBuffer(spool_dir=str(tmp_path), enabled=False)
+    with patch('services.write_behind.get_db', return_value=db):
+        buffer.add("nft_offers", {"offer_id": "offer-1"})
+    db.__getitem__.return_value.insert_one.assert_called_once()
+
+def test_replay_skips_torn_lines(tmp_path):
+    """Test a line cut short by a crash is skipped and the following spool files are replayed."""
+    db = MagicMock()
+    insert_many = db.__getitem__.return_value.insert_many
+    (tmp_path / "write-behind-1.ndjson").write_bytes(
+        b'{"collection": "nft_offers", "document": {"offer_id": "offer-1"}}\n'
+        b'{"collection": "nft_offers", "docu'
+    )
+    (tmp_path / "write-behind-2.ndjson").write_bytes(
+        b'{"collection": "nft_offers", "document": {"offer_id": "offer-2"}}\n'
+    )
+    buffer = WriteBehindBuffer(spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        assert buffer.replay_spool() == 2
+    offers = sorted(call[0][0][0]["offer_id"] for call in insert_many.call_args_list)
+    assert offers == ["offer-1", "offer-2"]
+    assert os.listdir(tmp_path) == []
+
+def test_replay_leaves_files_claimed_by_live_workers(tmp_path):
+    """Test only claimed files whose worker is gone or whose claim is stale are replayed."""
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    line = b'{"collection": "nft_offers", "document": {"offer_id": "offer-1"}}\n'
+    claimed = tmp_path / f"replay-{os.getppid()}-claimed.replay"
+    stale = tmp_path / f"replay-{os.getppid()}-stale.replay"
+    orphaned = tmp_path / f"replay-{finished.pid}-orphaned.replay"
+    for path in (claimed, stale, orphaned):
+        path.write_bytes(line)
+    os.utime(stale, (time.time() - 3600, time.time() - 3600))
+
+    db = MagicMock()
+    buffer = WriteBehindBuffer(spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        assert buffer.replay_spool() == 2
+    assert os.listdir(tmp_path) == [claimed.name]
+
+def test_spool_files_are_renamed_when_complete(tmp_path):
+    """Test only complete spool files are replayed, partial ones once their worker is gone."""
+    finished = subprocess.Popen([sys.executable, "-c", "pass"])
+    finished.wait()
+    line = b'{"collection": "nft_offers", "document": {"offer_id": "offer-1"}}\n'
+    writing = tmp_path / f"write-behind-{os.getppid()}-writing.tmp"
+    crashed = tmp_path / f"write-behind-{finished.pid}-crashed.tmp"
+    writing.write_bytes(line)
+    crashed.write_bytes(line + b'{"collection": "nft_off')
+
+    db = MagicMock()
+    buffer = WriteBehindBuffer(spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        buffer._spool("nft_offers", [{"offer_id": "offer-2"}])
+        [spooled] = [name for name in os.listdir(tmp_path) if name.endswith(".ndjson")]
+        assert spooled.startswith(f"write-behind-{os.getpid()}-")
+        assert buffer.replay_spool() == 2
+    assert os.listdir(tmp_path) == [writing.name]
+
+def test_rejected_documents_are_dead_lettered(tmp_path):
+    """Test documents the server keeps rejecting leave the spool after max_attempts."""
+    db = MagicMock()
+    insert_many = db.__getitem__.return_value.insert_many
+    insert_many.side_effect = BulkWriteError({
+        "nInserted": 1,
+        "writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]
+    })
+    buffer = WriteBehindBuffer(flush_interval=60, max_attempts=2, spool_dir=str(tmp_path))
+    with patch('services.write_behind.get_db', return_value=db):
+        buffer._start = lambda: None
+        buffer.add("nft_offers", {"offer_id": "offer-1"})
+        buffer.add("nft_offers", {"offer_id": "offer-2"})
+        assert buffer.flush() == 1
+        assert len(glob.glob(str(tmp_path / "*.ndjson"))) == 1
+
+        insert_many.side_effect = BulkWriteError({
+            "nInserted": 0,
+            "writeErrors": [{"index": 0, "code": 121, "errmsg": "Document failed validation"}]
+        })
+        buffer.replay_spool()
+        assert glob.glob(str(tmp_path / "*.ndjson")) == []
+        dead_letter = (tmp_path / "dead-letter" / "nft_offers.ndjson").read_text()
+        assert '"offer_id": "offer-1"' in dead_letter
+
+        buffer.replay_spool()
+        assert insert_many.call_count == 2
@@ -0,0 +1,11 @@
+"""WSGI entry point for production servers
+
+Creates the application once at import, so a pre-forking server such as
+gunicorn with preload_app shares the loaded code between its workers.
+
+Usage:
+    gunicorn -c backend/gunicorn.conf.py
+"""
+from backend.app import create_app
+
+app = create_app()